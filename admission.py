@@ -0,0 +1,176 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now if now is not None else time.monotonic()
+
+    def consume(self, now, amount=1):
+        """Take `amount` tokens if available"""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class RateLimiter:
+    """Keyed token buckets (one per user id or client IP).
+
+    At most `max_keys` buckets are kept: refilled ones go first, then the
+    least recently used.
+    """
+
+    def __init__(self, per_minute, burst, max_keys=10000, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Return True if `key` may proceed now"""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = self.clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict(now)
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.consume(now)
+
+    def _evict(self, now):
+        # A bucket that has refilled completely carries no state worth keeping
+        idle = [key for key, bucket in self._buckets.items() if bucket.is_full(now)]
+        for key in idle:
+            del self._buckets[key]
+        # A burst of distinct keys: forget the least recently seen
+        while len(self._buckets) >= self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+class AdmissionController:
+    """Global cap on in-flight LLM generations with a bounded wait queue.
+
+    Callers ask for a slot before talking to Ollama. When every slot is busy
+    they queue, but only up to `max_queue` waiters and `max_wait` seconds;
+    past that the request is shed so the caller can answer immediately with
+    a degraded reply instead of piling more work onto an overloaded model.
+    """
+
+    def __init__(self, max_inflight, max_queue, max_wait):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self.inflight = 0
+        self.queued = 0
+        self.counters = {
+            "admitted": 0,
+            "shed_queue_full": 0,
+            "shed_timeout": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def acquire(self):
+        """Wait for a generation slot; False means the request was shed"""
+        start = time.monotonic()
+        with self._cond:
+            if self.inflight < self.max_inflight and not self.queued:
+                self.inflight += 1
+                self.counters["admitted"] += 1
+                return True
+
+            if self.queued >= self.max_queue:
+                self.counters["shed_queue_full"] += 1
+                return False
+
+            self.queued += 1
+            try:
+                deadline = start + self.max_wait
+                while self.inflight >= self.max_inflight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["shed_timeout"] += 1
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self.queued -= 1
+
+            self.inflight += 1
+            self.counters["admitted"] += 1
+            waited = time.monotonic() - start
+            self.counters["wait_seconds_total"] += waited
+            self.counters["wait_seconds_max"] = max(self.counters["wait_seconds_max"], waited)
+            return True
+
+    def release(self):
+        """Return a slot taken by acquire()"""
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters)
+            stats["inflight"] = self.inflight
+            stats["queued"] = self.queued
+            stats["max_inflight"] = self.max_inflight
+            return stats
+
+class AdmissionGate:
+    """Per-user and per-IP rate limits in front of the global admission controller"""
+
+    def __init__(self, config=Config):
+        self.user_limiter = RateLimiter(config.RATE_LIMIT_USER_PER_MINUTE, config.RATE_LIMIT_USER_BURST)
+        self.ip_limiter = RateLimiter(config.RATE_LIMIT_IP_PER_MINUTE, config.RATE_LIMIT_IP_BURST)
+        self.controller = AdmissionController(
+            config.MAX_INFLIGHT_GENERATIONS,
+            config.MAX_QUEUED_GENERATIONS,
+            config.MAX_QUEUE_WAIT
+        )
+        self._lock = threading.Lock()
+        self.counters = {"rate_limited_user": 0, "rate_limited_ip": 0}
+
+    def check_rate(self, user_id, ip):
+        """Return None if allowed, otherwise which limit was hit"""
+        if ip and not self.ip_limiter.allow(ip):
+            reason = "rate_limited_ip"
+        elif not self.user_limiter.allow(user_id):
+            reason = "rate_limited_user"
+        else:
+            return None
+        with self._lock:
+            self.counters[reason] += 1
+        logger.warning(f"Shedding message from {user_id} ({ip}): {reason}")
+        return reason
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats.update(self.controller.stats())
+        return stats
@@ -1,34 +1,123 @@
 import os
-import streamlit as st
+import functools
+import hmac
+import inspect
+import itertools
 import logging
-from flask import Flask, render_template, request, jsonify, session
+import time
+from flask import Blueprint, Flask, Response, current_app, g, render_template, request, jsonify, session, stream_with_context
+from flask.sessions import SecureCookieSessionInterface
 from flask_socketio import SocketIO, emit
 import ollama
+import httpx
 import json
 import uuid
 import random
-from datetime import datetime, timedelta
+from datetime import timedelta
 from config import Config
-from database import MemoryManager as DatabaseManager
-from emotion_engine import EmotionEngine
-from memory_manager import MemoryManager as ChatMemoryManager
+from circuit_breaker import CircuitOpenError
+from batch_chat import BatchError, parse_ndjson
+from database import decode_cursor
+from reply_cache import valid_message_id
+from services import ChatServices
+from wire_protocol import MeasuredJSON, WireProtocol, wire_stats
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret-key-change-in-production")
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)  # Long-term sessions
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+chat_bp = Blueprint('chat', __name__)
+# Packets are encoded through MeasuredJSON so /metrics can report per-event size and cost
+socketio = SocketIO(json=MeasuredJSON)
 
-# Initialize components
-db = DatabaseManager()
-emotion_engine = EmotionEngine()
-memory_manager = ChatMemoryManager(db)
+class ChatSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions, except on static assets.
+    
+    Refreshing the session cookie would add Set-Cookie and Vary: Cookie to
+    every asset response, and shared caches don't store those.
+    """
+    
+    def save_session(self, app, session, response):
+        if request.endpoint == 'chat.static_file':
+            return
+        super().save_session(app, session, response)
+
+def create_app(config=Config, eager=False):
+    """Build the Flask app; subsystems are created lazily unless `eager`"""
+    # Static files are served by chat_bp from StaticAssets (hashed names, cache headers)
+    app = Flask(__name__, static_folder=None)
+    app.secret_key = config.FLASK_SECRET_KEY
+    app.session_interface = ChatSessionInterface()
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)  # Long-term sessions
+    app.config['CHATBOT_CONFIG'] = config
+    
+    services = ChatServices(config)
+    app.extensions['chatbot'] = services
+    if eager:
+        services.init_all()
+    
+    app.register_blueprint(chat_bp)
+    # Websocket frames use permessage-deflate when the browser offers it;
+    # long-polling responses are compressed above the threshold
+    socketio.init_app(app, cors_allowed_origins="*", async_mode='threading',
+                      http_compression=True, compression_threshold=config.SOCKETIO_COMPRESSION_THRESHOLD)
+    return app
+
+def get_services():
+    """Subsystems of the app handling the current request/event"""
+    return current_app.extensions['chatbot']
 
-# Clean up old memories on startup
-db.cleanup_old_memories()
+def captured(event):
+    """Record every call of a Socket.IO handler in the traffic capture.
+    
+    A no-op unless TRAFFIC_CAPTURE is on. The handler can add fields to the
+    event (tone, prompt size, outcome) with note_capture().
+    """
+    def decorator(handler):
+        # Flask-SocketIO passes optional arguments (e.g. connect's auth)
+        # only to handlers that accept them
+        arity = len(inspect.signature(handler).parameters)
+        
+        @functools.wraps(handler)
+        def wrapper(*args):
+            args = args[:arity]
+            services = get_services()
+            if not services.config.TRAFFIC_CAPTURE:
+                return handler(*args)
+            g.capture = {}
+            arrived = time.time()
+            start = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                data = args[0] if args and isinstance(args[0], dict) else {}
+                services.traffic_recorder.record(
+                    event,
+                    session.get('user_id'),
+                    message=data.get('message'),
+                    ts=arrived,
+                    latency_ms=round((time.perf_counter() - start) * 1000, 2),
+                    **g.capture
+                )
+        return wrapper
+    return decorator
+
+def note_capture(**fields):
+    """Add fields to the traffic capture entry of the current event"""
+    capture = g.get('capture')
+    if capture is not None:
+        capture.update(fields)
+
+def current_protocol():
+    """Payload format the client of the current event negotiated at connect"""
+    protocol = session.get('wire_protocol')
+    if protocol is None:
+        protocol = WireProtocol(get_services().config.WIRE_PROTOCOL_DEFAULT)
+    return protocol
+
+def send_event(event, payload):
+    """emit() an event in the client's payload format"""
+    emit(event, current_protocol().encode(event, payload))
 
 # Conversation starters for diverse responses
 CONVERSATION_STARTERS = [
@@ -48,76 +137,190 @@ def generate_user_id():
     """Generate a unique user ID for anonymous users"""
     return str(uuid.uuid4())
 
-def get_system_prompt(user_context, emotional_context, user_profile):
-    """Generate optimized system prompt with personalized context"""
-    # Build personalized context
-    personalized_context = ""
-    if user_profile and user_profile.get("name"):
-        personalized_context += f"The user's name is {user_profile['name']}. "
+def get_system_prompt(user_context, emotional_context, user_profile, prompt_cache=None):
+    """System prompt from the cached persona, profile and tone blocks plus this turn's context"""
+    if prompt_cache is None:
+        prompt_cache = get_services().prompt_cache
+    return prompt_cache.system_prompt(user_context, emotional_context, user_profile)
+
+# Sent when a reply could not be produced
+TROUBLE_REPLY = "I apologize, but I'm having trouble processing that right now. Could you try again? 🫤"
+
+def generate_reply(system_prompt, user_message, emotional_context, context_size=0, history=None, on_token=None, cancelled=None,
+                   on_reset=None):
+    """Run one chat generation on the model tier the router picks"""
+    services = get_services()
+    response = services.model_router.chat(
+        messages=[
+            {
+                'role': 'system',
+                'content': system_prompt
+            },
+            # Recent turns from conversation_turns, oldest first
+            *(history or []),
+            {
+                'role': 'user',
+                'content': user_message
+            }
+        ],
+        message=user_message,
+        emotion_scores=emotional_context.get('emotion_scores'),
+        context_size=context_size,
+        options={
+            'temperature': services.config.TEMPERATURE + 0.1,  # Slightly higher temp for diversity
+            'top_p': 0.92
+            # num_ctx / num_predict come from the selected tier
+        },
+        on_token=on_token,
+        cancelled=cancelled,
+        on_reset=on_reset
+    )
+    return response['message']['content'].strip()
+
+def emit_busy_response(user_message):
+    """Answer immediately from templates when a message is shed"""
+    services = get_services()
+    message, emotional_context = services.emotion_engine.get_busy_response(user_message)
+    note_capture(outcome='busy')
+    emit_reply({
+        'message': message,
+        'emotional_context': emotional_context
+    }, cache=False)
+
+def emit_fallback_response(user_id, user_message, user_profile=None):
+    """Answer without the model while Ollama is failing"""
+    services = get_services()
+    message, emotional_context = services.fallback_responder.respond(user_id, user_message, user_profile)
+    note_capture(outcome='fallback')
+    emit_reply({
+        'message': message,
+        'emotional_context': emotional_context
+    }, cache=False)
+
+def emit_reply(payload, cache=True, event='bot_response'):
+    """Send the reply to the current message and complete its reply stream.
     
-    if user_profile and user_profile.get("preferences"):
-        prefs = user_profile["preferences"]
-        if prefs.get("likes"):
-            personalized_context += f"They like: {', '.join(prefs['likes'][:3])}. "
-        if prefs.get("dislikes"):
-            personalized_context += f"They dislike: {', '.join(prefs['dislikes'][:2])}. "
-        if prefs.get("profession"):
-            personalized_context += f"They work as: {prefs['profession']}. "
-        if prefs.get("location"):
-            personalized_context += f"They're from: {prefs['location']}. "
+    Only model replies are kept for retries (cache=True); a retried message
+    that got a template answer is answered afresh.
+    """
+    reply_stream = g.get('reply_stream')
+    if reply_stream is not None:
+        payload = dict(payload, message_id=reply_stream.message_id)
+        get_services().reply_cache.finish(reply_stream, payload, keep=cache, event=event)
+    send_event(event, payload)
+
+def emit_cancelled(generation, user_message, emotional_context=None):
+    """Tell the client its message gets no reply (superseded or disconnected).
+    
+    Only the reply is dropped: the user's turn and any facts in it are kept.
+    """
+    get_services().memory_manager.record_unanswered(generation.user_id, user_message, emotional_context)
+    logger.info(f"Cancelled reply to {generation.user_id}: {generation.reason}")
+    note_capture(outcome='cancelled')
+    emit_reply({'reason': generation.reason}, cache=False, event='generation_cancelled')
+
+def token_emitter():
+    """(on_token, on_reset) callbacks streaming reply text to the client as bot_token events"""
+    reply_stream = g.get('reply_stream')
+    message_id = reply_stream.message_id if reply_stream is not None else None
+    offsets = itertools.count()
+    
+    def on_token(token):
+        if reply_stream is not None:
+            reply_stream.append(token)
+        send_event('bot_token', {'message_id': message_id, 'offset': next(offsets), 'token': token})
     
-    base_prompt = f"""You are {Config.BOT_NAME}, {Config.BOT_PERSONA}.
-
-# Instructions:
-1. Be conversational and engaging
-2. Tone: {emotional_context['tone']}
-3. Emotional context: {emotional_context['emotional_markers']}
-4. Keep responses under 3 sentences when possible
-5. Remember and reference previous conversations when relevant
-6. Use the user's name if you know it: {user_profile.get('name', '')}
-7. Reference the user's preferences when appropriate
-
-# Personal Context:
-{personalized_context}
-
-# User Context:
-{user_context}
-
-# Response Guidelines:
-- Be natural and vary your responses
-- Show genuine interest in the user
-- Reference past conversations when relevant
-- Personalize responses using known information
-- Avoid repetitive or generic responses
-- Adapt to the user's communication style
-"""
-    return base_prompt[:Config.MAX_CONTEXT_LENGTH]
-
-@app.route('/')
+    def on_reset():
+        # The tier that streamed so far failed; the next one starts from scratch
+        nonlocal offsets
+        offsets = itertools.count()
+        if reply_stream is not None:
+            reply_stream.reset()
+        send_event('bot_reset', {'message_id': message_id})
+    return on_token, on_reset
+
+def resume_reply(reply_stream, offset, user_message):
+    """Send a known reply's tokens from `offset` on, then its bot_response.
+    
+    Waits for the rest of the tokens if the original generation is still
+    running (e.g. on another, now dead, connection).
+    """
+    services = get_services()
+    try:
+        offset = max(0, int(offset or 0))
+    except (TypeError, ValueError):
+        offset = 0
+    emit('thinking_start', room=request.sid)
+    if not reply_stream.done:
+        # This connection now owns the reply; don't cancel it for the old one
+        services.generations.adopt(reply_stream.user_id, reply_stream.message_id, request.sid)
+    if offset and reply_stream.resets:
+        # The client's tokens may be from a tier that was abandoned
+        send_event('bot_reset', {'message_id': reply_stream.message_id})
+        offset = 0
+    replayed = 0
+    for index, token in reply_stream.follow(offset, timeout=services.config.TIMEOUT):
+        if token is None:
+            send_event('bot_reset', {'message_id': reply_stream.message_id})
+            continue
+        send_event('bot_token', {'message_id': reply_stream.message_id, 'offset': index, 'token': token})
+        replayed += 1
+    services.reply_cache.note_replayed(replayed)
+    if reply_stream.result is not None:
+        send_event(reply_stream.event, reply_stream.result)
+        return
+    # The original generation failed without a reply, or stalled
+    send_event('bot_response', {
+        'message': TROUBLE_REPLY,
+        'emotional_context': services.emotion_engine.get_emotional_response(user_message),
+        'message_id': reply_stream.message_id
+    })
+
+@chat_bp.route('/')
 def index():
     """Main chat interface"""
     if 'user_id' not in session:
         session['user_id'] = generate_user_id()
         session.permanent = True  # Make session long-lasting
     
-    return render_template('index.html', bot_name=Config.BOT_NAME)
+    services = get_services()
+    response = current_app.make_response(render_template('index.html', bot_name=services.config.BOT_NAME,
+                                                         asset_url=services.static_assets.url))
+    # The page names the current asset hashes, so it is revalidated on every
+    # visit; an unchanged page costs a 304 and the assets come from cache
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@chat_bp.route('/static/<path:filename>')
+def static_file(filename):
+    """Static assets, by content-hashed or plain name"""
+    return get_services().static_assets.response(filename)
 
 @socketio.on('connect')
-def handle_connect():
+@captured('connect')
+def handle_connect(auth=None):
     """Handle client connection with personalized greeting"""
+    services = get_services()
     user_id = session.get('user_id', generate_user_id())
     session['user_id'] = user_id
+    protocol = WireProtocol.negotiate(auth, services.config.WIRE_PROTOCOL_DEFAULT)
+    session['wire_protocol'] = protocol
+    wire_stats.connected(protocol)
     logger.info(f"User {user_id} connected")
     
     # Get user profile for personalized greeting
-    user_profile = db.get_user_profile(user_id)
+    user_profile = services.db.get_user_profile(user_id)
+    if user_profile is None and services.archiver.rehydrate(user_id):
+        # Returning after a long break: bring their memories back from the cold tier
+        user_profile = services.db.get_user_profile(user_id)
     
     # Send personalized welcome message
-    emotional_context = emotion_engine.get_emotional_response("hello")
+    emotional_context = services.emotion_engine.get_emotional_response("hello")
     
     if user_profile and user_profile.get("name"):
         # Personalized greeting for returning user
-        welcome_message = f"Welcome back, {user_profile['name']}! {random.choice(emotion_engine.tone_profiles[emotional_context['tone']]['greeting'])} How have you been?"
+        welcome_message = f"Welcome back, {user_profile['name']}! {random.choice(services.emotion_engine.tone_profiles[emotional_context['tone']]['greeting'])} How have you been?"
         
         # Reference past interests if available
         if user_profile.get("preferences", {}).get("likes"):
@@ -127,19 +330,48 @@ def handle_connect():
                 welcome_message += f" Still enjoying {interest}?"
     else:
         # Generic greeting for new user
-        welcome_message = f"{random.choice(emotion_engine.tone_profiles[emotional_context['tone']]['greeting'])} I'm {Config.BOT_NAME}. {emotional_context['emotional_markers']}"
+        welcome_message = f"{random.choice(services.emotion_engine.tone_profiles[emotional_context['tone']]['greeting'])} I'm {services.config.BOT_NAME}. {emotional_context['emotional_markers']}"
     
-    emit('bot_response', {
+    send_event('bot_response', {
         'message': welcome_message,
         'emotional_context': emotional_context
     })
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Stop generating replies for a client that has gone away"""
+    get_services().generations.disconnected(request.sid)
+
 @socketio.on('user_message')
+@captured('user_message')
 def handle_user_message(data):
     """Handle incoming user message with enhanced memory"""
+    services = get_services()
     user_id = session.get('user_id')
     user_message = data['message'].strip()
+    message_id = data.get('message_id')
+    if not valid_message_id(message_id):
+        answer_message(user_id, user_message)
+        return
     
+    # A message id seen before (double send, retry after reconnect) follows
+    # or replays that reply from the client's token offset instead of
+    # generating it again
+    reply_stream, created = services.reply_cache.begin(user_id, message_id)
+    if not created:
+        note_capture(outcome='resumed')
+        resume_reply(reply_stream, data.get('offset'), user_message)
+        return
+    g.reply_stream = reply_stream
+    try:
+        answer_message(user_id, user_message)
+    finally:
+        if not reply_stream.done:
+            services.reply_cache.finish(reply_stream, None, keep=False)
+
+def answer_message(user_id, user_message):
+    """Reply to a new message: template, fallback or model generation"""
+    services = get_services()
     if not user_message:
         # Use diverse responses for empty messages
         responses = [
@@ -148,90 +380,128 @@ def handle_user_message(data):
             "I'm here and ready to chat! What would you like to discuss? 💬",
             "Hi! I'm listening. What would you like to talk about? 👂"
         ]
-        emit('bot_response', {
+        note_capture(outcome='empty')
+        emit_reply({
             'message': random.choice(responses),
             'emotional_context': {'tone': 'friendly', 'emotional_markers': '😊'}
-        })
+        }, cache=False)
         return
     
     logger.info(f"Received message from {user_id}: {user_message}")
     
-    try:
-        # Emit thinking start event
-        emit('thinking_start', room=request.sid)
-        
-        # Analyze emotional content
-        emotional_context = emotion_engine.get_emotional_response(user_message)
+    # Per-user / per-IP rate limits: spam gets a template, not a generation
+    if services.admission_gate.check_rate(user_id, request.remote_addr):
+        emit_busy_response(user_message)
+        return
+    
+    # One turn at a time per user: a double-send or a second tab queues
+    # behind the in-flight turn instead of racing its profile/memory writes.
+    # The generation is registered before waiting, so a newer message can
+    # cancel this one while it queues or streams
+    reply_stream = g.get('reply_stream')
+    message_id = reply_stream.message_id if reply_stream is not None else None
+    with services.generations.track(user_id, request.sid, message_id) as generation, \
+            services.memory_manager.serializer.serialize(user_id):
+        try:
+            if generation.cancelled():
+                emit_cancelled(generation, user_message)
+                return
+            
+            # Emit thinking start event
+            emit('thinking_start', room=request.sid)
         
-        # Get user profile for personalization
-        user_profile = db.get_user_profile(user_id) or {}
+            # Analyze emotional content
+            emotional_context = services.emotion_engine.get_emotional_response(user_message)
         
-        # Get conversation context (optimized for speed)
-        conversation_context = memory_manager.get_conversation_context(user_id, max_exchanges=6)
-        formatted_context = memory_manager.format_context_for_prompt(conversation_context, user_profile)
+            # Get user profile for personalization
+            user_profile = services.db.get_user_profile(user_id) or {}
         
-        # Generate optimized system prompt with personalization
-        system_prompt = get_system_prompt(formatted_context, emotional_context, user_profile)
+            # Get conversation context (optimized for speed)
+            conversation_context = services.memory_manager.get_conversation_context(user_id, max_exchanges=3)
+            formatted_context = services.memory_manager.format_context_for_prompt(conversation_context, user_profile)
         
-        # Generate response using Ollama with timeout
-        response = ollama.chat(
-            model=Config.OLLAMA_MODEL,
-            messages=[
-                {
-                    'role': 'system',
-                    'content': system_prompt
-                },
-                {
-                    'role': 'user',
-                    'content': user_message
-                }
-            ],
-            options={
-                'temperature': Config.TEMPERATURE + 0.1,  # Slightly higher temp for diversity
-                'top_p': 0.92,
-                'num_ctx': 2048,
-                'num_predict': 120  # Slightly longer responses for naturalness
-            }
-        )
+            # Generate optimized system prompt with personalization
+            system_prompt = get_system_prompt(formatted_context, emotional_context, user_profile)
+            note_capture(
+                tone=emotional_context['tone'],
+                prompt_chars=len(system_prompt) + sum(len(turn['content']) for turn in conversation_context["recent_conversation"]),
+                outcome='reply'
+            )
         
-        bot_response = response['message']['content'].strip()
+            # Ollama is known to be down: answer locally right away
+            if not services.llm_breaker.allow_request():
+                emit_fallback_response(user_id, user_message, user_profile)
+                return
+            
+            # Over capacity: shed with an instant reply instead of queuing forever
+            if not services.admission_gate.controller.acquire():
+                emit_busy_response(user_message)
+                return
+            
+            # Generate response using Ollama with timeout
+            try:
+                if generation.cancelled():
+                    emit_cancelled(generation, user_message, emotional_context)
+                    return
+                generation.generating = True
+                on_token, on_reset = token_emitter()
+                bot_response = generate_reply(
+                    system_prompt,
+                    user_message,
+                    emotional_context,
+                    context_size=len(formatted_context),
+                    history=conversation_context["recent_conversation"],
+                    on_token=on_token,
+                    cancelled=generation.cancelled,
+                    on_reset=on_reset
+                )
+            finally:
+                services.admission_gate.controller.release()
+            
+            # Nobody is waiting for this reply any more; keep it out of memory,
+            # but not the message itself
+            if generation.cancelled():
+                emit_cancelled(generation, user_message, emotional_context)
+                return
         
-        # Extract and store user information
-        memory_manager.extract_user_info(user_id, user_message, bot_response)
+            # Extract and store user information
+            services.memory_manager.extract_user_info(user_id, user_message, bot_response)
         
-        # Update conversation buffer
-        memory_manager.update_conversation_buffer(
-            user_id, 
-            user_message, 
-            bot_response, 
-            emotional_context
-        )
+            # Update conversation buffer
+            services.memory_manager.update_conversation_buffer(
+                user_id, 
+                user_message, 
+                bot_response, 
+                emotional_context
+            )
         
-        # Send response to client
-        emit('bot_response', {
-            'message': bot_response,
-            'emotional_context': emotional_context
-        })
+            # Send response to client
+            emit_reply({
+                'message': bot_response,
+                'emotional_context': emotional_context
+            })
         
-    except ollama.ResponseError as e:
-        logger.error(f"Ollama error: {e}")
-        emit('bot_response', {
-            'message': "I'm having trouble connecting to my AI brain. Could you try again? 🤔",
-            'emotional_context': {'tone': 'friendly', 'emotional_markers': '🤔'}
-        })
-    except Exception as e:
-        logger.error(f"Error generating response: {e}")
-        emotional_context = emotion_engine.get_emotional_response(user_message)
-        emit('bot_response', {
-            'message': "I apologize, but I'm having trouble processing that right now. Could you try again? 🫤",
-            'emotional_context': emotional_context
-        })
+        except CircuitOpenError:
+            emit_fallback_response(user_id, user_message)
+        except (ollama.ResponseError, httpx.HTTPError) as e:
+            logger.error(f"Ollama error: {e}")
+            emit_fallback_response(user_id, user_message)
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            note_capture(outcome='error')
+            emotional_context = services.emotion_engine.get_emotional_response(user_message)
+            emit_reply({
+                'message': TROUBLE_REPLY,
+                'emotional_context': emotional_context
+            }, cache=False)
 
 @socketio.on('request_topic')
+@captured('request_topic')
 def handle_topic_request():
     """Handle request for conversation topic suggestions"""
+    services = get_services()
     user_id = session.get('user_id')
-    user_profile = db.get_user_profile(user_id) or {}
+    user_profile = services.db.get_user_profile(user_id) or {}
     
     # Personalize topic suggestions based on user preferences
     personalized_topics = CONVERSATION_STARTERS.copy()
@@ -245,24 +515,80 @@ def handle_topic_request():
             personalized_topics.append(f"How's work as a {prefs['profession']} treating you?")
     
     topic = random.choice(personalized_topics)
-    emotional_context = emotion_engine.get_emotional_response(topic)
+    emotional_context = services.emotion_engine.get_emotional_response(topic)
     
-    emit('bot_response', {
+    send_event('bot_response', {
         'message': topic,
         'emotional_context': emotional_context
     })
 
-@app.route('/health')
+@chat_bp.route('/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "model": Config.OLLAMA_MODEL})
+    return jsonify({"status": "healthy", "model": get_services().config.OLLAMA_MODEL})
+
+@chat_bp.route('/metrics')
+def metrics():
+    """Runtime counters for capacity tuning"""
+    services = get_services()
+    return jsonify({
+        "admission": services.admission_gate.stats(),
+        "llm_breaker": services.llm_breaker.stats(),
+        "model_tiers": services.model_router.stats(),
+        "output": services.output_controller.stats(),
+        "reply_cache": services.reply_cache.stats(),
+        "cancellation": services.generations.stats(),
+        "wire": wire_stats.stats(),
+        "batch": services.batch_chat.stats(),
+        "prompt_cache": services.prompt_cache.stats(),
+        "fact_extraction": services.fact_extractor.stats() if services.is_initialized("fact_extractor") else None,
+        "active_users": services.memory_manager.serializer.active_users()
+    })
+
+def check_api_token(token):
+    """Error response unless the request carries `token`; an unset token means no endpoint"""
+    if not token:
+        return jsonify({"error": "not found"}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode()):
+        return jsonify({"error": "unauthorized"}), 401
+    return None
+
+@chat_bp.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer many {user_id, message, id?} items; results stream back as NDJSON.
+    
+    The body is {"items": [...]}, a JSON list, or NDJSON (Content-Type
+    application/x-ndjson). Results come in completion order, each with the
+    item's index and id, followed by a summary line. The endpoint only
+    exists when BATCH_API_TOKEN is set, and callers must send it.
+    """
+    services = get_services()
+    denied = check_api_token(services.config.BATCH_API_TOKEN)
+    if denied:
+        return denied
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            items = parse_ndjson(request.get_data(as_text=True).splitlines())
+        else:
+            body = request.get_json(silent=True)
+            items = body.get('items') if isinstance(body, dict) else body
+        services.batch_chat.check(items)
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def generate():
+        for result in services.batch_chat.run(items):
+            yield json.dumps(result) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-@app.route('/debug/user/<user_id>')
+@chat_bp.route('/debug/user/<user_id>')
 def debug_user(user_id):
     """Debug endpoint to view user data"""
-    profile = db.get_user_profile(user_id)
-    memories = db.get_important_memories(user_id, 10)
-    recent = db.get_recent_memories(user_id, 5)
+    services = get_services()
+    profile = services.db.get_user_profile(user_id)
+    memories = services.db.get_important_memories(user_id, 10)
+    recent = services.db.get_recent_memories(user_id, 5)
     
     return jsonify({
         "profile": profile,
@@ -270,7 +596,57 @@ def debug_user(user_id):
         "recent_memories": recent
     })
 
+@chat_bp.route('/debug/user/<user_id>/history')
+def debug_user_history(user_id):
+    """Stream a user's memories as NDJSON, newest first.
+    
+    Rows come straight from keyset pages, so memory use does not grow with
+    the history. At most DEBUG_STREAM_MAX_ROWS rows (or ?limit=) are sent per
+    request; the last line carries next_cursor for the following request.
+    Like the batch API it only exists when DEBUG_API_TOKEN is set.
+    """
+    services = get_services()
+    config = services.config
+    denied = check_api_token(config.DEBUG_API_TOKEN)
+    if denied:
+        return denied
+    try:
+        limit = min(int(request.args.get('limit', config.DEBUG_STREAM_MAX_ROWS)), config.DEBUG_STREAM_MAX_ROWS)
+        page_size = int(request.args.get('page_size', config.HISTORY_PAGE_SIZE))
+        after = request.args.get('cursor')
+        if after:
+            decode_cursor(after)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    since = request.args.get('since')
+    
+    def generate():
+        cursor = after
+        sent = 0
+        while sent < limit:
+            rows, cursor = services.db.get_conversation_page(
+                user_id, after=cursor, limit=min(page_size, limit - sent), since=since
+            )
+            for row in rows:
+                yield json.dumps(row) + "\n"
+            sent += len(rows)
+            if cursor is None:
+                break
+        yield json.dumps({"next_cursor": cursor, "rows": sent}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# WSGI entry point (gunicorn app:app); subsystems initialize on first use
+app = create_app()
+
+def __getattr__(name):
+    # Backwards-compatible module attributes (`from app import db`), built lazily
+    if name in ('db', 'emotion_engine', 'memory_manager'):
+        return getattr(app.extensions['chatbot'], name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
+    app.extensions['chatbot'].init_all()
     port = int(os.getenv("PORT", 5000))
     socketio.run(app, host="0.0.0.0", port=port, debug=False)
 
@@ -0,0 +1,51 @@
+import tempfile
+import unittest
+import load_test
+from fake_ollama import FakeOllama, FakeOllamaServer
+
+class AppTestCase(unittest.TestCase):
+    """The app on throwaway databases, talking to a fake Ollama.
+
+    setUp() starts a FakeOllamaServer with `fake_ollama` settings, builds
+    the app from load_test_config() passed through configure(), and gives
+    self.flask_app, self.services, self.fake and self.cookies: a test
+    client whose session is user `user_id`, so Socket.IO clients opened
+    with connect() are the same user, as after a reconnect. With `serve`
+    the app also runs on a real HTTP server at self.url.
+    """
+
+    fake_ollama = dict(prompt_eval_ms=5, token_ms=1, tokens=20, jitter=0, seed=1)
+    user_id = "alice"
+    serve = False
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fake = FakeOllamaServer(behaviour=FakeOllama(**self.fake_ollama)).start()
+        config = self.configure(load_test.load_test_config(self.fake.url, self.tmpdir.name))
+        if self.serve:
+            self.flask_app, self.server, self.url = load_test.start_app(config)
+        else:
+            from app import create_app
+            self.flask_app = create_app(config)
+        self.services = self.flask_app.extensions['chatbot']
+        self.cookies = self.flask_app.test_client()
+        with self.cookies.session_transaction() as session:
+            session['user_id'] = self.user_id
+
+    def tearDown(self):
+        if self.serve:
+            self.server.shutdown()
+        self.fake.stop()
+        self.services.close()
+        self.tmpdir.cleanup()
+
+    def configure(self, config):
+        """Config class for the app; override to return a subclass with other settings"""
+        return config
+
+    def connect(self, **kwargs):
+        """Socket.IO test client on the cookie session, greeting already read"""
+        from app import socketio
+        client = socketio.test_client(self.flask_app, flask_test_client=self.cookies, **kwargs)
+        client.get_received()
+        return client
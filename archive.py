@@ -0,0 +1,199 @@
+import json
+import lzma
+import sqlite3
+import threading
+import zlib
+import logging
+from datetime import datetime, timedelta, timezone
+from config import Config
+from database import USER_TABLES
+
+logger = logging.getLogger(__name__)
+
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress)
+}
+
+class ColdArchive:
+    """Compressed per-user blobs in their own SQLite file"""
+
+    def __init__(self, archive_path=None, compression=None):
+        self.archive_path = archive_path or Config.ARCHIVE_DB
+        self.compression = compression or Config.ARCHIVE_COMPRESSION
+        if self.compression not in CODECS:
+            raise ValueError(f"Unknown archive compression: {self.compression}")
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.archive_path, check_same_thread=False)
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS archived_users (
+                user_id TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                row_count INTEGER,
+                raw_bytes INTEGER,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )'''
+        )
+        self.conn.commit()
+
+    def put(self, user_id, tables):
+        """Store {table: {"columns": [...], "rows": [[...]]}} for a user"""
+        raw = json.dumps({"version": 1, "tables": tables}, separators=(",", ":")).encode("utf-8")
+        compress, _ = CODECS[self.compression]
+        row_count = sum(len(table["rows"]) for table in tables.values())
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO archived_users (user_id, codec, payload, row_count, raw_bytes) VALUES (?, ?, ?, ?, ?)",
+                (user_id, self.compression, compress(raw), row_count, len(raw))
+            )
+            self.conn.commit()
+
+    def get(self, user_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT codec, payload FROM archived_users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if not row:
+            return None
+        _, decompress = CODECS[row[0]]
+        return json.loads(decompress(row[1]).decode("utf-8"))["tables"]
+
+    def delete(self, user_id):
+        with self._lock:
+            self.conn.execute("DELETE FROM archived_users WHERE user_id = ?", (user_id,))
+            self.conn.commit()
+
+    def stats(self):
+        with self._lock:
+            users, raw_bytes, packed_bytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(LENGTH(payload)), 0) FROM archived_users"
+            ).fetchone()
+        return {"users": users, "raw_bytes": raw_bytes, "packed_bytes": packed_bytes}
+
+class UserArchiver:
+    """Moves inactive users out of the hot tables and back on demand.
+
+    A user is inactive once both their profile update and their newest
+    memory are older than ARCHIVE_INACTIVE_DAYS. Archival writes the blob
+    first and only then deletes the hot rows, and restore keeps the original
+    primary keys with INSERT OR IGNORE, so a crash between the two steps
+    never loses or duplicates anything.
+    """
+
+    def __init__(self, database, archive=None, config=Config):
+        self.db = database
+        self.archive = archive or ColdArchive(config.ARCHIVE_DB, config.ARCHIVE_COMPRESSION)
+        self.inactive_days = config.ARCHIVE_INACTIVE_DAYS
+        self.batch_size = config.ARCHIVE_BATCH_SIZE
+
+    def _cutoff(self, now=None):
+        # CURRENT_TIMESTAMP columns are UTC
+        now = now or datetime.now(timezone.utc)
+        return (now - timedelta(days=self.inactive_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def find_inactive(self, now=None, limit=None):
+        limit = limit or self.batch_size
+        user_ids = []
+        for shard in self.db.shards:
+            cursor = shard.conn.cursor()
+            cursor.execute(
+                '''SELECT user_id FROM (
+                       SELECT user_id, updated_at AS seen FROM user_profiles
+                       UNION ALL
+                       SELECT user_id, MAX(created_at) FROM conversation_memories GROUP BY user_id
+                   )
+                   WHERE user_id IS NOT NULL
+                   GROUP BY user_id
+                   HAVING MAX(seen) < ?
+                   LIMIT ?''',
+                (self._cutoff(now), limit - len(user_ids))
+            )
+            user_ids.extend(row[0] for row in cursor.fetchall())
+            if len(user_ids) >= limit:
+                break
+        return user_ids
+
+    def archive_inactive(self, now=None):
+        """Archive up to ARCHIVE_BATCH_SIZE inactive users; returns how many moved"""
+        archived = 0
+        try:
+            for user_id in self.find_inactive(now):
+                if self.archive_user(user_id, now):
+                    archived += 1
+            if archived:
+                logger.info(f"Archived {archived} inactive users")
+        except Exception as e:
+            logger.error(f"Error archiving inactive users: {e}")
+        return archived
+
+    def archive_user(self, user_id, now=None):
+        with self.db.pinned(user_id) as shard, shard._write_lock:
+            # Re-check under the lock in case the user came back meanwhile
+            if not self._is_inactive(shard, user_id, now):
+                return False
+            cursor = shard.conn.cursor()
+            tables = {}
+            for table in USER_TABLES:
+                cursor.execute(f"SELECT * FROM {table} WHERE user_id = ?", (user_id,))
+                rows = cursor.fetchall()
+                if rows:
+                    tables[table] = {
+                        "columns": list(rows[0].keys()),
+                        "rows": [list(row) for row in rows]
+                    }
+            self.archive.put(user_id, tables)
+            try:
+                for table in USER_TABLES:
+                    cursor.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+                shard.conn.commit()
+            except Exception:
+                shard.conn.rollback()
+                raise
+        return True
+
+    def _is_inactive(self, shard, user_id, now):
+        cursor = shard.conn.cursor()
+        cursor.execute(
+            '''SELECT MAX(seen) FROM (
+                   SELECT updated_at AS seen FROM user_profiles WHERE user_id = ?
+                   UNION ALL
+                   SELECT MAX(created_at) FROM conversation_memories WHERE user_id = ?
+               )''',
+            (user_id, user_id)
+        )
+        seen = cursor.fetchone()[0]
+        return seen is not None and seen < self._cutoff(now)
+
+    def rehydrate(self, user_id):
+        """Restore an archived user into the hot tables; False if not archived"""
+        try:
+            tables = self.archive.get(user_id)
+            if tables is None:
+                return False
+            with self.db.pinned(user_id) as shard, shard._write_lock:
+                cursor = shard.conn.cursor()
+                try:
+                    for table in USER_TABLES:
+                        if table not in tables:
+                            continue
+                        # Only columns the current schema still has
+                        cursor.execute(f"PRAGMA table_info({table})")
+                        current = {row["name"] for row in cursor.fetchall()}
+                        columns = tables[table]["columns"]
+                        keep = [i for i, column in enumerate(columns) if column in current]
+                        cursor.executemany(
+                            f"INSERT OR IGNORE INTO {table} ({', '.join(columns[i] for i in keep)}) "
+                            f"VALUES ({', '.join('?' for _ in keep)})",
+                            [[row[i] for i in keep] for row in tables[table]["rows"]]
+                        )
+                    shard.conn.commit()
+                except Exception:
+                    shard.conn.rollback()
+                    raise
+            self.archive.delete(user_id)
+            logger.info(f"Rehydrated archived user {user_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error rehydrating user {user_id}: {e}")
+            return False
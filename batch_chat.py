@@ -0,0 +1,256 @@
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import ollama
+from flask import current_app
+from config import Config
+from admission import RateLimiter
+from circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Turns of history sent with each message, as for interactive turns
+HISTORY_EXCHANGES = 3
+MAX_USER_ID_LENGTH = 128
+# Bucket of the batch rate limiter; there is one API token
+RATE_KEY = "api"
+
+class BatchError(ValueError):
+    """The batch as a whole is malformed (not a list, too many items, bad NDJSON)"""
+
+def parse_ndjson(lines):
+    """Items from NDJSON lines; blank lines are skipped"""
+    items = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise BatchError(f"Line {number} is not valid JSON: {e}")
+    return items
+
+def item_error(item):
+    """Why an item can't be answered, or None"""
+    if not isinstance(item, dict):
+        return "item must be an object"
+    user_id = item.get("user_id")
+    if not isinstance(user_id, str) or not 0 < len(user_id) <= MAX_USER_ID_LENGTH:
+        return f"user_id must be a string of 1-{MAX_USER_ID_LENGTH} characters"
+    if not isinstance(item.get("message"), str) or not item["message"].strip():
+        return "message must be a non-empty string"
+    if not isinstance(item.get("id"), (str, int, type(None))):
+        return "id must be a string or an integer"
+    return None
+
+class BatchChat:
+    """Answers many (user_id, message) items through the chat pipeline.
+
+    Items are grouped by user. A user's messages are answered one after
+    another in batch order, each seeing the previous replies as history,
+    while different users run on up to BATCH_CONCURRENCY threads; every
+    generation still takes an admission slot like an interactive turn, and
+    items count against the batch rate limit (BATCH_RATE_LIMIT_*, separate
+    from the per-user chat limit) unless the run is offline.
+    Prompt inputs of all users in the batch are read up front with one
+    query per table, and finished exchanges are written BATCH_WRITE_SIZE
+    at a time in a single transaction. run() yields results as they
+    finish, then a summary.
+    """
+
+    def __init__(self, services, concurrency=None, write_size=None, max_items=None, config=Config):
+        self.services = services
+        self.concurrency = concurrency or config.BATCH_CONCURRENCY
+        self.write_size = write_size or config.BATCH_WRITE_SIZE
+        self.max_items = max_items or config.BATCH_MAX_ITEMS
+        self.limiter = RateLimiter(config.BATCH_RATE_LIMIT_PER_MINUTE, config.BATCH_RATE_LIMIT_BURST)
+        self._lock = threading.Lock()
+        self.counters = Counter(batches=0, items=0, invalid=0, rate_limited=0, reply=0, fallback=0, busy=0,
+                                error=0, cancelled=0, write_groups=0, seconds=0.0)
+
+    def check(self, items):
+        """Raise BatchError unless `items` is a list the batch can take"""
+        if not isinstance(items, list):
+            raise BatchError("items must be a list")
+        if len(items) > self.max_items:
+            raise BatchError(f"at most {self.max_items} items per batch")
+
+    def run(self, items, rate_limit=True):
+        """Answer `items`, yielding one result dict per item, then {"summary": ...}.
+
+        Must run inside an app context; stopping the iteration early (e.g.
+        the HTTP client went away) cancels the generations still running.
+        With rate_limit, items past the batch rate limit are answered
+        "rate_limited" without a reply.
+        """
+        self.check(items)
+        app = current_app._get_current_object()
+        start = time.perf_counter()
+        outcomes = Counter()
+        by_user = {}
+        for index, item in enumerate(items):
+            error = item_error(item)
+            if error:
+                outcomes["invalid"] += 1
+                yield {"index": index, "id": item.get("id") if isinstance(item, dict) else None,
+                       "outcome": "invalid", "error": error}
+            elif rate_limit and not self.limiter.allow(RATE_KEY):
+                outcomes["rate_limited"] += 1
+                yield {"index": index, "id": item.get("id"), "user_id": item["user_id"],
+                       "outcome": "rate_limited", "error": "rate limit exceeded, retry later"}
+            else:
+                by_user.setdefault(item["user_id"], []).append((index, item))
+        answered = len(items) - outcomes["invalid"] - outcomes["rate_limited"]
+        if outcomes["rate_limited"]:
+            logger.warning(f"Batch rate limit hit: {outcomes['rate_limited']} of {len(items)} items shed")
+
+        results = queue.Queue()
+        stop = threading.Event()
+        exchanges = []
+        if by_user:
+            memory_manager = self.services.memory_manager
+            contexts = memory_manager.get_conversation_contexts(list(by_user), max_exchanges=HISTORY_EXCHANGES)
+            # Archived users are restored before anything is read or written
+            # for them, as on connect
+            restored = [user_id for user_id in by_user
+                        if not contexts[user_id]["user_profile"] and self.services.archiver.rehydrate(user_id)]
+            if restored:
+                contexts.update(memory_manager.get_conversation_contexts(restored, max_exchanges=HISTORY_EXCHANGES))
+            executor = ThreadPoolExecutor(max_workers=min(self.concurrency, len(by_user)), thread_name_prefix="batch-chat")
+            for user_id, entries in by_user.items():
+                executor.submit(self._answer_user, app, user_id, entries, contexts[user_id], results, stop)
+            try:
+                for _ in range(answered):
+                    result, exchange = results.get()
+                    outcomes[result["outcome"]] += 1
+                    if exchange is not None:
+                        exchanges.append(exchange)
+                        if len(exchanges) >= self.write_size:
+                            self._write(exchanges)
+                    yield result
+            finally:
+                stop.set()
+                executor.shutdown(wait=True)
+                # Replies finished after the caller stopped listening are still kept
+                while not results.empty():
+                    _, exchange = results.get()
+                    if exchange is not None:
+                        exchanges.append(exchange)
+                self._write(exchanges)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.counters.update(outcomes)
+            self.counters["batches"] += 1
+            self.counters["items"] += len(items)
+            self.counters["seconds"] += elapsed
+        yield {"summary": {"items": len(items), "outcomes": dict(outcomes), "elapsed_ms": round(elapsed * 1000, 1)}}
+
+    def _write(self, exchanges):
+        if not exchanges:
+            return
+        self.services.memory_manager.record_exchanges(exchanges)
+        with self._lock:
+            self.counters["write_groups"] += 1
+        exchanges.clear()
+
+    def _answer_user(self, app, user_id, entries, context, results, stop):
+        with app.app_context():
+            for index, item in entries:
+                result = {"index": index, "id": item.get("id"), "user_id": user_id}
+                if stop.is_set():
+                    results.put((dict(result, outcome="cancelled"), None))
+                    continue
+                try:
+                    results.put(self._answer(result, item["message"].strip(), context, stop))
+                except Exception as e:
+                    logger.error(f"Error answering batch item {index}: {e}")
+                    results.put((dict(result, outcome="error", error="could not answer"), None))
+
+    def _answer(self, result, message, context, stop):
+        """(result, exchange to store or None) for one message"""
+        from app import generate_reply, get_system_prompt
+        services = self.services
+        user_id = result["user_id"]
+        with services.memory_manager.serializer.serialize(user_id):
+            emotional_context = services.emotion_engine.get_emotional_response(message)
+            result["tone"] = emotional_context["tone"]
+            user_profile = context["user_profile"]
+            formatted_context = services.memory_manager.format_context_for_prompt(context, user_profile)
+            system_prompt = get_system_prompt(formatted_context, emotional_context, user_profile)
+            try:
+                if not services.llm_breaker.allow_request():
+                    return self._fallback(result, message, user_profile), None
+                if not services.admission_gate.controller.acquire():
+                    return dict(result, outcome="busy", error="over capacity, retry later"), None
+                try:
+                    reply = generate_reply(
+                        system_prompt,
+                        message,
+                        emotional_context,
+                        context_size=len(formatted_context),
+                        history=context["recent_conversation"],
+                        cancelled=stop.is_set
+                    )
+                finally:
+                    services.admission_gate.controller.release()
+            except CircuitOpenError:
+                return self._fallback(result, message, user_profile), None
+            except (ollama.ResponseError, httpx.HTTPError) as e:
+                logger.error(f"Ollama error: {e}")
+                return self._fallback(result, message, user_profile), None
+            if stop.is_set():
+                return dict(result, outcome="cancelled"), None
+
+            if services.memory_manager.extract_user_info(user_id, message, reply):
+                context["user_profile"] = services.db.get_user_profile(user_id) or {}
+            # The user's next item in this batch sees this exchange as history
+            history = context["recent_conversation"]
+            history.extend([{"role": "user", "content": message}, {"role": "assistant", "content": reply}])
+            del history[:-HISTORY_EXCHANGES * 2]
+            return dict(result, outcome="reply", reply=reply), (user_id, message, reply, emotional_context)
+
+    def _fallback(self, result, message, user_profile):
+        reply, _ = self.services.fallback_responder.respond(result["user_id"], message, user_profile)
+        return dict(result, outcome="fallback", reply=reply)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["seconds"] = round(stats["seconds"], 3)
+        stats["items_per_second"] = round(stats["items"] / stats["seconds"], 2) if stats["seconds"] else 0.0
+        return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Answer (user_id, message) items from NDJSON through the chat pipeline")
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON file of {user_id, message, id?} items (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON results (default: stdout)")
+    parser.add_argument("--concurrency", type=int, help="users answered at once (default: BATCH_CONCURRENCY)")
+    parser.add_argument("--write-size", type=int, help="exchanges per database transaction (default: BATCH_WRITE_SIZE)")
+    parser.add_argument("--max-items", type=int, default=10 ** 9, help="refuse larger inputs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    with source:
+        items = parse_ndjson(source)
+
+    from app import create_app
+    flask_app = create_app(Config)
+    services = flask_app.extensions['chatbot']
+    batch = BatchChat(services, concurrency=args.concurrency, write_size=args.write_size, max_items=args.max_items)
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        with flask_app.app_context(), output:
+            for result in batch.run(items, rate_limit=False):
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+    finally:
+        services.close()
@@ -0,0 +1,286 @@
+"""Micro-benchmarks for the per-message hot paths.
+
+Each benchmark calls one function over and over on a synthetic dataset
+(see synthetic_data.py) and records:
+
+  ops_per_sec           best of `repeat` timed rounds of at least min_time
+  mean_us               1e6 / ops_per_sec
+  alloc_peak_bytes      median peak of Python allocations during one call
+  alloc_retained_bytes  Python memory still held after a call, per call
+
+Allocations come from tracemalloc, so they cover Python objects only, not
+SQLite's own C allocations. Users are drawn in proportion to their memory
+count, so heavy users are read as often as they are in production.
+
+  python benchmarks.py --users 100000                # run, write bench_results.json
+  python benchmarks.py --save-baseline               # ...and store it as the baseline
+  python benchmarks.py --compare --threshold 0.15    # exit 1 on regressions
+
+The dataset is generated once per (users, seed) into bench_data/ and
+copied for every run, since the write benchmarks modify it.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import logging
+from datetime import datetime, timezone
+from database import MemoryManager as DatabaseManager
+from emotion_engine import EmotionEngine
+from load_test import MessageMix
+from memory_manager import MemoryManager as ChatMemoryManager
+from summarizer import DAILY
+from wire_protocol import COMPACT, LEGACY, WireProtocol
+import synthetic_data
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "bench_data"
+RESULTS_PATH = "bench_results.json"
+BASELINE_PATH = "benchmark_baseline.json"
+# Run-to-run noise on a shared VM is 10-30% for the sub-10us benchmarks;
+# compare against a baseline recorded on the same machine
+DEFAULT_THRESHOLD = 0.25  # slower by more than 25% is a regression
+DEFAULT_ALLOC_THRESHOLD = 0.25
+
+class Benchmark:
+    """A named callable taking the iteration number"""
+
+    def __init__(self, name, func, group):
+        self.name = name
+        self.func = func
+        self.group = group
+
+def _time_round(func, min_time, min_ops):
+    ops = 0
+    start = time.perf_counter()
+    while True:
+        func(ops)
+        ops += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time and ops >= min_ops:
+            return ops / elapsed
+
+def _allocations(func, calls):
+    peaks = []
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        for i in range(calls):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            func(i)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return int(statistics.median(peaks)), max(0, int((retained - baseline) / calls))
+
+def measure(benchmark, min_time=0.2, repeat=5, min_ops=10, alloc_calls=50):
+    """Timing and allocation figures for one benchmark"""
+    benchmark.func(0)  # warm caches and lazy imports
+    best = max(_time_round(benchmark.func, min_time, min_ops) for _ in range(repeat))
+    peak, retained = _allocations(benchmark.func, alloc_calls)
+    return {
+        "group": benchmark.group,
+        "ops_per_sec": round(best, 1),
+        "mean_us": round(1e6 / best, 2),
+        "alloc_peak_bytes": peak,
+        "alloc_retained_bytes": retained
+    }
+
+def build_benchmarks(db, users, messages, seed=1):
+    """Benchmarks over an open database and a sample of its user ids"""
+    # app is imported here: importing it builds the Flask app (lazily, no I/O)
+    from app import get_system_prompt
+    from socketio import packet
+
+    rng = random.Random(seed)
+    engine = EmotionEngine()
+    chat_memory = ChatMemoryManager(db)
+    n = len(users)
+    texts = [message for _, message in messages]
+    emotional = [engine.get_emotional_response(text) for text in texts[:256]]
+    contexts = [chat_memory.get_conversation_context(user_id, max_exchanges=3) for user_id in users[:256]]
+    formatted = [chat_memory.format_context_for_prompt(context, context["user_profile"]) for context in contexts]
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    like = [f"bench item {i}" for i in range(8)]
+
+    replies = [{'message': texts[i], 'emotional_context': emotional[i], 'message_id': f"{i:08x}-bench"} for i in range(len(emotional))]
+    legacy, compact = WireProtocol(LEGACY), WireProtocol(COMPACT)
+
+    def user(i):
+        return users[i % n]
+
+    def event_packet(protocol, event, payload):
+        # What a Socket.IO emit serializes: payload conversion plus the packet JSON
+        return packet.Packet(packet.EVENT, data=[event, protocol.encode(event, payload)]).encode()
+
+    def text(i):
+        return texts[i % len(texts)]
+
+    benchmarks = [
+        Benchmark("emotion.analyze_emotion", lambda i: engine.analyze_emotion(text(i)), "emotion"),
+        Benchmark("emotion.get_emotional_response", lambda i: engine.get_emotional_response(text(i)), "emotion"),
+        Benchmark("memory.extract_user_info", lambda i: chat_memory.extract_user_info(user(i), text(i), "Nice!"), "memory"),
+        Benchmark("memory.get_conversation_context", lambda i: chat_memory.get_conversation_context(user(i), max_exchanges=3), "memory"),
+        Benchmark("memory.format_context_for_prompt",
+                  lambda i: chat_memory.format_context_for_prompt(contexts[i % len(contexts)], contexts[i % len(contexts)]["user_profile"]),
+                  "memory"),
+        Benchmark("app.get_system_prompt",
+                  lambda i: get_system_prompt(formatted[i % len(formatted)], emotional[i % len(emotional)],
+                                              contexts[i % len(contexts)]["user_profile"], chat_memory.prompt_cache),
+                  "app"),
+        # Socket.IO payloads per wire protocol
+        Benchmark("wire.bot_response_legacy", lambda i: event_packet(legacy, 'bot_response', replies[i % len(replies)]), "wire"),
+        Benchmark("wire.bot_response_compact", lambda i: event_packet(compact, 'bot_response', replies[i % len(replies)]), "wire"),
+        Benchmark("wire.bot_token_compact",
+                  lambda i: event_packet(compact, 'bot_token', {'message_id': "0000002a-bench", 'offset': i % 80, 'token': " word"}),
+                  "wire"),
+        # database.MemoryManager reads
+        Benchmark("db.get_user_profile", lambda i: db.get_user_profile(user(i)), "db"),
+        Benchmark("db.get_recent_turns", lambda i: db.get_recent_turns(user(i), 6), "db"),
+        Benchmark("db.get_recent_memories", lambda i: db.get_recent_memories(user(i), 5), "db"),
+        Benchmark("db.get_important_memories", lambda i: db.get_important_memories(user(i), 3), "db"),
+        Benchmark("db.get_memory_summaries", lambda i: db.get_memory_summaries(user(i)), "db"),
+        Benchmark("db.get_summary_set", lambda i: db.get_summary_set(user(i)), "db"),
+        Benchmark("db.get_summary_for_period", lambda i: db.get_summary_for_period(user(i), DAILY, today), "db"),
+        Benchmark("db.get_conversation_history", lambda i: db.get_conversation_history(user(i), days=7), "db"),
+        Benchmark("db.get_conversation_page", lambda i: db.get_conversation_page(user(i), limit=50), "db"),
+        Benchmark("db.get_memory_count", lambda i: db.get_memory_count(user(i)), "db"),
+        Benchmark("db.get_tone_counts", lambda i: db.get_tone_counts(user(i)), "db"),
+        # database.MemoryManager writes (on the run's private copy)
+        Benchmark("db.store_memory",
+                  lambda i: db.store_memory(user(i), f"User: {text(i)[:100]}... | Bot: ok...", "conversation_exchange",
+                                            emotional[i % len(emotional)]),
+                  "db_write"),
+        Benchmark("db.store_turns", lambda i: db.store_turns(user(i), [("user", text(i)), ("assistant", "ok")], tone="friendly"),
+                  "db_write"),
+        Benchmark("db.update_user_profile",
+                  lambda i: db.update_user_profile(user(i), {"preferences": {"likes": [rng.choice(like)]}}),
+                  "db_write")
+    ]
+    return benchmarks
+
+def run_suite(dataset, names=None, min_time=0.2, repeat=5, sample_size=2000, seed=1):
+    """Run the benchmarks (all, or those whose name starts with one of `names`)"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "bench.db")
+        shutil.copyfile(dataset, db_path)
+        db = DatabaseManager(db_path)
+        try:
+            users = synthetic_data.sample_users(db, sample_size, seed)
+            mix = MessageMix(random.Random(seed))
+            messages = [mix.next() for _ in range(1000)]
+            results = {}
+            for benchmark in build_benchmarks(db, users, messages, seed):
+                if names and not any(benchmark.name.startswith(name) for name in names):
+                    continue
+                results[benchmark.name] = measure(benchmark, min_time, repeat)
+                logger.info(f"{benchmark.name}: {results[benchmark.name]['ops_per_sec']} ops/s")
+        finally:
+            db.close()
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "dataset": synthetic_data.dataset_stats(dataset),
+            "min_time": min_time,
+            "repeat": repeat
+        },
+        "results": results
+    }
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD, alloc_threshold=DEFAULT_ALLOC_THRESHOLD, thresholds=None):
+    """Regressions of `current` against `baseline` (both run_suite() outputs).
+
+    A benchmark regresses when its ops/sec falls by more than its threshold
+    (per-benchmark entries in `thresholds` override `threshold`) or its peak
+    allocation grows by more than alloc_threshold. Benchmarks missing from
+    either side are skipped.
+    """
+    thresholds = thresholds or {}
+    regressions = []
+    for name, result in sorted(current["results"].items()):
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        limit = thresholds.get(name, threshold)
+        change = result["ops_per_sec"] / base["ops_per_sec"] - 1 if base["ops_per_sec"] else 0.0
+        if change < -limit:
+            regressions.append({"benchmark": name, "metric": "ops_per_sec", "baseline": base["ops_per_sec"],
+                                "current": result["ops_per_sec"], "change": round(change, 4)})
+        # Ignore noise on tiny allocations (interned strings, free lists)
+        base_alloc = max(base["alloc_peak_bytes"], 256)
+        alloc_change = result["alloc_peak_bytes"] / base_alloc - 1
+        if alloc_change > alloc_threshold:
+            regressions.append({"benchmark": name, "metric": "alloc_peak_bytes", "baseline": base["alloc_peak_bytes"],
+                                "current": result["alloc_peak_bytes"], "change": round(alloc_change, 4)})
+    return regressions
+
+def parse_thresholds(values):
+    """{"name": fraction} from NAME=FRACTION command-line values"""
+    thresholds = {}
+    for value in values or []:
+        name, _, fraction = value.partition("=")
+        thresholds[name] = float(fraction)
+    return thresholds
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the chat hot paths")
+    parser.add_argument("--users", type=int, default=100000, help="synthetic dataset size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="where generated datasets are cached")
+    parser.add_argument("--only", nargs="*", help="benchmark name prefixes to run (e.g. db. emotion.)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed round")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds; the best one counts")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--compare", action="store_true", help="fail on regressions against the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed ops/sec drop (0.25 = 25%%)")
+    parser.add_argument("--alloc-threshold", type=float, default=DEFAULT_ALLOC_THRESHOLD, help="allowed peak allocation growth")
+    parser.add_argument("--benchmark-threshold", action="append", metavar="NAME=FRACTION",
+                        help="per-benchmark ops/sec threshold, e.g. db.store_memory=0.4")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    dataset = synthetic_data.ensure_dataset(args.data_dir, args.users, args.seed)
+    report = run_suite(dataset, args.only, args.min_time, args.repeat, seed=args.seed)
+    write_json(args.output, report)
+    for name, result in report["results"].items():
+        print(f"{name:40s} {result['ops_per_sec']:>12.1f} ops/s {result['mean_us']:>10.2f} us "
+              f"{result['alloc_peak_bytes']:>9d} B peak")
+    if args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"Saved baseline to {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+            sys.exit(2)
+        regressions = compare(report, load_json(args.baseline), args.threshold, args.alloc_threshold,
+                              parse_thresholds(args.benchmark_threshold))
+        for regression in regressions:
+            print(f"REGRESSION {regression['benchmark']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']} ({regression['change']:+.1%})", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
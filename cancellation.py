@@ -0,0 +1,119 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SUPERSEDED = "superseded"
+DISCONNECTED = "disconnected"
+
+class Generation:
+    """Cancellation handle of one user message being answered.
+
+    The generation polls cancelled() between tokens and stops when it turns
+    true. A disconnect only orphans the handle: it is cancelled once `grace`
+    seconds pass without a reconnected client adopting the reply.
+    """
+
+    def __init__(self, user_id, sid, message_id=None, grace=0.0, clock=time.monotonic):
+        self.user_id = user_id
+        self.sid = sid
+        self.message_id = message_id
+        self.grace = grace
+        self.clock = clock
+        self.reason = None
+        self.orphaned_at = None
+        self.generating = False
+
+    def cancel(self, reason):
+        if self.reason is None:
+            self.reason = reason
+
+    def cancelled(self):
+        if self.reason is None and self.orphaned_at is not None and self.clock() - self.orphaned_at >= self.grace:
+            self.reason = DISCONNECTED
+        return self.reason is not None
+
+class ActiveGenerations:
+    """Per-user handles of in-flight replies, cancelled by policy.
+
+    CANCEL_ON_NEW_MESSAGE: a newer message from the same user cancels the
+    reply still running (or still waiting for its turn).
+    CANCEL_ON_DISCONNECT: closing the socket cancels its replies; replies to
+    messages with an id get CANCEL_DISCONNECT_GRACE seconds for the client
+    to reconnect and resume them.
+    """
+
+    def __init__(self, on_new_message=None, on_disconnect=None, disconnect_grace=None, config=Config, clock=time.monotonic):
+        self.on_new_message = config.CANCEL_ON_NEW_MESSAGE if on_new_message is None else on_new_message
+        self.on_disconnect = config.CANCEL_ON_DISCONNECT if on_disconnect is None else on_disconnect
+        self.disconnect_grace = config.CANCEL_DISCONNECT_GRACE if disconnect_grace is None else disconnect_grace
+        self.clock = clock
+        self._active = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "started": 0,
+            SUPERSEDED: 0,
+            DISCONNECTED: 0,
+            "skipped": 0
+        }
+
+    def start(self, user_id, sid, message_id=None):
+        """Register a new generation, cancelling the user's older ones if the policy says so"""
+        grace = self.disconnect_grace if message_id else 0.0
+        generation = Generation(user_id, sid, message_id, grace, self.clock)
+        with self._lock:
+            active = self._active.setdefault(user_id, [])
+            if self.on_new_message:
+                for older in active:
+                    older.cancel(SUPERSEDED)
+            active.append(generation)
+            self.counters["started"] += 1
+        return generation
+
+    def finish(self, generation):
+        with self._lock:
+            active = self._active.get(generation.user_id, [])
+            if generation in active:
+                active.remove(generation)
+            if not active:
+                self._active.pop(generation.user_id, None)
+            if generation.cancelled():
+                self.counters[generation.reason] += 1
+                if not generation.generating:
+                    # Cancelled before reaching the model: a whole generation saved
+                    self.counters["skipped"] += 1
+
+    @contextmanager
+    def track(self, user_id, sid, message_id=None):
+        generation = self.start(user_id, sid, message_id)
+        try:
+            yield generation
+        finally:
+            self.finish(generation)
+
+    def disconnected(self, sid):
+        """The socket `sid` is gone: orphan its generations"""
+        if not self.on_disconnect:
+            return
+        now = self.clock()
+        with self._lock:
+            for active in self._active.values():
+                for generation in active:
+                    if generation.sid == sid and generation.orphaned_at is None:
+                        generation.orphaned_at = now
+
+    def adopt(self, user_id, message_id, sid):
+        """A reconnected client follows the reply to `message_id`: keep it running"""
+        with self._lock:
+            for generation in self._active.get(user_id, []):
+                if generation.message_id == message_id and not generation.cancelled():
+                    generation.orphaned_at = None
+                    generation.sid = sid
+
+    def stats(self):
+        with self._lock:
+            active = sum(len(generations) for generations in self._active.values())
+            return dict(self.counters, active=active)
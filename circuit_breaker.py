@@ -0,0 +1,153 @@
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the backend while the circuit is open"""
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a sliding window of recent calls.
+
+    The breaker trips when, over the last `window` calls (and at least
+    `min_calls` of them), the share of failures reaches `failure_rate` or
+    the share of calls slower than `slow_call_seconds` reaches
+    `slow_call_rate`. While open every call fails fast with
+    CircuitOpenError. After `open_seconds` up to `half_open_calls` probes
+    are let through; if they all succeed the breaker closes, any failure
+    opens it again.
+
+    Every state change starts a new epoch. A call is judged against the
+    state it was admitted in: one that finishes after the breaker moved on
+    (e.g. a slow call from before a trip) only updates the counters.
+    """
+
+    def __init__(self, name="llm", window=20, min_calls=5, failure_rate=0.5,
+                 slow_call_seconds=10.0, slow_call_rate=0.5, open_seconds=15.0,
+                 half_open_calls=1, clock=time.monotonic):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=window)  # (failed, slow) per call
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._epoch = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.counters = {
+            "calls": 0,
+            "failures": 0,
+            "slow_calls": 0,
+            "short_circuited": 0,
+            "opened": 0
+        }
+
+    def call(self, fn, *args, **kwargs):
+        """Invoke fn through the breaker"""
+        token = self.admit()
+        start = self.clock()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(token, failed=True, elapsed=self.clock() - start)
+            raise
+        self.record(token, failed=False, elapsed=self.clock() - start)
+        return result
+
+    def allow_request(self):
+        """True if a call would currently be attempted (does not reserve a probe)"""
+        with self._lock:
+            self._maybe_half_open()
+            if self.state == OPEN:
+                return False
+            if self.state == HALF_OPEN:
+                return self._probes_in_flight < self.half_open_calls
+            return True
+
+    def admit(self):
+        """Admit one call, or raise CircuitOpenError; pass the token to record()"""
+        with self._lock:
+            self._maybe_half_open()
+            if self.state == OPEN or (
+                self.state == HALF_OPEN and self._probes_in_flight >= self.half_open_calls
+            ):
+                self.counters["short_circuited"] += 1
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            probe = self.state == HALF_OPEN
+            if probe:
+                self._probes_in_flight += 1
+            self.counters["calls"] += 1
+            return (self._epoch, probe)
+
+    def _maybe_half_open(self):
+        if self.state == OPEN and self.clock() - self._opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._epoch += 1
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+            logger.info(f"Circuit {self.name} half-open, probing backend")
+
+    def record(self, token, failed, elapsed):
+        """Outcome of a call admitted with `token`"""
+        epoch, probe = token
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if failed:
+                self.counters["failures"] += 1
+            if slow:
+                self.counters["slow_calls"] += 1
+
+            if epoch != self._epoch:
+                # Admitted before the last state change; says nothing about now
+                return
+
+            if probe:
+                self._probes_in_flight -= 1
+                if failed or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self.state = CLOSED
+                        self._epoch += 1
+                        self._calls.clear()
+                        logger.info(f"Circuit {self.name} closed, backend recovered")
+                return
+
+            self._calls.append((failed, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            total = len(self._calls)
+            failures = sum(1 for f, _ in self._calls if f)
+            slow_calls = sum(1 for _, s in self._calls if s)
+            if failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._epoch += 1
+        self._opened_at = self.clock()
+        self._calls.clear()
+        self.counters["opened"] += 1
+        logger.warning(f"Circuit {self.name} opened; failing fast for {self.open_seconds}s")
+
+    def stats(self):
+        with self._lock:
+            self._maybe_half_open()
+            stats = dict(self.counters)
+            stats["state"] = self.state
+            return stats
@@ -8,8 +8,14 @@ class Config:
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")  # Changed to mistral for speed
     
+    # Flask configuration
+    FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "dev-secret-key-change-in-production")
+    
     # Database configuration
     SQLITE_DB = os.getenv("SQLITE_DB", "chatbot_memory.db")
+    # Users are spread over this many SQLite files by user_id hash. Once
+    # resharded (python sharding.py --to N) the recorded count wins
+    SQLITE_SHARDS = int(os.getenv("SQLITE_SHARDS", 1))
     
     # Chatbot personality
     BOT_NAME = "Aria"
@@ -19,7 +25,21 @@ class Config:
     # Memory settings
     MEMORY_SUMMARY_THRESHOLD = 5
     LONG_TERM_MEMORY_DAYS = 90  # Increased for long-term memory
-    MAX_MEMORIES_PER_USER = 1000
+    MAX_MEMORIES_PER_USER = int(os.getenv("MAX_MEMORIES_PER_USER", 1000))
+    # Over quota, the lowest-value memories go first: value is importance,
+    # plus MENTION_WEIGHT per doubling of restatements, minus one per DECAY_DAYS of age
+    MEMORY_EVICTION_SLACK = 50  # rows allowed past the cap before a batch eviction
+    MEMORY_EVICTION_CANDIDATES = 4  # candidates read per row evicted
+    MEMORY_MENTION_WEIGHT = 0.5
+    MEMORY_AGE_DECAY_DAYS = 30
+    MAX_TURNS_PER_USER = 200  # raw chat turns kept for prompt history
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 500))  # rows per keyset page
+    HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", 2000))
+    HISTORY_MAX_ROWS = int(os.getenv("HISTORY_MAX_ROWS", 1000))  # cap for get_conversation_history
+    DEBUG_STREAM_MAX_ROWS = int(os.getenv("DEBUG_STREAM_MAX_ROWS", 20000))  # per /history request
+    DEBUG_API_TOKEN = os.getenv("DEBUG_API_TOKEN", "")  # required by /debug/user/<id>/history as "Authorization: Bearer <token>"; unset disables it
+    # Index builds on tables bigger than this run in background maintenance, not at startup
+    MIGRATION_ONLINE_MIN_ROWS = int(os.getenv("MIGRATION_ONLINE_MIN_ROWS", 50000))
     
     # Emotional settings
     EMOTION_UPDATE_INTERVAL = 3
@@ -31,4 +51,125 @@ class Config:
     
     # Response diversity settings
     MAX_RESPONSE_LENGTH = 150  # characters for concise responses
-    MIN_RESPONSE_LENGTH = 20   # characters for meaningful responses
\ No newline at end of file
+    MIN_RESPONSE_LENGTH = 20   # characters for meaningful responses
+    MAX_RESPONSE_SENTENCES = 3  # generation is stopped once this many sentences are out
+    STOP_SEQUENCES = ["\nUser:", "\nAssistant:", "\n\n\n"]  # sent to Ollama as options.stop
+
+    # Admission control: per-user / per-IP token buckets and a global cap on
+    # concurrent Ollama generations. Over capacity we answer with a template
+    RATE_LIMIT_USER_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", 20))
+    RATE_LIMIT_USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", 5))
+    RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", 60))
+    RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", 15))
+    MAX_INFLIGHT_GENERATIONS = int(os.getenv("MAX_INFLIGHT_GENERATIONS", 4))
+    MAX_QUEUED_GENERATIONS = int(os.getenv("MAX_QUEUED_GENERATIONS", 16))
+    MAX_QUEUE_WAIT = float(os.getenv("MAX_QUEUE_WAIT", 5))  # seconds before shedding
+
+    # Circuit breaker around the Ollama client: trip on failure rate or slow
+    # calls over a sliding window, fail fast while open, probe after cooldown
+    BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 20))
+    BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 5))
+    BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", 0.5))
+    BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 10))
+    BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", 0.8))
+    BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 15))
+    BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", 1))
+
+    # Model routing: messages are scored 0-1 for complexity and sent to the
+    # first tier whose max_score covers them (small talk -> small model).
+    # A tier that times out or errors escalates to the next one up
+    OLLAMA_SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL", OLLAMA_MODEL)
+    ROUTER_SMALL_MAX_SCORE = float(os.getenv("ROUTER_SMALL_MAX_SCORE", 0.35))
+    MODEL_TIERS = [
+        {
+            "name": "small",
+            "model": OLLAMA_SMALL_MODEL,
+            "num_ctx": 1024,
+            "num_predict": 80,
+            "timeout": float(os.getenv("OLLAMA_SMALL_TIMEOUT", 10)),
+            "max_score": ROUTER_SMALL_MAX_SCORE
+        },
+        {
+            "name": "large",
+            "model": OLLAMA_MODEL,
+            "num_ctx": 2048,
+            "num_predict": 120,
+            "timeout": TIMEOUT,
+            "max_score": 1.0
+        }
+    ]
+
+    # Rolling summaries: finished sessions are summarized in the background;
+    # per user at most SUMMARY_MAX_SESSIONS session rows and SUMMARY_MAX_DAILY
+    # daily rows are kept, older ones fold into a single long-term summary
+    SUMMARY_MAX_SESSIONS = int(os.getenv("SUMMARY_MAX_SESSIONS", 5))
+    SUMMARY_MAX_DAILY = int(os.getenv("SUMMARY_MAX_DAILY", 7))
+    SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", 20))
+    SUMMARY_BATCH_WINDOW = float(os.getenv("SUMMARY_BATCH_WINDOW", 2))  # seconds to gather a batch
+    SUMMARY_USE_LLM = os.getenv("SUMMARY_USE_LLM", "false").lower() == "true"
+    SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", OLLAMA_SMALL_MODEL)
+
+    # LLM fact extraction (fact_extraction.py): messages that may state a
+    # profile fact are queued and sent to the model FACT_BATCH_SIZE at a time,
+    # waiting at most FACT_BATCH_WINDOW seconds to fill a batch. While on, the
+    # loose regex patterns only flag messages for it
+    FACT_EXTRACTION_LLM = os.getenv("FACT_EXTRACTION_LLM", "false").lower() == "true"
+    FACT_EXTRACTION_MODEL = os.getenv("FACT_EXTRACTION_MODEL", OLLAMA_SMALL_MODEL)
+    FACT_BATCH_SIZE = int(os.getenv("FACT_BATCH_SIZE", 16))
+    FACT_BATCH_WINDOW = float(os.getenv("FACT_BATCH_WINDOW", 5))  # seconds
+    FACT_NUM_PREDICT = int(os.getenv("FACT_NUM_PREDICT", 400))  # tokens for a batch's JSON answer
+    FACT_QUEUE_SIZE = int(os.getenv("FACT_QUEUE_SIZE", 10000))  # messages waiting before dropping
+
+    # Cold tier: users inactive this long are moved out of the hot tables into
+    # compressed per-user blobs in ARCHIVE_DB and restored on their next connect
+    ARCHIVE_DB = os.getenv("ARCHIVE_DB", "chatbot_archive.db")
+    ARCHIVE_INACTIVE_DAYS = int(os.getenv("ARCHIVE_INACTIVE_DAYS", 30))
+    ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zlib")  # zlib or lzma
+    ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))  # users per maintenance run
+
+    # Traffic capture: inbound Socket.IO events as JSON lines, written off the
+    # request path (traffic_capture.py) and replayable with replay.py
+    TRAFFIC_CAPTURE = os.getenv("TRAFFIC_CAPTURE", "false").lower() == "true"
+    TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "traffic_capture.jsonl")
+    TRAFFIC_CAPTURE_HASH_PII = os.getenv("TRAFFIC_CAPTURE_HASH_PII", "true").lower() == "true"
+    # Keys the user/message hashes; unset, a random salt is generated once and
+    # kept next to the capture in TRAFFIC_CAPTURE_PATH + ".salt"
+    TRAFFIC_CAPTURE_SALT = os.getenv("TRAFFIC_CAPTURE_SALT", "")
+    TRAFFIC_CAPTURE_QUEUE_SIZE = int(os.getenv("TRAFFIC_CAPTURE_QUEUE_SIZE", 10000))  # events buffered before dropping
+
+    # Replies keyed by (user_id, client message_id): a retried message follows
+    # or replays the existing reply from the client's token offset instead of
+    # generating again
+    REPLY_CACHE_TTL = float(os.getenv("REPLY_CACHE_TTL", 120))  # seconds a finished reply is kept
+    REPLY_CACHE_MAX_ENTRIES = int(os.getenv("REPLY_CACHE_MAX_ENTRIES", 5000))
+
+    # Cancel a reply nobody will read: the generation stops between tokens,
+    # hangs up on Ollama and frees its admission slot
+    CANCEL_ON_NEW_MESSAGE = os.getenv("CANCEL_ON_NEW_MESSAGE", "true").lower() == "true"
+    CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() == "true"
+    CANCEL_DISCONNECT_GRACE = float(os.getenv("CANCEL_DISCONNECT_GRACE", 5))  # seconds to reconnect and resume
+
+    # Socket.IO payloads (wire_protocol.py): clients that don't negotiate a
+    # protocol at connect get this one; 1 keeps the full legacy payloads
+    WIRE_PROTOCOL_DEFAULT = int(os.getenv("WIRE_PROTOCOL_DEFAULT", 1))
+    SOCKETIO_COMPRESSION_THRESHOLD = int(os.getenv("SOCKETIO_COMPRESSION_THRESHOLD", 1024))  # bytes, long-polling only
+
+    # Static files (static_assets.py) are served from memory under
+    # content-hashed names, pre-compressed, and cached this long by browsers
+    STATIC_FOLDER = os.getenv("STATIC_FOLDER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+    STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", 31536000))  # seconds, for hashed names
+
+    # Batch chat (POST /api/chat/batch, python batch_chat.py): many
+    # (user_id, message) items with grouped reads/writes and a bounded fan-out
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000))  # per HTTP request
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", MAX_INFLIGHT_GENERATIONS))  # users answered at once
+    BATCH_WRITE_SIZE = int(os.getenv("BATCH_WRITE_SIZE", 50))  # exchanges per transaction
+    BATCH_API_TOKEN = os.getenv("BATCH_API_TOKEN", "")  # required as "Authorization: Bearer <token>"; unset disables the endpoint
+    # Items admitted per minute across authenticated batches; kept apart from
+    # the per-user chat limit so an imported transcript isn't cut at 5 messages
+    BATCH_RATE_LIMIT_PER_MINUTE = float(os.getenv("BATCH_RATE_LIMIT_PER_MINUTE", 600))
+    BATCH_RATE_LIMIT_BURST = int(os.getenv("BATCH_RATE_LIMIT_BURST", BATCH_MAX_ITEMS))
+
+    # System prompt fragments (prompt_cache.py): persona and tone blocks are
+    # built once, profile blocks kept per user until the profile changes
+    PROMPT_CACHE_MAX_USERS = int(os.getenv("PROMPT_CACHE_MAX_USERS", 10000))
@@ -1,263 +1,416 @@
 import sqlite3
+import base64
 import json
-from datetime import datetime, timedelta
+import math
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from config import Config
+import emotion_codec
+import migrations
 import logging
-import random
 logger = logging.getLogger(__name__)
 
+# Every table holding per-user rows (all keyed or indexed by user_id)
+USER_TABLES = ("user_profiles", "conversation_memories", "memory_summaries", "conversation_turns")
+# Summary tiers in prompt order (get_summary_set)
+SUMMARY_TIERS = ("long_term", "daily", "session")
+# Users per IN (...) list in grouped reads
+CONTEXT_READ_CHUNK = 500
+
+def encode_cursor(created_at, row_id):
+    """Opaque page cursor for the (created_at, id) keyset"""
+    return base64.urlsafe_b64encode(f"{created_at}|{row_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    """(created_at, id) from a page cursor; ValueError if it is malformed"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return created_at, int(row_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+def memory_value(importance, mention_count, age_days):
+    """How much a memory is worth keeping: importance, plus restatements, minus age"""
+    return (
+        (importance or 1)
+        + Config.MEMORY_MENTION_WEIGHT * math.log2(1 + (mention_count or 0))
+        - age_days / Config.MEMORY_AGE_DECAY_DAYS
+    )
+
 class MemoryManager:
-    def __init__(self):
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.SQLITE_DB
+        # The connection is shared by every handler thread, so writes (and the
+        # read-merge-write in update_user_profile) must not interleave
+        self._write_lock = threading.RLock()
         self.setup_sqlite()
         logger.info("Using SQLite for memory storage")
     
     def setup_sqlite(self):
-        """Setup SQLite database for all memory storage"""
-        self.conn = sqlite3.connect(Config.SQLITE_DB, check_same_thread=False)
+        """Open the database and bring its schema up to date (see migrations.py)"""
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self.deferred_migrations = migrations.migrate(self.conn)
+    
+    def run_online_migrations(self):
+        """Build indexes deferred at startup because their table was large"""
+        try:
+            return migrations.run_online(self.conn, self._write_lock)
+        except Exception as e:
+            logger.error(f"Error running online migrations on {self.db_path}: {e}")
+            return 0
+    
+    def close(self):
+        self.conn.close()
+    
+    @property
+    def shards(self):
+        """A single file is a one-shard store (see sharding.ShardedMemoryManager)"""
+        return [self]
+    
+    def shard_for(self, user_id):
+        return self
+    
+    @contextmanager
+    def pinned(self, user_id):
+        """The store holding `user_id`, kept in place for the duration of the block"""
+        yield self
+    
+    @contextmanager
+    def pinned_many(self, user_ids):
+        """[(store, user_ids)] for a group of users, as pinned() does for one"""
+        yield [(self, list(user_ids))]
+    
+    def list_users(self):
+        """Every user_id with rows in this file"""
         cursor = self.conn.cursor()
-        
-        # Create tables with proper schema
-        tables = [
-            '''CREATE TABLE IF NOT EXISTS user_profiles (
-                user_id TEXT PRIMARY KEY,
-                name TEXT,
-                preferences TEXT,
-                personality_traits TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )''',
-            '''CREATE TABLE IF NOT EXISTS conversation_memories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                memory_text TEXT,
-                memory_type TEXT,
-                emotional_context TEXT,
-                importance INTEGER DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES user_profiles (user_id)
-            )''',
-            '''CREATE TABLE IF NOT EXISTS memory_summaries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                summary_text TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES user_profiles (user_id)
-            )''',
-            '''CREATE TABLE IF NOT EXISTS recent_memories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                memory_data TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES user_profiles (user_id)
-            )'''
-        ]
-        
-        for table in tables:
-            cursor.execute(table)
-        
-        # Create indexes for better performance
-        indexes = [
-            'CREATE INDEX IF NOT EXISTS idx_user_memories ON conversation_memories(user_id)',
-            'CREATE INDEX IF NOT EXISTS idx_user_recent ON recent_memories(user_id, created_at)',
-            'CREATE INDEX IF NOT EXISTS idx_user_summaries ON memory_summaries(user_id)',
-            'CREATE INDEX IF NOT EXISTS idx_memory_cleanup ON conversation_memories(created_at)',
-            'CREATE INDEX IF NOT EXISTS idx_memory_importance ON conversation_memories(importance)',
-            'CREATE INDEX IF NOT EXISTS idx_user_profile_updated ON user_profiles(updated_at)'
-        ]
-        
-        for index in indexes:
-            cursor.execute(index)
-        
-        self.conn.commit()
+        cursor.execute(" UNION ".join(f"SELECT user_id FROM {table}" for table in USER_TABLES))
+        return [row[0] for row in cursor.fetchall() if row[0] is not None]
+    
+    def vacuum(self):
+        """Rebuild the file to return space freed by cleanup and archival"""
+        with self._write_lock:
+            try:
+                self.conn.execute("VACUUM")
+                return True
+            except Exception as e:
+                logger.error(f"Error vacuuming {self.db_path}: {e}")
+                return False
     
     def cleanup_old_memories(self):
         """Clean up old memories to maintain performance but keep important ones"""
-        try:
-            cursor = self.conn.cursor()
-            # Keep important memories longer
-            cutoff_date_important = (datetime.now() - timedelta(days=Config.LONG_TERM_MEMORY_DAYS * 2)).strftime('%Y-%m-%d %H:%M:%S')
-            cutoff_date_normal = (datetime.now() - timedelta(days=Config.LONG_TERM_MEMORY_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+        with self._write_lock:
+            try:
+                cursor = self.conn.cursor()
+                # Keep important memories longer
+                cutoff_date_important = (datetime.now() - timedelta(days=Config.LONG_TERM_MEMORY_DAYS * 2)).strftime('%Y-%m-%d %H:%M:%S')
+                cutoff_date_normal = (datetime.now() - timedelta(days=Config.LONG_TERM_MEMORY_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
             
-            # Delete old normal importance memories
-            cursor.execute(
-                "DELETE FROM conversation_memories WHERE created_at < ? AND importance < 2",
-                (cutoff_date_normal,)
-            )
+                # Delete old normal importance memories
+                cursor.execute(
+                    "DELETE FROM conversation_memories WHERE created_at < ? AND importance < 2",
+                    (cutoff_date_normal,)
+                )
             
-            # Delete old important memories (keep these longer)
-            cursor.execute(
-                "DELETE FROM conversation_memories WHERE created_at < ? AND importance >= 2",
-                (cutoff_date_important,)
-            )
+                # Delete old important memories (keep these longer)
+                cursor.execute(
+                    "DELETE FROM conversation_memories WHERE created_at < ? AND importance >= 2",
+                    (cutoff_date_important,)
+                )
             
-            # Clean up recent memories
-            cursor.execute(
-                "DELETE FROM recent_memories WHERE created_at < ?",
-                (cutoff_date_normal,)
-            )
+                cursor.execute(
+                    "DELETE FROM conversation_turns WHERE created_at < ?",
+                    (cutoff_date_normal,)
+                )
             
-            self.conn.commit()
-            logger.info("Cleaned up old memories")
-        except Exception as e:
-            logger.error(f"Error cleaning up memories: {e}")
+                self.conn.commit()
+                logger.info("Cleaned up old memories")
+            except Exception as e:
+                logger.error(f"Error cleaning up memories: {e}")
     
     def get_user_profile(self, user_id):
         """Retrieve user profile from database"""
         try:
             cursor = self.conn.cursor()
             cursor.execute(
-                "SELECT name, preferences, personality_traits, updated_at FROM user_profiles WHERE user_id = ?",
+                "SELECT user_id, name, preferences, personality_traits, updated_at, version FROM user_profiles WHERE user_id = ?",
                 (user_id,)
             )
             result = cursor.fetchone()
             
             if result:
-                return {
-                    "name": result["name"],
-                    "preferences": json.loads(result["preferences"]) if result["preferences"] else {},
-                    "personality_traits": json.loads(result["personality_traits"]) if result["personality_traits"] else {},
-                    "last_updated": result["updated_at"]
-                }
+                return self._profile_from_row(result)
             return None
         except Exception as e:
             logger.error(f"Error getting user profile: {e}")
             return None
     
+    def _profile_from_row(self, result):
+        return {
+            "user_id": result["user_id"],
+            "name": result["name"],
+            "preferences": json.loads(result["preferences"]) if result["preferences"] else {},
+            "personality_traits": json.loads(result["personality_traits"]) if result["personality_traits"] else {},
+            "last_updated": result["updated_at"],
+            "version": result["version"]
+        }
+    
     def update_user_profile(self, user_id, updates):
         """Update or create user profile with enhanced preference handling"""
-        try:
-            cursor = self.conn.cursor()
+        with self._write_lock:
+            try:
+                cursor = self.conn.cursor()
             
-            # Check if user exists and get current profile
-            cursor.execute("SELECT preferences, personality_traits FROM user_profiles WHERE user_id = ?", (user_id,))
-            existing = cursor.fetchone()
+                # Check if user exists and get current profile
+                cursor.execute("SELECT preferences, personality_traits FROM user_profiles WHERE user_id = ?", (user_id,))
+                existing = cursor.fetchone()
             
-            # Merge preferences if they exist
-            current_prefs = {}
-            current_traits = {}
+                # Merge preferences if they exist
+                current_prefs = {}
+                current_traits = {}
             
-            if existing:
-                if existing["preferences"]:
-                    try:
-                        current_prefs = json.loads(existing["preferences"])
-                    except json.JSONDecodeError:
-                        current_prefs = {}
-                if existing["personality_traits"]:
-                    try:
-                        current_traits = json.loads(existing["personality_traits"])
-                    except json.JSONDecodeError:
-                        current_traits = {}
+                if existing:
+                    if existing["preferences"]:
+                        try:
+                            current_prefs = json.loads(existing["preferences"])
+                        except json.JSONDecodeError:
+                            current_prefs = {}
+                    if existing["personality_traits"]:
+                        try:
+                            current_traits = json.loads(existing["personality_traits"])
+                        except json.JSONDecodeError:
+                            current_traits = {}
             
-            # Update preferences with new values
-            if "preferences" in updates:
-                for key, value in updates["preferences"].items():
-                    if key in current_prefs and isinstance(current_prefs[key], list) and isinstance(value, list):
-                        # Merge lists, avoiding duplicates
-                        current_prefs[key] = list(set(current_prefs[key] + value))
-                    else:
-                        current_prefs[key] = value
+                # Update preferences with new values
+                if "preferences" in updates:
+                    for key, value in updates["preferences"].items():
+                        if key in current_prefs and isinstance(current_prefs[key], list) and isinstance(value, list):
+                            # Merge lists, avoiding duplicates
+                            current_prefs[key] = list(set(current_prefs[key] + value))
+                        else:
+                            current_prefs[key] = value
             
-            # Update personality traits
-            if "personality_traits" in updates:
-                for key, value in updates["personality_traits"].items():
-                    current_traits[key] = value
+                # Update personality traits
+                if "personality_traits" in updates:
+                    for key, value in updates["personality_traits"].items():
+                        current_traits[key] = value
             
-            set_clauses = []
-            params = []
+                set_clauses = []
+                params = []
             
-            if "name" in updates:
-                set_clauses.append("name = ?")
-                params.append(updates["name"])
+                if "name" in updates:
+                    set_clauses.append("name = ?")
+                    params.append(updates["name"])
             
-            if current_prefs:
-                set_clauses.append("preferences = ?")
-                params.append(json.dumps(current_prefs))
+                if current_prefs:
+                    set_clauses.append("preferences = ?")
+                    params.append(json.dumps(current_prefs))
             
-            if current_traits:
-                set_clauses.append("personality_traits = ?")
-                params.append(json.dumps(current_traits))
+                if current_traits:
+                    set_clauses.append("personality_traits = ?")
+                    params.append(json.dumps(current_traits))
             
-            set_clauses.append("updated_at = CURRENT_TIMESTAMP")
-            params.append(user_id)
+                set_clauses.append("updated_at = CURRENT_TIMESTAMP")
+                set_clauses.append("version = version + 1")
+                params.append(user_id)
             
-            if existing:
-                query = f"UPDATE user_profiles SET {', '.join(set_clauses)} WHERE user_id = ?"
-                cursor.execute(query, params)
-            else:
-                cursor.execute(
-                    "INSERT INTO user_profiles (user_id, name, preferences, personality_traits) VALUES (?, ?, ?, ?)",
-                    (
-                        user_id,
-                        updates.get("name", ""),
-                        json.dumps(current_prefs),
-                        json.dumps(current_traits)
+                if existing:
+                    query = f"UPDATE user_profiles SET {', '.join(set_clauses)} WHERE user_id = ?"
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(
+                        "INSERT INTO user_profiles (user_id, name, preferences, personality_traits, version) VALUES (?, ?, ?, ?, 1)",
+                        (
+                            user_id,
+                            updates.get("name", ""),
+                            json.dumps(current_prefs),
+                            json.dumps(current_traits)
+                        )
                     )
-                )
             
-            self.conn.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Error updating user profile: {e}")
-            return False
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error updating user profile: {e}")
+                return False
     
     def store_memory(self, user_id, memory_text, memory_type, emotional_context, importance=1):
         """Store a new memory for the user"""
+        with self._write_lock:
+            try:
+                cursor = self.conn.cursor()
+                if self._insert_memory(cursor, user_id, memory_text, memory_type, emotional_context, importance):
+                    self._enforce_quota(cursor, user_id)
+                self.conn.commit()
+                return True
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Error storing memory: {e}")
+                return False
+    
+    def _insert_memory(self, cursor, user_id, memory_text, memory_type, emotional_context, importance):
+        """Add a memory row; False if it was a restatement counted on an existing row"""
+        if importance >= 2:
+            # A restated fact counts as a mention of the existing memory
+            cursor.execute(
+                "UPDATE conversation_memories SET mention_count = mention_count + 1 "
+                "WHERE id = (SELECT id FROM conversation_memories "
+                "WHERE user_id = ? AND importance = ? AND memory_text = ? LIMIT 1)",
+                (user_id, importance, memory_text)
+            )
+            if cursor.rowcount:
+                return False
+        # Single write; recency comes from idx_user_memories_recent
+        cursor.execute(
+            f"INSERT INTO conversation_memories (user_id, memory_text, memory_type, importance, {', '.join(emotion_codec.COLUMNS)}) "
+            f"VALUES (?, ?, ?, ?{', ?' * len(emotion_codec.COLUMNS)})",
+            (user_id, memory_text, memory_type, importance) + emotion_codec.encode(emotional_context)
+        )
+        return True
+    
+    def get_memory_count(self, user_id):
+        """Stored memories for a user, from the trigger-maintained counter"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT memory_count FROM user_memory_stats WHERE user_id = ?", (user_id,))
+        result = cursor.fetchone()
+        return result[0] if result else 0
+    
+    def _enforce_quota(self, cursor, user_id):
+        """Evict a user's lowest-value memories once they are over quota.
+        
+        Runs only after MEMORY_EVICTION_SLACK rows past the cap, then brings
+        the user back down to MAX_MEMORIES_PER_USER in one go. Candidates are
+        read in (importance, created_at) order from the importance index, a
+        few times more than needed, and the lowest memory_value() among them
+        is deleted, so the cost depends on the batch, not the history.
+        """
+        count = self.get_memory_count(user_id)
+        if count <= Config.MAX_MEMORIES_PER_USER + Config.MEMORY_EVICTION_SLACK:
+            return 0
+        excess = count - Config.MAX_MEMORIES_PER_USER
+        cursor.execute(
+            "SELECT id, importance, mention_count, created_at FROM conversation_memories "
+            "WHERE user_id = ? ORDER BY importance, created_at, id LIMIT ?",
+            (user_id, excess * Config.MEMORY_EVICTION_CANDIDATES)
+        )
+        now = datetime.now(timezone.utc).replace(tzinfo=None)  # created_at is UTC
+        scored = []
+        for row in cursor.fetchall():
+            try:
+                age_days = (now - datetime.strptime(row["created_at"], '%Y-%m-%d %H:%M:%S')).total_seconds() / 86400
+            except (TypeError, ValueError):
+                age_days = 0
+            scored.append((memory_value(row["importance"], row["mention_count"], age_days), row["id"]))
+        evict = [(row_id,) for _, row_id in sorted(scored)[:excess]]
+        cursor.executemany("DELETE FROM conversation_memories WHERE id = ?", evict)
+        logger.debug(f"Evicted {len(evict)} memories for {user_id}")
+        return len(evict)
+    
+    def enforce_memory_quota(self):
+        """Background pass for users already over quota (e.g. before it existed)"""
         try:
             cursor = self.conn.cursor()
             cursor.execute(
-                "INSERT INTO conversation_memories (user_id, memory_text, memory_type, emotional_context, importance) VALUES (?, ?, ?, ?, ?)",
-                (user_id, memory_text, memory_type, json.dumps(emotional_context), importance)
+                "SELECT user_id FROM user_memory_stats WHERE memory_count > ?",
+                (Config.MAX_MEMORIES_PER_USER + Config.MEMORY_EVICTION_SLACK,)
             )
-            
-            # Store in recent memories with batch cleanup
-            memory_data = {
-                "text": memory_text,
-                "type": memory_type,
-                "emotional_context": emotional_context,
-                "timestamp": datetime.now().isoformat()
-            }
+            evicted = 0
+            for row in cursor.fetchall():
+                with self._write_lock:
+                    evicted += self._enforce_quota(self.conn.cursor(), row[0])
+                    self.conn.commit()
+            return evicted
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Error enforcing memory quota: {e}")
+            return 0
+    
+    def store_turns(self, user_id, turns, tone=None):
+        """Append (role, content) turns for a user in one transaction"""
+        with self._write_lock:
+            try:
+                self._insert_turns(self.conn.cursor(), user_id, turns, tone)
+                self.conn.commit()
+                return True
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Error storing conversation turns: {e}")
+                return False
+    
+    def _insert_turns(self, cursor, user_id, turns, tone):
+        cursor.execute("SELECT MAX(seq) FROM conversation_turns WHERE user_id = ?", (user_id,))
+        seq = cursor.fetchone()[0] or 0
+        rows = []
+        for role, content in turns:
+            seq += 1
+            rows.append((user_id, seq, role, content, tone))
+        cursor.executemany(
+            "INSERT INTO conversation_turns (user_id, seq, role, content, tone) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        # Only the tail is ever loaded; trimming is a primary-key range delete
+        cursor.execute(
+            "DELETE FROM conversation_turns WHERE user_id = ? AND seq <= ?",
+            (user_id, seq - Config.MAX_TURNS_PER_USER)
+        )
+    
+    def store_exchanges(self, exchanges):
+        """Write many users' exchanges in one transaction.
+        
+        Each exchange is a dict with user_id, turns ((role, content) pairs),
+        tone and memory (memory_text, memory_type, emotional_context,
+        importance), stored as store_turns() and store_memory() would.
+        """
+        with self._write_lock:
+            try:
+                cursor = self.conn.cursor()
+                grown = set()
+                for exchange in exchanges:
+                    user_id = exchange["user_id"]
+                    self._insert_turns(cursor, user_id, exchange["turns"], exchange.get("tone"))
+                    if exchange.get("memory") and self._insert_memory(cursor, user_id, *exchange["memory"]):
+                        grown.add(user_id)
+                for user_id in grown:
+                    self._enforce_quota(cursor, user_id)
+                self.conn.commit()
+                return True
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Error storing exchanges: {e}")
+                return False
+    
+    def get_recent_turns(self, user_id, limit=6):
+        """Last `limit` turns, oldest first, as ready-to-send chat messages"""
+        try:
+            cursor = self.conn.cursor()
             cursor.execute(
-                "INSERT INTO recent_memories (user_id, memory_data) VALUES (?, ?)",
-                (user_id, json.dumps(memory_data))
+                "SELECT role, content FROM conversation_turns WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+                (user_id, limit)
             )
-            
-            # Batch cleanup every 10 inserts
-            if random.random() < 0.1:  # 10% chance to cleanup
-                cursor.execute(
-                    "DELETE FROM recent_memories WHERE id NOT IN ("
-                    "SELECT id FROM recent_memories "
-                    "WHERE user_id = ? "
-                    "ORDER BY created_at DESC "
-                    "LIMIT 100"  # Increased limit for better context
-                    ") AND user_id = ?",
-                    (user_id, user_id)
-                )
-            
-            self.conn.commit()
-            return True
+            rows = cursor.fetchall()
+            return [{"role": row[0], "content": row[1]} for row in reversed(rows)]
         except Exception as e:
-            logger.error(f"Error storing memory: {e}")
-            return False
+            logger.error(f"Error getting conversation turns: {e}")
+            return []
     
     def get_recent_memories(self, user_id, limit=10):
         """Get recent memories from SQLite"""
         try:
             cursor = self.conn.cursor()
             cursor.execute(
-                "SELECT memory_data FROM recent_memories WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                f"SELECT memory_text, memory_type, created_at, {', '.join(emotion_codec.COLUMNS)} FROM conversation_memories "
+                "WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
                 (user_id, limit)
             )
             results = cursor.fetchall()
             
-            memories = []
-            for result in results:
-                try:
-                    memories.append(json.loads(result["memory_data"]))
-                except json.JSONDecodeError:
-                    continue
-            
-            return memories
+            return [{
+                "text": result["memory_text"],
+                "type": result["memory_type"],
+                "emotional_context": emotion_codec.decode(result[3:]),
+                "timestamp": result["created_at"]
+            } for result in results]
         except Exception as e:
             logger.error(f"Error getting recent memories: {e}")
             return []
@@ -267,69 +420,297 @@ class MemoryManager:
         try:
             cursor = self.conn.cursor()
             cursor.execute(
-                "SELECT memory_text, memory_type, emotional_context FROM conversation_memories WHERE user_id = ? AND importance >= 2 ORDER BY importance DESC, created_at DESC LIMIT ?",
+                f"SELECT memory_text, memory_type, {', '.join(emotion_codec.COLUMNS)} FROM conversation_memories WHERE user_id = ? AND importance >= 2 ORDER BY importance DESC, created_at DESC, id DESC LIMIT ?",
                 (user_id, limit)
             )
             results = cursor.fetchall()
             
-            memories = []
-            for result in results:
-                try:
-                    memories.append({
-                        "text": result["memory_text"],
-                        "type": result["memory_type"],
-                        "emotional_context": json.loads(result["emotional_context"]) if result["emotional_context"] else {}
-                    })
-                except json.JSONDecodeError:
-                    continue
-            
-            return memories
+            return [{
+                "text": result["memory_text"],
+                "type": result["memory_type"],
+                "emotional_context": emotion_codec.decode(result[2:])
+            } for result in results]
         except Exception as e:
             logger.error(f"Error getting important memories: {e}")
             return []
     
-    def create_memory_summary(self, user_id, summary_text):
-        """Create a summary of recent memories"""
+    def get_tone_counts(self, user_id=None):
+        """Number of stored exchanges per tone, aggregated in SQL"""
         try:
             cursor = self.conn.cursor()
-            cursor.execute(
-                "INSERT INTO memory_summaries (user_id, summary_text) VALUES (?, ?)",
-                (user_id, summary_text)
-            )
-            self.conn.commit()
-            return True
+            query = "SELECT tone_code, COUNT(*) FROM conversation_memories"
+            params = ()
+            if user_id is not None:
+                query += " WHERE user_id = ?"
+                params = (user_id,)
+            cursor.execute(query + " GROUP BY tone_code", params)
+            # Legacy NULL rows, code 0 and unknown codes all read as "neutral"
+            counts = {}
+            for code, count in cursor.fetchall():
+                tone = emotion_codec.decode_tone(code)
+                counts[tone] = counts.get(tone, 0) + count
+            return counts
         except Exception as e:
-            logger.error(f"Error creating memory summary: {e}")
-            return False
+            logger.error(f"Error getting tone counts: {e}")
+            return {}
+    
+    def get_emotion_arrays(self, user_id=None):
+        """(tone_codes, scores) NumPy arrays for analytics; requires numpy"""
+        cursor = self.conn.cursor()
+        query = f"SELECT {', '.join(emotion_codec.COLUMNS)} FROM conversation_memories"
+        params = ()
+        if user_id is not None:
+            query += " WHERE user_id = ?"
+            params = (user_id,)
+        cursor.execute(query + " ORDER BY id", params)
+        return emotion_codec.to_arrays(cursor.fetchall())
+    
+    def create_memory_summary(self, user_id, summary_text, tier="session", summary_data=None, period=None):
+        """Create a summary of recent memories"""
+        with self._write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    "INSERT INTO memory_summaries (user_id, summary_text, tier, period, summary_data) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, summary_text, tier, period, json.dumps(summary_data) if summary_data else None)
+                )
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error creating memory summary: {e}")
+                return False
+    
+    def _summary_from_row(self, result):
+        try:
+            data = json.loads(result["summary_data"]) if result["summary_data"] else None
+        except json.JSONDecodeError:
+            data = None
+        return {
+            "id": result["id"],
+            "text": result["summary_text"],
+            "created_at": result["created_at"],
+            "tier": result["tier"] or "session",
+            "period": result["period"],
+            "data": data
+        }
     
-    def get_memory_summaries(self, user_id, limit=3):
-        """Get memory summaries for a user"""
+    def get_memory_summaries(self, user_id, limit=3, tier=None, oldest_first=False):
+        """Get memory summaries for a user, optionally for one tier"""
         try:
             cursor = self.conn.cursor()
-            cursor.execute(
-                "SELECT summary_text, created_at FROM memory_summaries WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
-                (user_id, limit)
-            )
-            results = cursor.fetchall()
+            query = "SELECT id, summary_text, created_at, tier, period, summary_data FROM memory_summaries WHERE user_id = ?"
+            params = [user_id]
+            if tier:
+                query += " AND tier = ?"
+                params.append(tier)
+            query += " ORDER BY COALESCE(period, created_at) {0}, id {0}".format("ASC" if oldest_first else "DESC")
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+            cursor.execute(query, params)
             
-            return [{"text": result["summary_text"], "created_at": result["created_at"]} for result in results]
+            return [self._summary_from_row(result) for result in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Error getting memory summaries: {e}")
             return []
     
-    def get_conversation_history(self, user_id, days=7):
-        """Get conversation history for a specific time period"""
+    def get_summary_set(self, user_id):
+        """Newest long-term, daily and session summary: constant size for prompts"""
+        summaries = []
+        for tier in SUMMARY_TIERS:
+            summaries.extend(self.get_memory_summaries(user_id, 1, tier=tier))
+        return summaries
+    
+    def get_user_contexts(self, user_ids, turns_limit=6, memories_limit=3):
+        """Prompt inputs of many users with one query per table.
+        
+        Returns {user_id: {"user_profile", "recent_conversation",
+        "important_memories", "memory_summaries"}}, each part as the per-user
+        getters return it (profile None if there is none). Users are read
+        CONTEXT_READ_CHUNK at a time to stay under SQLite's variable limit.
+        """
+        contexts = {
+            user_id: {"user_profile": None, "recent_conversation": [], "important_memories": [], "memory_summaries": []}
+            for user_id in user_ids
+        }
+        users = list(contexts)
+        try:
+            cursor = self.conn.cursor()
+            for start in range(0, len(users), CONTEXT_READ_CHUNK):
+                chunk = users[start:start + CONTEXT_READ_CHUNK]
+                marks = ", ".join("?" * len(chunk))
+                cursor.execute(
+                    f"SELECT user_id, name, preferences, personality_traits, updated_at, version FROM user_profiles WHERE user_id IN ({marks})",
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    contexts[row["user_id"]]["user_profile"] = self._profile_from_row(row)
+                
+                cursor.execute(
+                    "SELECT user_id, role, content FROM ("
+                    "SELECT user_id, seq, role, content, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY seq DESC) AS rank "
+                    f"FROM conversation_turns WHERE user_id IN ({marks})"
+                    ") WHERE rank <= ? ORDER BY user_id, seq",
+                    chunk + [turns_limit]
+                )
+                for row in cursor.fetchall():
+                    contexts[row["user_id"]]["recent_conversation"].append({"role": row["role"], "content": row["content"]})
+                
+                columns = ", ".join(emotion_codec.COLUMNS)
+                cursor.execute(
+                    f"SELECT user_id, memory_text, memory_type, {columns} FROM ("
+                    f"SELECT id, user_id, memory_text, memory_type, importance, created_at, {columns}, "
+                    "ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY importance DESC, created_at DESC, id DESC) AS rank "
+                    f"FROM conversation_memories WHERE user_id IN ({marks}) AND importance >= 2"
+                    ") WHERE rank <= ? ORDER BY user_id, rank",
+                    chunk + [memories_limit]
+                )
+                for row in cursor.fetchall():
+                    contexts[row["user_id"]]["important_memories"].append({
+                        "text": row["memory_text"],
+                        "type": row["memory_type"],
+                        "emotional_context": emotion_codec.decode(row[3:])
+                    })
+                
+                tiers = ", ".join("?" * len(SUMMARY_TIERS))
+                cursor.execute(
+                    "SELECT user_id, id, summary_text, created_at, tier, period, summary_data FROM ("
+                    "SELECT *, ROW_NUMBER() OVER (PARTITION BY user_id, tier ORDER BY COALESCE(period, created_at) DESC, id DESC) AS rank "
+                    f"FROM memory_summaries WHERE user_id IN ({marks}) AND tier IN ({tiers})"
+                    ") WHERE rank = 1",
+                    chunk + list(SUMMARY_TIERS)
+                )
+                for row in sorted(cursor.fetchall(), key=lambda row: SUMMARY_TIERS.index(row["tier"])):
+                    contexts[row["user_id"]]["memory_summaries"].append(self._summary_from_row(row))
+            return contexts
+        except Exception as e:
+            logger.error(f"Error getting user contexts: {e}")
+            return {user_id: self._user_context(user_id, turns_limit, memories_limit) for user_id in users}
+    
+    def _user_context(self, user_id, turns_limit, memories_limit):
+        return {
+            "user_profile": self.get_user_profile(user_id),
+            "recent_conversation": self.get_recent_turns(user_id, turns_limit),
+            "important_memories": self.get_important_memories(user_id, memories_limit),
+            "memory_summaries": self.get_summary_set(user_id)
+        }
+    
+    def get_summary_for_period(self, user_id, tier, period):
+        """The single summary row for a (tier, period) bucket, if any"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT id, summary_text, created_at, tier, period, summary_data FROM memory_summaries "
+                "WHERE user_id = ? AND tier = ? AND period IS ? ORDER BY id DESC LIMIT 1",
+                (user_id, tier, period)
+            )
+            result = cursor.fetchone()
+            return self._summary_from_row(result) if result else None
+        except Exception as e:
+            logger.error(f"Error getting summary for period: {e}")
+            return None
+    
+    def replace_summaries(self, user_id, delete_ids, target_id, summary_text, tier, summary_data, period=None):
+        """Atomically fold rows into one summary (updating target_id or inserting)"""
+        with self._write_lock:
+            try:
+                cursor = self.conn.cursor()
+                encoded = json.dumps(summary_data)
+                if target_id:
+                    cursor.execute(
+                        "UPDATE memory_summaries SET summary_text = ?, summary_data = ? WHERE id = ?",
+                        (summary_text, encoded, target_id)
+                    )
+                else:
+                    cursor.execute(
+                        "INSERT INTO memory_summaries (user_id, summary_text, tier, period, summary_data) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, summary_text, tier, period, encoded)
+                    )
+                    target_id = cursor.lastrowid
+                cursor.executemany(
+                    "DELETE FROM memory_summaries WHERE id = ? AND user_id = ?",
+                    [(summary_id, user_id) for summary_id in delete_ids]
+                )
+                self.conn.commit()
+                return target_id
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Error compacting memory summaries: {e}")
+                return None
+    
+    def update_summary_text(self, user_id, summary_id, summary_text):
+        """Replace the text of a summary (e.g. with a model-written version)"""
+        with self._write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    "UPDATE memory_summaries SET summary_text = ? WHERE id = ? AND user_id = ?",
+                    (summary_text, summary_id, user_id)
+                )
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error updating memory summary: {e}")
+                return False
+    
+    def get_conversation_history(self, user_id, days=7, limit=None):
+        """Get conversation history for a specific time period (newest first, at most `limit` rows)"""
         try:
             cursor = self.conn.cursor()
             cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
             
             cursor.execute(
-                "SELECT memory_text, created_at FROM conversation_memories WHERE user_id = ? AND created_at >= ? ORDER BY created_at DESC",
-                (user_id, cutoff_date)
+                "SELECT memory_text, created_at FROM conversation_memories WHERE user_id = ? AND created_at >= ? "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, cutoff_date, limit or Config.HISTORY_MAX_ROWS)
             )
             results = cursor.fetchall()
             
             return [{"text": result["memory_text"], "timestamp": result["created_at"]} for result in results]
         except Exception as e:
             logger.error(f"Error getting conversation history: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def get_conversation_page(self, user_id, after=None, limit=None, since=None):
+        """One page of a user's memories, newest first.
+        
+        Keyset pagination on (created_at, id): `after` is the cursor returned
+        with the previous page, so every page is an index range scan no
+        matter how deep into the history it is. Returns (rows, next_cursor);
+        next_cursor is None on the last page.
+        """
+        limit = max(1, min(limit or Config.HISTORY_PAGE_SIZE, Config.HISTORY_MAX_PAGE_SIZE))
+        query = (
+            f"SELECT id, memory_text, memory_type, importance, created_at, {', '.join(emotion_codec.COLUMNS)} "
+            "FROM conversation_memories WHERE user_id = ?"
+        )
+        params = [user_id]
+        if after:
+            query += " AND (created_at, id) < (?, ?)"
+            params.extend(decode_cursor(after))
+        if since:
+            query += " AND created_at >= ?"
+            params.append(since)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        
+        cursor = self.conn.cursor()
+        cursor.execute(query, params)
+        rows = [{
+            "id": result["id"],
+            "text": result["memory_text"],
+            "type": result["memory_type"],
+            "importance": result["importance"],
+            "emotional_context": emotion_codec.decode(result[5:]),
+            "timestamp": result["created_at"]
+        } for result in cursor.fetchall()]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"]) if len(rows) == limit else None
+        return rows, next_cursor
+    
+    def iter_conversation_history(self, user_id, after=None, since=None, page_size=None):
+        """Every memory of a user, newest first, fetched one page at a time"""
+        while True:
+            rows, after = self.get_conversation_page(user_id, after=after, limit=page_size, since=since)
+            yield from rows
+            if after is None:
+                return
\ No newline at end of file
@@ -0,0 +1,75 @@
+import json
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for analytics
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Stored codes: append new tones at the end, never reorder (0 = unknown)
+TONES = ("friendly", "professional", "empathetic", "playful", "curious")
+TONE_CODES = {tone: code for code, tone in enumerate(TONES, start=1)}
+
+# Order of the score columns; each score is stored as an integer 0..SCORE_SCALE
+EMOTIONS = ("happiness", "sadness", "excitement", "calmness", "curiosity", "empathy")
+SCORE_SCALE = 100  # 0.01 resolution; values <= 127 take one byte in a SQLite record
+
+SCORE_COLUMNS = tuple(f"score_{emotion}" for emotion in EMOTIONS)
+COLUMNS = ("tone_code",) + SCORE_COLUMNS
+
+def encode_tone(tone):
+    return TONE_CODES.get(tone, 0)
+
+def decode_tone(code):
+    if code and 0 < code <= len(TONES):
+        return TONES[code - 1]
+    return "neutral"
+
+def quantize(score):
+    return max(0, min(SCORE_SCALE, int(round(float(score) * SCORE_SCALE))))
+
+def encode(emotional_context):
+    """Column values (tone_code, score_*...) for an emotional context dict.
+
+    Only the tone and the emotion scores are kept; the opener, emoji markers
+    and boolean flags are per-reply decoration and never read back.
+    """
+    emotional_context = emotional_context or {}
+    scores = emotional_context.get("emotion_scores") or {}
+    return (encode_tone(emotional_context.get("tone")),) + tuple(
+        quantize(scores[emotion]) if emotion in scores else None for emotion in EMOTIONS
+    )
+
+def decode(values):
+    """Emotional context dict back from (tone_code, score_*...) values"""
+    tone_code, *scores = values
+    return {
+        "tone": decode_tone(tone_code),
+        "emotion_scores": {
+            emotion: score / SCORE_SCALE
+            for emotion, score in zip(EMOTIONS, scores) if score is not None
+        }
+    }
+
+def encode_json(emotional_context_json):
+    """encode() for a legacy JSON column value; unparseable text encodes as unknown"""
+    try:
+        return encode(json.loads(emotional_context_json) if emotional_context_json else {})
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Unreadable emotional context: {e}")
+        return encode({})
+
+def to_arrays(rows):
+    """Vectorized decode of (tone_code, score_*...) rows for analytics.
+
+    Returns (tone_codes, scores): an int8 vector and an (n, 6) float32 matrix
+    with columns in EMOTIONS order (missing scores become NaN).
+    """
+    if np is None:
+        raise ImportError("numpy is required for vectorized emotion decoding")
+    # NULL scores (None) become NaN in a float array
+    raw = np.array(rows, dtype=np.float32).reshape(-1, len(COLUMNS))
+    tone_codes = np.nan_to_num(raw[:, 0]).astype(np.int8)
+    return tone_codes, raw[:, 1:] / SCORE_SCALE
@@ -135,6 +135,14 @@ class EmotionEngine:
             "{} That reminds me, {}",
             "{} Incidentally, {}"
         ]
+        
+        # Holding lines for when a full model reply isn't available right now
+        self.busy_responses = [
+            "I'm juggling a lot of conversations right now. Give me a moment and send that again?",
+            "My thoughts are a little crowded at the moment. Could you try me again in a few seconds?",
+            "I want to give that a proper answer, but I'm swamped right now. Mind asking again shortly?",
+            "Hang on, you're sending faster than I can think! Try again in a moment?"
+        ]
     
     def analyze_emotion(self, text):
         """Analyze emotional content of text using enhanced keyword matching"""
@@ -284,4 +292,10 @@ class EmotionEngine:
         if not tone:
             tone = random.choice(list(self.tone_profiles.keys()))
         
-        return random.choice(self.tone_profiles[tone]["greeting"])
\ No newline at end of file
+        return random.choice(self.tone_profiles[tone]["greeting"])
+    
+    def get_busy_response(self, text):
+        """Instant template reply used when a message is shed under load"""
+        emotional_context = self.get_emotional_response(text)
+        message = f"{random.choice(self.busy_responses)} {emotional_context['emotional_markers']}"
+        return message, emotional_context
\ No newline at end of file
@@ -0,0 +1,235 @@
+import json
+import queue
+import threading
+import time
+import logging
+from contextlib import nullcontext
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+FACT_TYPES = ("name", "likes", "dislikes", "profession", "location", "relationship")
+RELATIONS = ("wife", "husband", "partner", "boyfriend", "girlfriend", "friend", "mom", "dad", "parent", "sister", "brother")
+MAX_VALUE_LENGTH = 60
+# A batch the admission gate shed is retried this many times, then dropped
+MAX_ATTEMPTS = 3
+
+PROMPT = """Extract facts that each numbered message states about the person who wrote it.
+
+Answer with JSON only, in this form:
+{"facts": [{"message": 1, "type": "likes", "value": "hiking"}]}
+
+"type" is one of: name, likes, dislikes, profession, location, relationship.
+For a relationship, "value" is the person's name and "relation" one of: %s.
+"value" must be words taken from the message. Only include facts the writer
+clearly states about themselves: moods, feelings, plans and guesses are not
+facts ("I'm tired" is not a name, "I do" is not a profession).
+Answer {"facts": []} if there are none.
+
+""" % ", ".join(RELATIONS)
+
+def parse_facts(content, messages):
+    """Valid facts from the model's JSON answer: {index: [fact, ...]} and the number rejected.
+
+    A fact must name a known type and a message of the batch, and its
+    value must appear in that message, so a confused or hallucinating
+    model can't invent profile data.
+    """
+    try:
+        answer = json.loads(content)
+    except (TypeError, ValueError):
+        return {}, 0
+    facts = answer.get("facts") if isinstance(answer, dict) else None
+    if not isinstance(facts, list):
+        return {}, 0
+    accepted = {}
+    rejected = 0
+    for fact in facts:
+        try:
+            index = int(fact["message"]) - 1
+            kind = fact["type"]
+            value = fact["value"].strip().strip(".!?")
+        except (KeyError, TypeError, ValueError, AttributeError):
+            rejected += 1
+            continue
+        relation = fact.get("relation")
+        if (kind not in FACT_TYPES or not 0 <= index < len(messages)
+                or not 0 < len(value) <= MAX_VALUE_LENGTH or value.lower() not in messages[index].lower()
+                or (kind == "relationship" and relation not in RELATIONS)):
+            rejected += 1
+            continue
+        accepted.setdefault(index, []).append({"type": kind, "value": value, "relation": relation})
+    return accepted, rejected
+
+class FactExtractor:
+    """Profile facts extracted by the model, many users' messages per call.
+
+    Complements the regex extractor in memory_manager: messages that might
+    hold a fact are queued by submit() and a background worker sends up to
+    FACT_BATCH_SIZE of them, gathered for at most FACT_BATCH_WINDOW seconds,
+    to the model in one JSON-mode prompt. Each generation takes an admission
+    slot like a chat turn. Parsed facts are merged into the profiles under
+    the user's serializer slot, so they never race the user's own turns.
+    """
+
+    def __init__(self, database, client, model, admission_controller=None, serializer=None, config=Config):
+        self.db = database
+        self.client = client
+        self.model = model
+        self.admission_controller = admission_controller
+        self.serializer = serializer
+        self.batch_size = config.FACT_BATCH_SIZE
+        self.batch_window = config.FACT_BATCH_WINDOW
+        self.num_predict = config.FACT_NUM_PREDICT
+        self._queue = queue.Queue(maxsize=config.FACT_QUEUE_SIZE)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "dropped": 0,
+            "batches": 0,
+            "llm_calls": 0,
+            "llm_errors": 0,
+            "facts": 0,
+            "facts_rejected": 0,
+            "profiles_updated": 0
+        }
+
+    def submit(self, user_id, text):
+        """Queue a user message for extraction; dropped if the queue is full"""
+        try:
+            self._queue.put_nowait((user_id, text, 0))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("submitted")
+        self._ensure_worker()
+        return True
+
+    def flush(self):
+        """Block until everything queued so far has been processed"""
+        self._queue.join()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.counters[name] += amount
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="fact-extractor", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Wait a little for other users' messages so they share the call
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.process(batch)
+            except Exception as e:
+                logger.error(f"Error extracting facts: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def process(self, batch):
+        """Extract and merge facts for [(user_id, text, attempts)]"""
+        self._count("batches")
+        facts = self.extract([text for _, text, _ in batch])
+        if facts is None:
+            self._retry(batch)
+            return
+        by_user = {}
+        for index, found in facts.items():
+            by_user.setdefault(batch[index][0], []).extend(found)
+        for user_id, found in by_user.items():
+            if self.merge(user_id, found):
+                self._count("profiles_updated")
+
+    def _retry(self, batch):
+        # The model is busy or failing; give it a moment before the next try
+        time.sleep(self.batch_window)
+        for user_id, text, attempts in batch:
+            if attempts + 1 >= MAX_ATTEMPTS:
+                self._count("dropped")
+                continue
+            try:
+                self._queue.put_nowait((user_id, text, attempts + 1))
+            except queue.Full:
+                self._count("dropped")
+
+    def extract(self, messages):
+        """{index: [fact]} for the messages, or None if the model was not available"""
+        if self.admission_controller is not None and not self.admission_controller.acquire():
+            return None
+        numbered = "\n".join(f"{i + 1}. {json.dumps(text)}" for i, text in enumerate(messages))
+        try:
+            self._count("llm_calls")
+            response = self.client.chat(
+                model=self.model,
+                messages=[{'role': 'user', 'content': PROMPT + numbered}],
+                format='json',
+                options={'temperature': 0, 'num_predict': self.num_predict}
+            )
+        except Exception as e:
+            logger.warning(f"Fact extraction skipped: {e}")
+            self._count("llm_errors")
+            return None
+        finally:
+            if self.admission_controller is not None:
+                self.admission_controller.release()
+        facts, rejected = parse_facts(response['message']['content'], messages)
+        self._count("facts", sum(len(found) for found in facts.values()))
+        self._count("facts_rejected", rejected)
+        return facts
+
+    def merge(self, user_id, facts):
+        """Add facts the profile doesn't have yet; True if it changed"""
+        with self.serializer.serialize(user_id) if self.serializer else nullcontext():
+            profile = self.db.get_user_profile(user_id) or {"preferences": {}}
+            preferences = profile.get("preferences") or {}
+            updates = {"preferences": {}}
+            memories = []
+            for fact in facts:
+                kind, value = fact["type"], fact["value"]
+                if kind == "name":
+                    name = value.title()
+                    if profile.get("name") != name:
+                        updates["name"] = profile["name"] = name
+                        memories.append((f"User's name is {name}", "personal_info", 3))
+                elif kind in ("likes", "dislikes"):
+                    known = preferences.setdefault(kind, [])
+                    if value.lower() not in (item.lower() for item in known):
+                        known.append(value)
+                        updates["preferences"].setdefault(kind, []).append(value)
+                        memories.append((f"User {kind} {value}", "preference", 2))
+                elif kind == "relationship":
+                    relationships = preferences.setdefault("relationships", {})
+                    if relationships.get(fact["relation"]) != value:
+                        relationships[fact["relation"]] = value
+                        updates["preferences"]["relationships"] = relationships
+                        memories.append((f"User's {fact['relation']} is {value}", "personal_info", 2))
+                elif preferences.get(kind) != value:
+                    preferences[kind] = value
+                    updates["preferences"][kind] = value
+                    text = f"User works as {value}" if kind == "profession" else f"User is from {value}"
+                    memories.append((text, "personal_info", 3 if kind == "profession" else 2))
+            if not memories:
+                return False
+            for text, memory_type, importance in memories:
+                self.db.store_memory(user_id, text, memory_type, {"dominant_emotion": "neutral"}, importance=importance)
+            return self.db.update_user_profile(user_id, updates)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self.counters)
+        stats["queued"] = self._queue.qsize()
+        stats["calls_per_message"] = round(stats["llm_calls"] / stats["submitted"], 3) if stats["submitted"] else 0.0
+        return stats
@@ -0,0 +1,321 @@
+import argparse
+import json
+import random
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Reply material; short sentences so the output controller sees boundaries
+SENTENCES = (
+    "That sounds really interesting!",
+    "I'd love to hear more about it.",
+    "How did that make you feel?",
+    "Honestly, I think you handled it well.",
+    "There's a lot to unpack there.",
+    "Have you tried looking at it from another angle?",
+    "It's completely normal to feel that way.",
+    "What's been the best part so far?",
+    "I remember you mentioned something similar before.",
+    "Let's take it one step at a time."
+)
+
+class FakeOllama:
+    """Timing and failure behaviour of the fake server, plus its counters.
+
+    A generation sleeps prompt_eval_ms plus prompt_token_ms per prompt token
+    (about four characters) before the first token, then token_ms per
+    token; every delay varies by +/- jitter. Failure injection picks at most
+    one fault per request: an HTTP error status up front, an error line in
+    the middle of the stream, or a hang of hang_seconds with no response.
+    """
+
+    def __init__(self, prompt_eval_ms=40, prompt_token_ms=0.02, token_ms=15, tokens=60, jitter=0.2,
+                 failure_rate=0.0, error_status=500, midstream_failure_rate=0.0,
+                 hang_rate=0.0, hang_seconds=60, seed=None):
+        self.prompt_eval_ms = prompt_eval_ms
+        self.prompt_token_ms = prompt_token_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.error_status = error_status
+        self.midstream_failure_rate = midstream_failure_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.counters = {
+            "requests": 0,
+            "completed": 0,
+            "failed": 0,
+            "hung": 0,
+            "cancelled": 0,
+            "tokens_streamed": 0,
+            "tokens_unsent": 0,
+            "active": 0,
+            "peak_active": 0
+        }
+
+    def _jittered(self, ms):
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(0.0, ms * factor) / 1000
+
+    def prompt_eval_delay(self, prompt_chars):
+        return self._jittered(self.prompt_eval_ms + self.prompt_token_ms * prompt_chars / 4)
+
+    def token_delay(self):
+        return self._jittered(self.token_ms)
+
+    def pick_failure(self):
+        """None, "status", "midstream" or "hang" for the next request"""
+        with self._lock:
+            roll = self._random.random()
+        for fault, rate in (("status", self.failure_rate),
+                            ("midstream", self.midstream_failure_rate),
+                            ("hang", self.hang_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def reply_tokens(self, num_predict=None):
+        """Word-sized tokens, as many as `tokens` allows within num_predict"""
+        count = self.tokens if not num_predict or num_predict < 0 else min(self.tokens, num_predict)
+        words = []
+        with self._lock:
+            while len(words) < count:
+                words.extend(self._random.choice(SENTENCES).split())
+        return [word if i == 0 else " " + word for i, word in enumerate(words[:count])]
+
+    def hang(self):
+        # Released early by stop() so shutting the server down never waits
+        self._stopped.wait(self.hang_seconds)
+
+    def stop(self):
+        self._stopped.set()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+            if name == "active":
+                self.counters["peak_active"] = max(self.counters["peak_active"], self.counters["active"])
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+def _timestamp():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """The parts of the Ollama HTTP API the app uses: /api/chat and /api/generate"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        behaviour = self.server.behaviour
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "fake:latest", "model": "fake:latest", "size": 0}]})
+        elif self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-fake"})
+        elif self.path == "/fake/stats":
+            self._send_json(200, behaviour.stats())
+        elif self.path == "/":
+            self._send_json(200, {"status": "Ollama is running"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/api/chat", "/api/generate"):
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        behaviour = self.server.behaviour
+        behaviour.count("requests")
+        behaviour.count("active")
+        try:
+            self._generate(behaviour, request)
+        finally:
+            behaviour.count("active", -1)
+
+    def _generate(self, behaviour, request):
+        failure = behaviour.pick_failure()
+        if failure == "hang":
+            behaviour.count("hung")
+            behaviour.hang()
+            self.close_connection = True
+            return
+        if failure == "status":
+            behaviour.count("failed")
+            self._send_json(behaviour.error_status, {"error": "injected failure"})
+            return
+
+        chat = self.path == "/api/chat"
+        if chat:
+            prompt_chars = sum(len(message.get("content", "")) for message in request.get("messages", []))
+        else:
+            prompt_chars = len(request.get("system", "")) + len(request.get("prompt", ""))
+        model = request.get("model", "fake")
+        tokens = behaviour.reply_tokens((request.get("options") or {}).get("num_predict"))
+
+        start = time.perf_counter()
+        time.sleep(behaviour.prompt_eval_delay(prompt_chars))
+        prompt_eval_ns = int((time.perf_counter() - start) * 1e9)
+
+        def chunk(text, done=False):
+            body = {"model": model, "created_at": _timestamp(), "done": done}
+            if chat:
+                body["message"] = {"role": "assistant", "content": text}
+            else:
+                body["response"] = text
+            return body
+
+        def final(eval_ns):
+            body = chunk("", done=True)
+            body.update({
+                "total_duration": int((time.perf_counter() - start) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": max(1, prompt_chars // 4),
+                "prompt_eval_duration": prompt_eval_ns,
+                "eval_count": len(tokens),
+                "eval_duration": eval_ns
+            })
+            return body
+
+        # Ollama streams unless told otherwise
+        if not request.get("stream", True):
+            time.sleep(sum(behaviour.token_delay() for _ in tokens))
+            if failure == "midstream":
+                behaviour.count("failed")
+                self._send_json(500, {"error": "injected failure"})
+                return
+            body = final(int((time.perf_counter() - start) * 1e9) - prompt_eval_ns)
+            body["message" if chat else "response"] = chunk("".join(tokens))["message" if chat else "response"]
+            behaviour.count("tokens_streamed", len(tokens))
+            behaviour.count("completed")
+            self._send_json(200, body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        try:
+            for token in tokens:
+                if failure == "midstream" and sent == len(tokens) // 2:
+                    behaviour.count("failed")
+                    self._write_line({"error": "injected failure"})
+                    break
+                self._write_line(chunk(token))
+                sent += 1
+                time.sleep(behaviour.token_delay())
+            else:
+                self._write_line(final(int((time.perf_counter() - start) * 1e9) - prompt_eval_ns))
+                behaviour.count("completed")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early (e.g. the output controller had enough)
+            behaviour.count("cancelled")
+            behaviour.count("tokens_unsent", len(tokens) - sent)
+            self.close_connection = True
+        finally:
+            behaviour.count("tokens_streamed", sent)
+
+    def _write_line(self, payload):
+        line = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Local stand-in for Ollama, for load tests that must not need a model or network"""
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), behaviour=None):
+        super().__init__(address, FakeOllamaHandler)
+        self.behaviour = behaviour or FakeOllama()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.behaviour.stop()
+        self.shutdown()
+        self.server_close()
+
+def add_behaviour_arguments(parser):
+    parser.add_argument("--prompt-eval-ms", type=float, default=40, help="fixed delay before the first token")
+    parser.add_argument("--prompt-token-ms", type=float, default=0.02, help="extra delay per prompt token")
+    parser.add_argument("--token-ms", type=float, default=15, help="delay between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="reply length (capped by num_predict)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative +/- variation of every delay")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests failing with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--midstream-failure-rate", type=float, default=0.0, help="share of streams ending in an error line")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of requests that never answer")
+    parser.add_argument("--hang-seconds", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=None)
+
+def behaviour_from_args(args):
+    return FakeOllama(
+        prompt_eval_ms=args.prompt_eval_ms,
+        prompt_token_ms=args.prompt_token_ms,
+        token_ms=args.token_ms,
+        tokens=args.tokens,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        error_status=args.error_status,
+        midstream_failure_rate=args.midstream_failure_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        seed=args.seed
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Ollama server with configurable latency and failures")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeOllamaServer((args.host, args.port), behaviour_from_args(args))
+    print(f"Fake Ollama listening on {server.url} (point OLLAMA_BASE_URL here)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.behaviour.stats()))
+        server.server_close()
@@ -0,0 +1,66 @@
+import random
+import re
+import logging
+from summarizer import top_topics
+
+logger = logging.getLogger(__name__)
+
+class FallbackResponder:
+    """Build a reply without the LLM when the model is unavailable.
+
+    Uses what we already know about the user (name, interests, the last
+    conversation summary) plus the EmotionEngine phrase banks, so an outage
+    still gets a personal, tone-appropriate answer instantly.
+    """
+
+    def __init__(self, database, emotion_engine):
+        self.db = database
+        self.emotion_engine = emotion_engine
+        self.summary_topic_pattern = re.compile(r'Conversation about (.+?)\.')
+        self.holding_lines = [
+            "My thoughts are running a little slow right now, so bear with me.",
+            "I'm having a bit of trouble thinking clearly at the moment.",
+            "My mind is a little foggy right now, but I'm still here with you.",
+            "I can't give you a proper answer just this second."
+        ]
+
+    def respond(self, user_id, user_message, user_profile=None):
+        """Return (message, emotional_context) for a turn the model couldn't take"""
+        emotional_context = self.emotion_engine.get_emotional_response(user_message)
+        tone_phrases = self.emotion_engine.tone_profiles[emotional_context["tone"]]
+
+        if user_profile is None:
+            user_profile = self.db.get_user_profile(user_id) or {}
+
+        opener = random.choice(tone_phrases["response"]).rstrip(".!")
+        if user_profile.get("name"):
+            parts = [f"{opener}, {user_profile['name']}."]
+        else:
+            parts = [f"{opener}."]
+
+        parts.append(random.choice(self.holding_lines))
+
+        topic = self._last_topic(user_id)
+        likes = (user_profile.get("preferences") or {}).get("likes") or []
+        if topic:
+            parts.append(f"Last time we talked about {topic}; I'd love to pick that up again soon.")
+        elif likes:
+            parts.append(f"Tell me how things are going with {random.choice(likes[:3])} while I catch up?")
+        else:
+            parts.append(random.choice(tone_phrases["closing"]))
+
+        parts.append(emotional_context["emotional_markers"])
+        return " ".join(parts), emotional_context
+
+    def _last_topic(self, user_id):
+        summaries = self.db.get_memory_summaries(user_id, 1)
+        if not summaries:
+            return None
+        if summaries[0].get("data"):
+            topics = top_topics(summaries[0]["data"])
+            return ", ".join(topics) if topics else None
+        # Older rows only have the rendered text
+        match = self.summary_topic_pattern.search(summaries[0]["text"])
+        if not match or match.group(1) == "various topics":
+            return None
+        return match.group(1)
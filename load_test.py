@@ -0,0 +1,397 @@
+"""Socket.IO load generator for the chat app.
+
+Opens N concurrent Socket.IO sessions (each one a new user, as the connect
+handler assigns a fresh user id), sends a realistic mix of messages with
+think time between turns and reports p50/p95/p99 latencies and errors:
+
+  ttft          message sent -> first reply content (a bot_token event if the
+                server streams tokens, else the bot_response)
+  turn_latency  message sent -> bot_response
+  ack           message sent -> thinking_start
+  connect       connect -> greeting
+
+Point the app at fake_ollama.py to measure the app without a model:
+
+  python fake_ollama.py --port 11435 &
+  OLLAMA_BASE_URL=http://127.0.0.1:11435 RATE_LIMIT_IP_PER_MINUTE=100000 \\
+      RATE_LIMIT_IP_BURST=100000 python app.py &
+  python load_test.py --url http://127.0.0.1:5000 --sessions 50
+
+or let this script run both in-process on temporary databases (--serve).
+Every session comes from 127.0.0.1, so against a separately started app the
+per-IP rate limit must be raised or most turns are shed. --max-* options
+turn the report into a pass/fail gate (exit status 1).
+
+Needs the Socket.IO client extras: pip install "python-socketio[client]"
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import logging
+import urllib.request
+from collections import Counter, defaultdict
+from config import Config
+
+try:
+    import socketio
+    import websocket  # noqa: F401 (websocket transport of socketio.Client)
+except ImportError:  # Only needed to run the swarm
+    socketio = None
+
+logger = logging.getLogger(__name__)
+
+NAMES = ("Alex", "Sam", "Priya", "Diego", "Mei", "Jordan", "Fatima", "Lukas")
+THINGS = ("hiking", "jazz", "sci-fi movies", "cooking", "chess", "photography", "football", "baking")
+JOBS = ("teacher", "nurse", "software engineer", "designer", "student", "chef")
+PLACES = ("Lisbon", "Toronto", "Nairobi", "Osaka", "Berlin", "Austin")
+
+# (weight, kind, templates): roughly the shape of real chat traffic, mostly
+# short small talk with some profile facts, feelings and harder questions
+MESSAGE_MIX = (
+    (40, "small_talk", (
+        "hi!", "hey, how are you?", "good morning", "lol that's funny", "thanks!",
+        "what's up?", "nice", "ok cool", "haha yes"
+    )),
+    (20, "personal", (
+        "My name is {name}", "I love {thing}", "I really like {thing}", "I work as a {job}",
+        "I'm from {place}", "I hate {thing} honestly"
+    )),
+    (15, "emotional", (
+        "I'm feeling really sad today", "I'm so excited about my trip!!", "ugh, work was stressful",
+        "I feel a bit lonely tonight", "I'm really happy with how today went"
+    )),
+    (15, "question", (
+        "What's a good book to read?", "How do I get better sleep?", "Any tips for learning {thing}?",
+        "What should I cook for dinner?"
+    )),
+    (10, "complex", (
+        "Can you explain the difference between stress and anxiety, why it happens, and how I should "
+        "deal with it when I have a big deadline coming up and I'm also trying to keep up with {thing}?",
+        "I'm thinking about changing careers from {job} to something creative. What should I consider, "
+        "how do people usually make that switch, and which skills would transfer?"
+    ))
+)
+
+ERROR_REPLY = "I apologize, but I'm having trouble"
+
+class MessageMix:
+    """Draws (kind, message) pairs from MESSAGE_MIX"""
+
+    def __init__(self, rng, mix=MESSAGE_MIX):
+        self.rng = rng
+        self.kinds = [(kind, templates) for _, kind, templates in mix]
+        self.weights = [weight for weight, _, _ in mix]
+
+    def next(self):
+        kind, templates = self.rng.choices(self.kinds, weights=self.weights)[0]
+        message = self.rng.choice(templates).format(
+            name=self.rng.choice(NAMES),
+            thing=self.rng.choice(THINGS),
+            job=self.rng.choice(JOBS),
+            place=self.rng.choice(PLACES)
+        )
+        return kind, message
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return round(sorted_values[index], 4)
+
+def distribution(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(values[-1], 4) if values else None
+    }
+
+class LoadReport:
+    """Thread-safe collection of per-turn samples from all sessions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.by_kind = defaultdict(list)
+        self.errors = Counter()
+        self.sessions = 0
+        self.sessions_failed = 0
+        self.turns = 0
+        self.shed = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.samples[name].append(seconds)
+
+    def record_turn(self, kind, ttft, latency, ack):
+        with self._lock:
+            self.turns += 1
+            self.samples["ttft"].append(ttft)
+            self.samples["turn_latency"].append(latency)
+            self.by_kind[kind].append(latency)
+            if ack is None:
+                # Answered without starting a generation: rate limited or shed
+                self.shed += 1
+            else:
+                self.samples["ack"].append(ack)
+
+    def record_error(self, kind):
+        with self._lock:
+            self.errors[kind] += 1
+
+    def record_session(self, ok):
+        with self._lock:
+            self.sessions += 1
+            if not ok:
+                self.sessions_failed += 1
+
+    def summary(self):
+        with self._lock:
+            duration = (self.finished or time.perf_counter()) - self.started
+            attempts = self.turns + sum(count for kind, count in self.errors.items() if kind != "server_error")
+            return {
+                "sessions": self.sessions,
+                "sessions_failed": self.sessions_failed,
+                "turns": self.turns,
+                "shed": self.shed,
+                "duration_s": round(duration, 3),
+                "turns_per_second": round(self.turns / duration, 2) if duration > 0 else None,
+                "errors": dict(self.errors),
+                "error_rate": round(sum(self.errors.values()) / attempts, 4) if attempts else 0.0,
+                "ttft": distribution(self.samples["ttft"]),
+                "turn_latency": distribution(self.samples["turn_latency"]),
+                "ack": distribution(self.samples["ack"]),
+                "connect": distribution(self.samples["connect"]),
+                "turn_latency_by_kind": {kind: distribution(values) for kind, values in sorted(self.by_kind.items())}
+            }
+
+class TurnError(Exception):
+    """A turn that got no reply; `kind` is the error counted in the report"""
+
+    def __init__(self, kind):
+        super().__init__(kind)
+        self.kind = kind
+
+class ChatClient:
+    """One Socket.IO chat session that times every turn"""
+
+    def __init__(self, url, turn_timeout=30.0, transports=("websocket",), protocol=None):
+        self.url = url
+        self.turn_timeout = turn_timeout
+        self.transports = list(transports)
+        # Wire protocol to negotiate (wire_protocol.py); None keeps the server default
+        self.auth = {"protocol": protocol} if protocol else None
+        self.events = queue.Queue()
+        self.client = socketio.Client(reconnection=False)
+        for name in ("bot_response", "bot_token", "thinking_start", "generation_cancelled"):
+            self.client.on(name, self._recorder(name))
+        self.client.on("disconnect", lambda *args: self.events.put(("disconnect", time.perf_counter(), None)))
+
+    def _recorder(self, name):
+        return lambda data=None: self.events.put((name, time.perf_counter(), data))
+
+    def _next_event(self, deadline):
+        try:
+            return self.events.get(timeout=max(0.0, deadline - time.perf_counter()))
+        except queue.Empty:
+            return None, None, None
+
+    def connect(self):
+        """Connect and wait for the greeting; returns seconds taken"""
+        start = time.perf_counter()
+        try:
+            self.client.connect(self.url, transports=self.transports, auth=self.auth, wait_timeout=self.turn_timeout)
+        except Exception as e:
+            logger.debug(f"Connect failed: {e}")
+            raise TurnError("connect")
+        name, at, _ = self._next_event(start + self.turn_timeout)
+        if name != "bot_response":
+            raise TurnError("no_greeting" if name is None else "disconnect")
+        return at - start
+
+    def turn(self, event="user_message", data=None):
+        """Emit one event and wait for the reply; returns (ttft, latency, ack, reply)"""
+        sent = time.perf_counter()
+        if data is None:
+            self.client.emit(event)
+        else:
+            self.client.emit(event, data)
+        ack = first_token = None
+        while True:
+            name, at, reply = self._next_event(sent + self.turn_timeout)
+            if name is None:
+                raise TurnError("timeout")
+            if name == "disconnect":
+                raise TurnError("disconnect")
+            if name == "generation_cancelled":
+                raise TurnError("cancelled")
+            if name == "thinking_start":
+                ack = at - sent
+            elif name == "bot_token" and first_token is None:
+                first_token = at - sent
+            elif name == "bot_response":
+                latency = at - sent
+                return (first_token if first_token is not None else latency), latency, ack, reply or {}
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+def record_reply(report, kind, timing):
+    """Add a ChatClient.turn() result to the report"""
+    ttft, latency, ack, reply = timing
+    report.record_turn(kind, ttft, latency, ack)
+    # "m" is the text in compact payloads
+    if str(reply.get("message", reply.get("m", ""))).startswith(ERROR_REPLY):
+        report.record_error("server_error")
+
+def run_session(url, report, messages=5, think_time=1.0, turn_timeout=30.0, seed=None, transports=("websocket",),
+                protocol=None):
+    """One simulated user: connect, wait for the greeting, chat, disconnect"""
+    rng = random.Random(seed)
+    mix = MessageMix(rng)
+    client = ChatClient(url, turn_timeout, transports, protocol)
+    ok = False
+    try:
+        report.record("connect", client.connect())
+        for turn in range(messages):
+            if turn and think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+            kind, message = mix.next()
+            record_reply(report, kind, client.turn("user_message", {"message": message}))
+        ok = True
+    except TurnError as e:
+        report.record_error(e.kind)
+    finally:
+        report.record_session(ok)
+        client.close()
+
+def run_swarm(url, sessions=10, messages=5, think_time=1.0, ramp_up=0.0, turn_timeout=30.0, seed=None,
+              transports=("websocket",), protocol=None):
+    """Run `sessions` concurrent users against `url`; returns the report summary"""
+    if socketio is None:
+        raise ImportError('The load generator needs the Socket.IO client: pip install "python-socketio[client]"')
+    report = LoadReport()
+    rng = random.Random(seed)
+    threads = []
+    for i in range(sessions):
+        thread = threading.Thread(
+            target=run_session,
+            args=(url, report, messages, think_time, turn_timeout, rng.random(), transports, protocol),
+            name=f"load-session-{i}",
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+        if ramp_up and sessions > 1:
+            time.sleep(ramp_up / (sessions - 1))
+    for thread in threads:
+        thread.join()
+    report.finished = time.perf_counter()
+    return report.summary()
+
+def fetch_metrics(url, timeout=5):
+    """The app's /metrics counters, or None if unavailable"""
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/metrics", timeout=timeout) as response:
+            return json.loads(response.read())
+    except Exception as e:
+        logger.warning(f"Could not read {url}/metrics: {e}")
+        return None
+
+def check_gates(summary, max_p95_ttft=None, max_p99_latency=None, max_error_rate=None):
+    """Threshold violations in `summary`; an empty list means the run passed"""
+    failures = []
+    ttft = summary["ttft"]["p95"]
+    latency = summary["turn_latency"]["p99"]
+    if max_p95_ttft is not None and (ttft is None or ttft > max_p95_ttft):
+        failures.append(f"p95 ttft {ttft}s exceeds {max_p95_ttft}s")
+    if max_p99_latency is not None and (latency is None or latency > max_p99_latency):
+        failures.append(f"p99 turn latency {latency}s exceeds {max_p99_latency}s")
+    if max_error_rate is not None and summary["error_rate"] > max_error_rate:
+        failures.append(f"error rate {summary['error_rate']} exceeds {max_error_rate}")
+    return failures
+
+def load_test_config(ollama_url, data_dir):
+    """App config for --serve: fake Ollama, throwaway databases, no per-IP limit"""
+
+    class LoadTestConfig(Config):
+        OLLAMA_BASE_URL = ollama_url
+        SQLITE_DB = os.path.join(data_dir, "load_test.db")
+        ARCHIVE_DB = os.path.join(data_dir, "load_test_archive.db")
+        # Every simulated user shares 127.0.0.1
+        RATE_LIMIT_IP_PER_MINUTE = 1e9
+        RATE_LIMIT_IP_BURST = 10 ** 9
+
+    return LoadTestConfig
+
+def start_app(config, host="127.0.0.1", port=0):
+    """Serve create_app(config) on a background thread; returns (app, server, url)"""
+    from werkzeug.serving import make_server
+    from app import create_app
+    flask_app = create_app(config, eager=True)
+    server = make_server(host, port, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-app", daemon=True).start()
+    return flask_app, server, f"http://{host}:{server.server_port}"
+
+if __name__ == '__main__':
+    import fake_ollama
+
+    parser = argparse.ArgumentParser(description="Socket.IO load generator for the chat app")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="app to test (ignored with --serve)")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--messages", type=int, default=5, help="messages per session")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds between a reply and the next message")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds over which sessions are started")
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--transport", choices=("websocket", "polling"), default="websocket")
+    parser.add_argument("--wire-protocol", type=int, choices=(1, 2), help="payload format to negotiate (default: server's)")
+    parser.add_argument("--serve", action="store_true", help="run the app and a fake Ollama in this process")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    parser.add_argument("--max-p95-ttft", type=float, help="fail if p95 time-to-first-token exceeds this (s)")
+    parser.add_argument("--max-p99-latency", type=float, help="fail if p99 turn latency exceeds this (s)")
+    parser.add_argument("--max-error-rate", type=float, help="fail if the error rate exceeds this (0-1)")
+    # Fake Ollama behaviour for --serve; --seed also seeds the message mix
+    fake_ollama.add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    fake_server = flask_app = app_server = data_dir = None
+    url = args.url
+    if args.serve:
+        fake_server = fake_ollama.FakeOllamaServer(behaviour=fake_ollama.behaviour_from_args(args)).start()
+        data_dir = tempfile.TemporaryDirectory()
+        flask_app, app_server, url = start_app(load_test_config(fake_server.url, data_dir.name))
+
+    summary = run_swarm(url, args.sessions, args.messages, args.think_time, args.ramp_up,
+                        args.turn_timeout, args.seed, (args.transport,), args.wire_protocol)
+    summary["server"] = fetch_metrics(url)
+    if fake_server:
+        summary["fake_ollama"] = fake_server.behaviour.stats()
+        app_server.shutdown()
+        fake_server.stop()
+        flask_app.extensions['chatbot'].close()
+        data_dir.cleanup()
+
+    output = json.dumps(summary, indent=2)
+    print(output)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            f.write(output + "\n")
+    failures = check_gates(summary, args.max_p95_ttft, args.max_p99_latency, args.max_error_rate)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
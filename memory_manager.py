@@ -3,19 +3,52 @@ import re
 import logging
 from datetime import datetime
 from config import Config
+from prompt_cache import PromptCache
+from summarizer import RollingSummarizer
+from user_serializer import UserSerializer
 
 logger = logging.getLogger(__name__)
 
+SUMMARY_LABELS = {
+    "long_term": "Long-term summary",
+    "daily": "Recent days",
+    "session": "Previous conversation summary"
+}
+
 class MemoryManager:
-    def __init__(self, database):
+    def __init__(self, database, serializer=None, summarizer=None, fact_extractor=None, prompt_cache=None):
         self.db = database
         self.conversation_buffers = {}
+        # Session summaries are written (and rolled up) by a background worker
+        self.summarizer = summarizer or RollingSummarizer(database)
+        # Per-user turn ordering; the app shares this so a whole turn and the
+        # profile/buffer updates inside it run under the same user slot
+        self.serializer = serializer or UserSerializer()
+        # Profile lines are rendered once per profile version
+        self.prompt_cache = prompt_cache or PromptCache()
+        # Optional batched LLM extraction (fact_extraction.py); its merges
+        # take the same user slots as turns
+        self.fact_extractor = fact_extractor
+        if fact_extractor is not None:
+            fact_extractor.serializer = self.serializer
+        # Loose patterns: "I'm tired" is not a name, "I do" not a profession.
+        # With the LLM extractor they only flag a message for it
+        loose_name = re.compile(r'i\'m\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', re.IGNORECASE)
+        bare_name = re.compile(r'(?:i am|it\'s|this is)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', re.IGNORECASE)
+        single_word = re.compile(r'^([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)$', re.IGNORECASE)
+        loose_profession = re.compile(r'(?:i am a|i\'m a|i do)\s+([^.!?]+)', re.IGNORECASE)
+        loose_location = re.compile(r'(?:^|\s)from\s+([^.!?]+)', re.IGNORECASE)
+        self.loose_patterns = {loose_name, bare_name, single_word, loose_profession, loose_location}
+        # Name guesses only flag a message for the LLM when the word is
+        # capitalised ("I'm Sam", not "I'm feeling"); a lone word never does
+        self.name_cues = (loose_name, bare_name)
         # Enhanced user info patterns with more variations
         self.user_info_patterns = {
             'name': [
-                re.compile(r'(?:my name is|i am called|you can call me|i\'m|call me|name\'s)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', re.IGNORECASE),
-                re.compile(r'(?:i am|it\'s|this is)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', re.IGNORECASE),
-                re.compile(r'^([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)$', re.IGNORECASE)
+                re.compile(r'(?:my name is|i am called|you can call me|call me|name\'s)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', re.IGNORECASE),
+                loose_name,
+                bare_name,
+                single_word
             ],
             'likes': [
                 re.compile(r'(?:i like|i love|i enjoy|i\'m into|i really like|i adore)\s+([^.!?]+)', re.IGNORECASE),
@@ -25,28 +58,34 @@ class MemoryManager:
                 re.compile(r'(?:i hate|i dislike|i don\'t like|i can\'t stand)\s+([^.!?]+)', re.IGNORECASE)
             ],
             'profession': [
-                re.compile(r'(?:i work as|i am a|i\'m a|my job is|i do)\s+([^.!?]+)', re.IGNORECASE),
+                re.compile(r'(?:i work as|my job is)\s+([^.!?]+)', re.IGNORECASE),
+                loose_profession,
                 re.compile(r'(?:i work in|i\'m in)\s+the\s+([^.!?]+)\s+(?:industry|field)', re.IGNORECASE)
             ],
             'location': [
-                re.compile(r'(?:i live in|i\'m from|from|based in|located in)\s+([^.!?]+)', re.IGNORECASE)
+                re.compile(r'(?:i live in|i\'m from|based in|located in)\s+([^.!?]+)', re.IGNORECASE),
+                loose_location
             ],
             'relationships': [
                 re.compile(r'(?:my (?:wife|husband|partner|boyfriend|girlfriend|friend|mom|dad|parent|sister|brother|family)\'s name is|(?:wife|husband|partner|boyfriend|girlfriend|friend|mom|dad|parent|sister|brother) is called)\s+([A-Z][a-z]+)', re.IGNORECASE)
             ]
         }
+        self.flag_patterns = [
+            pattern for patterns in self.user_info_patterns.values() for pattern in patterns
+            if pattern is not single_word and pattern not in self.name_cues
+        ] + [re.compile(r'i\'m\s+(?:really\s+|so\s+)?into\s', re.IGNORECASE)]
     
     def get_conversation_context(self, user_id, max_exchanges=5):
         """Get optimized conversation context"""
         try:
-            recent_memories = self.db.get_recent_memories(user_id, max_exchanges)
+            recent_turns = self.db.get_recent_turns(user_id, max_exchanges * 2)  # user + assistant per exchange
             important_memories = self.db.get_important_memories(user_id, 3)  # Increased for better recall
-            memory_summaries = self.db.get_memory_summaries(user_id, 2)      # Increased for better context
+            memory_summaries = self.db.get_summary_set(user_id)  # At most one per tier, however old the user
             user_profile = self.db.get_user_profile(user_id) or {}
             
             return {
                 "user_profile": user_profile,
-                "recent_conversation": recent_memories,
+                "recent_conversation": recent_turns,
                 "important_memories": important_memories,
                 "memory_summaries": memory_summaries
             }
@@ -54,6 +93,13 @@ class MemoryManager:
             logger.error(f"Error getting conversation context: {e}")
             return {"user_profile": {}, "recent_conversation": [], "important_memories": [], "memory_summaries": []}
     
+    def get_conversation_contexts(self, user_ids, max_exchanges=5):
+        """get_conversation_context() for many users with grouped reads"""
+        contexts = self.db.get_user_contexts(user_ids, turns_limit=max_exchanges * 2, memories_limit=3)
+        for context in contexts.values():
+            context["user_profile"] = context["user_profile"] or {}
+        return contexts
+    
     def format_context_for_prompt(self, context, user_profile=None):
         """Format context efficiently with enhanced user details"""
         prompt_parts = []
@@ -61,77 +107,103 @@ class MemoryManager:
         # Use provided user_profile or from context
         profile = user_profile or context.get("user_profile", {})
         
-        # Add user profile information if available
+        # Add user profile information if available (cached per profile version)
         if profile:
-            if profile.get("name"):
-                prompt_parts.append(f"User's name: {profile['name']}")
-            
-            if profile.get("preferences"):
-                prefs = profile["preferences"]
-                if prefs.get("likes"):
-                    prompt_parts.append(f"User likes: {', '.join(prefs['likes'][:3])}")
-                if prefs.get("dislikes"):
-                    prompt_parts.append(f"User dislikes: {', '.join(prefs['dislikes'][:2])}")
-                
-                # Add other known preferences
-                for key, value in prefs.items():
-                    if key not in ["likes", "dislikes"] and value:
-                        if isinstance(value, list):
-                            prompt_parts.append(f"User's {key}: {', '.join(value[:2])}")
-                        else:
-                            prompt_parts.append(f"User's {key}: {value}")
+            prompt_parts.extend(self.prompt_cache.profile(profile).context_lines)
         
         if context.get("memory_summaries"):
-            for summary in context["memory_summaries"][:2]:  # Up to 2 summaries
-                prompt_parts.append(f"Previous conversation summary: {summary['text']}")
+            for summary in context["memory_summaries"][:3]:  # Long-term, daily and last session
+                label = SUMMARY_LABELS.get(summary.get("tier"), SUMMARY_LABELS["session"])
+                prompt_parts.append(f"{label}: {summary['text']}")
         
         if context.get("important_memories"):
             prompt_parts.append("Important memories from past conversations:")
             for memory in context["important_memories"][:3]:  # Up to 3 important memories
                 prompt_parts.append(f"- {memory['text'][:120]}...")
         
-        if context.get("recent_conversation"):
-            prompt_parts.append("Recent conversation:")
-            for memory in context["recent_conversation"][:3]:  # Up to 3 recent exchanges
-                if isinstance(memory, dict):
-                    prompt_parts.append(f"User: {memory.get('user_input', '')[:60]}")
-                    prompt_parts.append(f"Assistant: {memory.get('bot_response', '')[:60]}")
+        # Recent conversation is sent as real chat messages, not prompt text
         
         return "\n".join(prompt_parts)[:1000]  # Increased context length for better memory
     
     def update_conversation_buffer(self, user_id, user_input, bot_response, emotional_context):
         """Update conversation buffer efficiently"""
+        with self.serializer.serialize(user_id):
+            self._update_conversation_buffer(user_id, user_input, bot_response, emotional_context)
+    
+    def _update_conversation_buffer(self, user_id, user_input, bot_response, emotional_context):
+        self._buffer_exchange(user_id, user_input, bot_response, emotional_context)
+        
+        self.db.store_turns(
+            user_id,
+            [("user", user_input), ("assistant", bot_response)],
+            tone=emotional_context.get("tone")
+        )
+        
+        memory_text, importance = self._exchange_memory(user_input, bot_response)
+        self.db.store_memory(
+            user_id, 
+            memory_text, 
+            "conversation_exchange", 
+            emotional_context,
+            importance=importance
+        )
+        
+        self._submit_finished_session(user_id)
+    
+    def record_unanswered(self, user_id, user_input, emotional_context=None):
+        """Keep a message whose reply was cancelled: its facts and the user
+        turn are stored, but there is no exchange to buffer or remember"""
+        with self.serializer.serialize(user_id):
+            self.extract_user_info(user_id, user_input, "")
+            self.db.store_turns(user_id, [("user", user_input)], tone=(emotional_context or {}).get("tone"))
+    
+    def record_exchanges(self, exchanges):
+        """update_conversation_buffer() for many (user_id, user_input, bot_response,
+        emotional_context) exchanges, written to the database in one transaction"""
+        rows = []
+        for user_id, user_input, bot_response, emotional_context in exchanges:
+            memory_text, importance = self._exchange_memory(user_input, bot_response)
+            rows.append({
+                "user_id": user_id,
+                "turns": [("user", user_input), ("assistant", bot_response)],
+                "tone": emotional_context.get("tone"),
+                "memory": (memory_text, "conversation_exchange", emotional_context, importance)
+            })
+        stored = self.db.store_exchanges(rows)
+        for user_id, user_input, bot_response, emotional_context in exchanges:
+            with self.serializer.serialize(user_id):
+                self._buffer_exchange(user_id, user_input, bot_response, emotional_context)
+                self._submit_finished_session(user_id)
+        return stored
+    
+    def _buffer_exchange(self, user_id, user_input, bot_response, emotional_context):
         if user_id not in self.conversation_buffers:
             self.conversation_buffers[user_id] = []
         
-        memory_data = {
+        self.conversation_buffers[user_id].append({
             "user_input": user_input,
             "bot_response": bot_response,
             "emotional_context": emotional_context,
             "timestamp": datetime.now().isoformat()
-        }
-        
-        self.conversation_buffers[user_id].append(memory_data)
-        
-        # Store in database with higher importance for personal information
+        })
+    
+    def _exchange_memory(self, user_input, bot_response):
+        """(memory_text, importance) stored for an exchange"""
         memory_text = f"User: {user_input[:100]}... | Bot: {bot_response[:100]}..."
         
         # Check if this contains personal information for higher importance
         importance = 1
         if self._contains_personal_info(user_input):
             importance = 3  # High importance for personal info
-        
-        self.db.store_memory(
-            user_id, 
-            memory_text, 
-            "conversation_exchange", 
-            emotional_context,
-            importance=importance
-        )
-        
-        # Check for summarization more frequently for active conversations
+        return memory_text, importance
+    
+    def _submit_finished_session(self, user_id):
+        # Hand finished sessions to the background summarizer so this turn
+        # doesn't pay for summarizing and compacting
         if len(self.conversation_buffers[user_id]) >= Config.MEMORY_SUMMARY_THRESHOLD:
-            self._create_conversation_summary(user_id)
+            exchanges = self.conversation_buffers[user_id]
+            self.conversation_buffers[user_id] = []
+            self.summarizer.submit(user_id, exchanges)
     
     def _contains_personal_info(self, text):
         """Check if text contains personal information"""
@@ -144,49 +216,37 @@ class MemoryManager:
         return any(keyword in text_lower for keyword in personal_keywords)
     
     def _create_conversation_summary(self, user_id):
-        """Create detailed conversation summary for long-term memory"""
+        """Summarize the buffered session synchronously (normally done in the background)"""
         if user_id not in self.conversation_buffers or not self.conversation_buffers[user_id]:
             return
         
-        # Extract key topics and emotions from conversation
-        topics = set()
-        emotions = []
-        
-        for exchange in self.conversation_buffers[user_id]:
-            # Simple topic extraction (in a real implementation, use NLP)
-            user_input = exchange['user_input'].lower()
-            if 'movie' in user_input or 'film' in user_input:
-                topics.add('movies')
-            if 'music' in user_input or 'song' in user_input:
-                topics.add('music')
-            if 'book' in user_input or 'read' in user_input:
-                topics.add('reading')
-            if 'sport' in user_input or 'game' in user_input:
-                topics.add('sports')
-            if 'work' in user_input or 'job' in user_input:
-                topics.add('work')
-            if 'travel' in user_input or 'vacation' in user_input:
-                topics.add('travel')
-            
-            # Collect emotions
-            if 'emotional_context' in exchange:
-                emotions.append(exchange['emotional_context'].get('tone', 'neutral'))
-        
-        # Determine dominant emotion
-        emotion_count = {}
-        for emotion in emotions:
-            emotion_count[emotion] = emotion_count.get(emotion, 0) + 1
-        dominant_emotion = max(emotion_count.items(), key=lambda x: x[1])[0] if emotion_count else 'neutral'
-        
-        # Create summary
-        topic_str = ", ".join(list(topics)[:3]) if topics else "various topics"
-        summary = f"Conversation about {topic_str}. Overall tone was {dominant_emotion}. {len(self.conversation_buffers[user_id])} exchanges."
-        
-        self.db.create_memory_summary(user_id, summary)
+        exchanges = self.conversation_buffers[user_id]
         self.conversation_buffers[user_id] = []  # Clear buffer
+        self.summarizer.summarize_now(user_id, exchanges)
     
     def extract_user_info(self, user_id, user_input, response):
         """Enhanced user info extraction using multiple regex patterns"""
+        # Read-merge-write of the profile must not interleave with another
+        # message from the same user or one of the updates is lost
+        with self.serializer.serialize(user_id):
+            updated = self._extract_user_info(user_id, user_input, response)
+        if self.fact_extractor is not None and self._may_hold_facts(user_input):
+            self.fact_extractor.submit(user_id, user_input)
+        return updated
+    
+    def _patterns(self, kind):
+        """Patterns used for `kind`; the loose ones are left to the LLM extractor when there is one"""
+        if self.fact_extractor is None:
+            return self.user_info_patterns[kind]
+        return [pattern for pattern in self.user_info_patterns[kind] if pattern not in self.loose_patterns]
+    
+    def _may_hold_facts(self, text):
+        """Worth a place in an LLM extraction batch: personal keywords, a pattern hit or a capitalised name guess"""
+        if self._contains_personal_info(text) or any(pattern.search(text) for pattern in self.flag_patterns):
+            return True
+        return any(match.group(1)[0].isupper() for pattern in self.name_cues for match in pattern.finditer(text))
+    
+    def _extract_user_info(self, user_id, user_input, response):
         user_profile = self.db.get_user_profile(user_id) or {
             "preferences": {}, 
             "personality_traits": {}
@@ -200,7 +260,7 @@ class MemoryManager:
             user_profile["preferences"]["dislikes"] = []
         
         # Name detection with multiple patterns
-        for pattern in self.user_info_patterns['name']:
+        for pattern in self._patterns('name'):
             match = pattern.search(user_input)
             if match:
                 name = match.group(1).strip()
@@ -218,7 +278,7 @@ class MemoryManager:
                     break
         
         # Preferences detection - Likes
-        for pattern in self.user_info_patterns['likes']:
+        for pattern in self._patterns('likes'):
             match = pattern.search(user_input)
             if match:
                 like_item = match.group(1).strip()
@@ -235,7 +295,7 @@ class MemoryManager:
                     )
         
         # Preferences detection - Dislikes
-        for pattern in self.user_info_patterns['dislikes']:
+        for pattern in self._patterns('dislikes'):
             match = pattern.search(user_input)
             if match:
                 dislike_item = match.group(1).strip()
@@ -252,7 +312,7 @@ class MemoryManager:
                     )
         
         # Profession detection
-        for pattern in self.user_info_patterns['profession']:
+        for pattern in self._patterns('profession'):
             match = pattern.search(user_input)
             if match:
                 profession = match.group(1).strip()
@@ -269,7 +329,7 @@ class MemoryManager:
                     )
         
         # Location detection
-        for pattern in self.user_info_patterns['location']:
+        for pattern in self._patterns('location'):
             match = pattern.search(user_input)
             if match:
                 location = match.group(1).strip()
@@ -286,7 +346,7 @@ class MemoryManager:
                     )
         
         # Relationship detection
-        for pattern in self.user_info_patterns['relationships']:
+        for pattern in self._patterns('relationships'):
             match = pattern.search(user_input)
             if match:
                 relation_name = match.group(1).strip()
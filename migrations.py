@@ -0,0 +1,266 @@
+import time
+import logging
+from config import Config
+import emotion_codec
+
+logger = logging.getLogger(__name__)
+
+class Migration:
+    """One forward schema step, applied at most once per database file.
+
+    Online migrations only build indexes. On a large table they are left
+    for the background maintenance thread instead of delaying startup;
+    queries stay correct without them, just slower.
+    """
+
+    def __init__(self, version, name, steps, online=False, table=None):
+        self.version = version
+        self.name = name
+        self.steps = steps  # SQL strings or callables taking a cursor
+        self.online = online
+        self.table = table  # table an online migration indexes
+
+    def apply(self, cursor):
+        for step in self.steps:
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+
+def ensure_columns(cursor, table, columns):
+    """Add any missing columns to an existing table"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def add_summary_tiers(cursor):
+    ensure_columns(cursor, "memory_summaries", {
+        "tier": "TEXT DEFAULT 'session'",
+        "period": "TEXT",
+        "summary_data": "TEXT"
+    })
+
+def fold_recent_memories(cursor):
+    """Fold the old recent_memories copy table into conversation_memories.
+
+    Every exchange used to be written twice: once to conversation_memories
+    and once more into recent_memories as a JSON blob. Any row that only
+    exists in the copy is moved over, then the copy table is dropped.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'recent_memories'")
+    if cursor.fetchone():
+        cursor.execute(
+            '''INSERT INTO conversation_memories (user_id, memory_text, memory_type, emotional_context, created_at)
+               SELECT r.user_id,
+                      json_extract(r.memory_data, '$.text'),
+                      json_extract(r.memory_data, '$.type'),
+                      json_extract(r.memory_data, '$.emotional_context'),
+                      r.created_at
+               FROM recent_memories r
+               WHERE json_valid(r.memory_data)
+                 AND NOT EXISTS (
+                     SELECT 1 FROM conversation_memories m
+                     WHERE m.user_id = r.user_id
+                       AND m.memory_text = json_extract(r.memory_data, '$.text')
+                 )'''
+        )
+        if cursor.rowcount:
+            logger.info(f"Migrated {cursor.rowcount} rows from recent_memories")
+        cursor.execute("DROP TABLE recent_memories")
+
+def compact_emotional_context(cursor, batch_size=500):
+    """Tone code plus quantized score columns (see emotion_codec), backfilled from JSON"""
+    ensure_columns(cursor, "conversation_memories", {column: "INTEGER" for column in emotion_codec.COLUMNS})
+    assignments = ", ".join(f"{column} = ?" for column in emotion_codec.COLUMNS)
+    converted = 0
+    while True:
+        cursor.execute(
+            "SELECT id, emotional_context FROM conversation_memories WHERE emotional_context IS NOT NULL LIMIT ?",
+            (batch_size,)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany(
+            f"UPDATE conversation_memories SET {assignments}, emotional_context = NULL WHERE id = ?",
+            [emotion_codec.encode_json(row[1]) + (row[0],) for row in rows]
+        )
+        converted += len(rows)
+    if converted:
+        logger.info(f"Encoded emotional context for {converted} memories")
+
+# Append only: never edit or renumber a migration that has shipped
+MIGRATIONS = [
+    Migration(1, "base tables", [
+        '''CREATE TABLE IF NOT EXISTS user_profiles (
+            user_id TEXT PRIMARY KEY,
+            name TEXT,
+            preferences TEXT,
+            personality_traits TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS conversation_memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            memory_text TEXT,
+            memory_type TEXT,
+            emotional_context TEXT,
+            importance INTEGER DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user_profiles (user_id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS memory_summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            summary_text TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user_profiles (user_id)
+        )'''
+    ]),
+    # Summary tiers (session -> daily -> long_term)
+    Migration(2, "summary tiers", [add_summary_tiers]),
+    # One row per chat message. The (user_id, seq) primary key of a WITHOUT
+    # ROWID table is the table itself, so "last N turns for a user" is a
+    # covering backwards range scan with no JSON to parse
+    Migration(3, "conversation turns", [
+        '''CREATE TABLE IF NOT EXISTS conversation_turns (
+            user_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tone TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, seq DESC)
+        ) WITHOUT ROWID'''
+    ]),
+    Migration(4, "single memory write", [fold_recent_memories]),
+    Migration(5, "compact emotional context", [compact_emotional_context]),
+    # Indexes shaped like the queries that use them; each replaces the
+    # single-column index it supersedes
+    Migration(6, "recent memories index", [
+        'CREATE INDEX IF NOT EXISTS idx_user_memories_recent ON conversation_memories(user_id, created_at, id)',
+        'DROP INDEX IF EXISTS idx_user_memories'
+    ], online=True, table="conversation_memories"),
+    Migration(7, "important memories index", [
+        'CREATE INDEX IF NOT EXISTS idx_user_memories_importance ON conversation_memories(user_id, importance, created_at)',
+        'DROP INDEX IF EXISTS idx_memory_importance'
+    ], online=True, table="conversation_memories"),
+    Migration(8, "memory cleanup index", [
+        'CREATE INDEX IF NOT EXISTS idx_memory_cleanup ON conversation_memories(created_at)'
+    ], online=True, table="conversation_memories"),
+    Migration(9, "summary order index", [
+        'CREATE INDEX IF NOT EXISTS idx_user_summary_order ON memory_summaries(user_id, tier, COALESCE(period, created_at), id)',
+        'DROP INDEX IF EXISTS idx_user_summary_tier',
+        'DROP INDEX IF EXISTS idx_user_summaries'
+    ], online=True, table="memory_summaries"),
+    Migration(10, "summary period index", [
+        'CREATE INDEX IF NOT EXISTS idx_user_summary_period ON memory_summaries(user_id, tier, period)'
+    ], online=True, table="memory_summaries"),
+    Migration(11, "profile activity index", [
+        'CREATE INDEX IF NOT EXISTS idx_user_profile_updated ON user_profiles(updated_at)'
+    ], online=True, table="user_profiles"),
+    # Per-user memory counts kept by triggers, so quota checks never count rows
+    Migration(12, "memory quota", [
+        lambda cursor: ensure_columns(cursor, "conversation_memories", {"mention_count": "INTEGER DEFAULT 0"}),
+        '''CREATE TABLE IF NOT EXISTS user_memory_stats (
+            user_id TEXT PRIMARY KEY,
+            memory_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID''',
+        '''INSERT OR REPLACE INTO user_memory_stats (user_id, memory_count)
+           SELECT user_id, COUNT(*) FROM conversation_memories WHERE user_id IS NOT NULL GROUP BY user_id''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_memory_count_insert
+           AFTER INSERT ON conversation_memories WHEN NEW.user_id IS NOT NULL
+           BEGIN
+               INSERT INTO user_memory_stats (user_id, memory_count) VALUES (NEW.user_id, 1)
+               ON CONFLICT(user_id) DO UPDATE SET memory_count = memory_count + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_memory_count_delete
+           AFTER DELETE ON conversation_memories WHEN OLD.user_id IS NOT NULL
+           BEGIN
+               UPDATE user_memory_stats SET memory_count = memory_count - 1 WHERE user_id = OLD.user_id;
+               DELETE FROM user_memory_stats WHERE user_id = OLD.user_id AND memory_count <= 0;
+           END'''
+    ]),
+    # Bumped on every profile write, so derived data (prompt fragments) can
+    # tell a changed profile from the one it was built from
+    Migration(13, "profile version", [
+        lambda cursor: ensure_columns(cursor, "user_profiles", {"version": "INTEGER NOT NULL DEFAULT 0"})
+    ])
+]
+
+def ensure_version_table(conn):
+    conn.execute(
+        '''CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INTEGER
+        )'''
+    )
+    conn.commit()
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+def pending(conn, migrations=None):
+    done = applied_versions(conn)
+    return [migration for migration in (migrations or MIGRATIONS) if migration.version not in done]
+
+def apply_migration(conn, migration):
+    """Run one migration and record it, atomically"""
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        migration.apply(cursor)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name, duration_ms) VALUES (?, ?, ?)",
+            (migration.version, migration.name, int((time.perf_counter() - start) * 1000))
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info(f"Applied migration {migration.version} ({migration.name})")
+
+def _table_is_large(conn, table, threshold):
+    # MAX(rowid) is an O(log n) estimate; WITHOUT ROWID tables are never deferred
+    try:
+        rows = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    except Exception:
+        return False
+    return rows > threshold
+
+def migrate(conn, migrations=None, online_min_rows=None):
+    """Apply pending migrations in order; returns the online ones deferred.
+
+    Online index builds on tables with more than online_min_rows rows are
+    skipped here and picked up later by run_online(), so opening a large
+    existing database doesn't block on index builds.
+    """
+    online_min_rows = Config.MIGRATION_ONLINE_MIN_ROWS if online_min_rows is None else online_min_rows
+    ensure_version_table(conn)
+    deferred = []
+    for migration in pending(conn, migrations):
+        if migration.online and _table_is_large(conn, migration.table, online_min_rows):
+            deferred.append(migration)
+            continue
+        apply_migration(conn, migration)
+    if deferred:
+        logger.info(f"Deferred {len(deferred)} index builds to background maintenance")
+    return deferred
+
+def run_online(conn, write_lock, migrations=None):
+    """Apply deferred online migrations one at a time (background maintenance)"""
+    applied = 0
+    for migration in pending(conn, migrations):
+        if not migration.online:
+            continue
+        # SQLite builds an index under the write lock; reads keep working
+        with write_lock:
+            apply_migration(conn, migration)
+        applied += 1
+    return applied
@@ -0,0 +1,189 @@
+import re
+import threading
+import time
+import logging
+from collections import deque
+import httpx
+import ollama
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class ModelTier:
+    """One configured model with its own context/output budget and timeout"""
+
+    def __init__(self, name, model, num_ctx, num_predict, timeout, max_score, host=None):
+        self.name = name
+        self.model = model
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.timeout = timeout
+        self.max_score = max_score
+        self.client = ollama.Client(host=host or Config.OLLAMA_BASE_URL, timeout=timeout)
+
+class TierStats:
+    """Traffic and latency counters for a tier"""
+
+    def __init__(self, sample_size=500):
+        self.requests = 0
+        self.completed = 0
+        self.fallbacks = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latencies = deque(maxlen=sample_size)
+
+    def snapshot(self, total_requests):
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "traffic_share": round(self.requests / total_requests, 4) if total_requests else 0.0,
+            "completed": self.completed,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+            "latency_avg": round(self.latency_total / self.completed, 4) if self.completed else None,
+            "latency_p50": _percentile(latencies, 0.50),
+            "latency_p95": _percentile(latencies, 0.95)
+        }
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return round(sorted_values[index], 4)
+
+class ModelRouter:
+    """Send each message to the cheapest model tier that can handle it.
+
+    Messages get a 0-1 complexity score from their length, question density,
+    the EmotionEngine curiosity score and the size of the prompt context.
+    Tiers are ordered small to large; a message goes to the first tier whose
+    `max_score` covers it, and if that tier times out or errors the next
+    larger tier takes over. The circuit breaker sees one call per message:
+    a tier failure the next tier recovered from is not held against it.
+    """
+
+    def __init__(self, tiers, breaker=None, output_controller=None, context_budget=None):
+        self.tiers = tiers
+        self.context_budget = context_budget or Config.MAX_CONTEXT_LENGTH
+        self.breaker = breaker
+        self.output_controller = output_controller
+        self.question_words = re.compile(r'\b(?:why|how|what|explain|compare|difference|should|which)\b', re.IGNORECASE)
+        self._lock = threading.Lock()
+        self._stats = {tier.name: TierStats() for tier in tiers}
+        self._total = 0
+
+    @classmethod
+    def from_config(cls, breaker=None, output_controller=None, config=Config):
+        tiers = [ModelTier(host=config.OLLAMA_BASE_URL, **tier) for tier in config.MODEL_TIERS]
+        tiers.sort(key=lambda tier: tier.max_score)
+        return cls(tiers, breaker, output_controller, config.MAX_CONTEXT_LENGTH)
+
+    def score(self, message, emotion_scores=None, context_size=0):
+        """Complexity score in [0, 1]; higher means the message needs a bigger model"""
+        length_score = min(1.0, len(message) / 300)
+
+        # A single question is ordinary small talk; several stacked up are not
+        questions = message.count('?') + len(self.question_words.findall(message))
+        question_score = min(1.0, max(0, questions - 1) / 3)
+
+        curiosity = (emotion_scores or {}).get("curiosity", 0.7)
+        # 0.7 is the EmotionEngine baseline; only curiosity above it counts
+        curiosity_score = max(0.0, min(1.0, (curiosity - 0.7) / 0.3))
+
+        context_score = min(1.0, context_size / self.context_budget)
+
+        return (0.4 * length_score + 0.2 * question_score
+                + 0.2 * curiosity_score + 0.2 * context_score)
+
+    def select(self, score):
+        """Index of the first tier able to take a message with this score"""
+        for index, tier in enumerate(self.tiers):
+            if score <= tier.max_score:
+                return index
+        return len(self.tiers) - 1
+
+    def chat(self, messages, message, emotion_scores=None, context_size=0, options=None, on_token=None, cancelled=None,
+             on_reset=None):
+        """Run the chat on the routed tier, escalating on timeout or error.
+
+        on_token receives the reply text as it streams and cancelled is polled
+        between tokens (both need the output controller). If a tier streamed
+        some text before failing, on_reset is called before the next tier
+        streams its reply from the start.
+        """
+        index = self.select(self.score(message, emotion_scores, context_size))
+        token = self.breaker.admit() if self.breaker else None
+        streamed = 0
+
+        def tap(text):
+            nonlocal streamed
+            streamed += 1
+            on_token(text)
+
+        while True:
+            tier = self.tiers[index]
+            tier_options = dict(options or {})
+            tier_options['num_ctx'] = tier.num_ctx
+            tier_options['num_predict'] = tier.num_predict
+            if self.output_controller:
+                tier_options['stop'] = self.output_controller.stop_sequences()
+            self._record_request(tier)
+            start = time.monotonic()
+            try:
+                response = self._generate(tier, messages, tier_options, tap if on_token else None, cancelled)
+            except (httpx.TimeoutException, ollama.ResponseError) as e:
+                if index + 1 < len(self.tiers):
+                    logger.warning(f"Tier {tier.name} ({tier.model}) failed, escalating: {e}")
+                    self._record_outcome(tier, fallback=True)
+                    if streamed and on_reset:
+                        on_reset()
+                    streamed = 0
+                    index += 1
+                    continue
+                self._record_outcome(tier, error=True)
+                self._record_breaker(token, failed=True, elapsed=time.monotonic() - start)
+                raise
+            except Exception:
+                self._record_outcome(tier, error=True)
+                self._record_breaker(token, failed=True, elapsed=time.monotonic() - start)
+                raise
+            latency = time.monotonic() - start
+            self._record_outcome(tier, latency=latency)
+            self._record_breaker(token, failed=False, elapsed=latency)
+            return response
+
+    def _record_breaker(self, token, failed, elapsed):
+        # Slowness is that of the tier that answered, not of the escalation
+        if self.breaker:
+            self.breaker.record(token, failed=failed, elapsed=elapsed)
+
+    def _generate(self, tier, messages, options, on_token=None, cancelled=None):
+        if not self.output_controller:
+            return tier.client.chat(model=tier.model, messages=messages, options=options)
+        # Stream so the controller can hang up once the reply is long enough
+        stream = tier.client.chat(model=tier.model, messages=messages, options=options, stream=True)
+        return self.output_controller.consume(stream, tier.num_predict, on_token, cancelled)
+
+    def _record_request(self, tier):
+        with self._lock:
+            self._stats[tier.name].requests += 1
+            self._total += 1
+
+    def _record_outcome(self, tier, latency=None, fallback=False, error=False):
+        with self._lock:
+            stats = self._stats[tier.name]
+            if fallback:
+                stats.fallbacks += 1
+            elif error:
+                stats.errors += 1
+            else:
+                stats.completed += 1
+                stats.latency_total += latency
+                stats.latencies.append(latency)
+
+    def stats(self):
+        with self._lock:
+            return {
+                tier.name: dict(self._stats[tier.name].snapshot(self._total), model=tier.model)
+                for tier in self.tiers
+            }
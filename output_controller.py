@@ -0,0 +1,146 @@
+import re
+import threading
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class OutputController:
+    """Consume a streamed chat generation and stop it once we have enough.
+
+    The prompt asks for short replies but the model often keeps going until
+    num_predict runs out. The controller reads the stream chunk by chunk and,
+    as soon as the sentence budget or the character budget is reached at a
+    clean sentence boundary, closes the stream (which drops the HTTP
+    connection so Ollama stops generating) and returns the trimmed reply.
+    """
+
+    # Sentence end: punctuation, optional closing quotes/brackets, then space
+    SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*(?=\s)')
+
+    def __init__(self, max_sentences=None, max_chars=None, min_chars=None, hard_limit=None, config=Config):
+        self.max_sentences = max_sentences or config.MAX_RESPONSE_SENTENCES
+        self.max_chars = max_chars or config.MAX_RESPONSE_LENGTH
+        self.min_chars = min_chars if min_chars is not None else config.MIN_RESPONSE_LENGTH
+        self.hard_limit = hard_limit or self.max_chars * 2
+        self._stop_sequences = list(config.STOP_SEQUENCES)
+        self._lock = threading.Lock()
+        self.counters = {
+            "generations": 0,
+            "stopped_early": 0,
+            "tokens_generated": 0,
+            "tokens_saved": 0,
+            "cancelled": 0,
+            "tokens_saved_cancelled": 0
+        }
+
+    def stop_sequences(self):
+        """Stop sequences to send with every generation"""
+        return list(self._stop_sequences)
+
+    def consume(self, stream, num_predict, on_token=None, cancelled=None):
+        """Read chat chunks from `stream`; returns a chat-shaped response dict.
+        
+        on_token, if given, is called with each piece of text as it arrives;
+        text past the cut point is never passed on. cancelled, if given, is
+        polled for every chunk; once it returns True the stream is closed and
+        the partial reply returned with "cancelled" set.
+        """
+        buffer = ""
+        sent = 0
+        tokens = 0
+        cut = None
+        final = {}
+        was_cancelled = False
+        try:
+            for chunk in stream:
+                tokens += 1
+                if cancelled and cancelled():
+                    was_cancelled = True
+                    break
+                buffer += chunk.get("message", {}).get("content", "")
+                if chunk.get("done"):
+                    final = chunk
+                    break
+                cut = self._cut_point(buffer, finished=False)
+                end = len(buffer) if cut is None else cut
+                if on_token and end > sent:
+                    on_token(buffer[sent:end])
+                    sent = end
+                if cut is not None:
+                    break
+        finally:
+            # Closing the generator exits the HTTP stream context and drops
+            # the connection, which is what makes Ollama stop generating
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+        if was_cancelled:
+            saved = max(0, num_predict - tokens)
+            with self._lock:
+                self.counters["generations"] += 1
+                self.counters["tokens_generated"] += tokens
+                self.counters["cancelled"] += 1
+                self.counters["tokens_saved_cancelled"] += saved
+            logger.info(f"Cancelled generation after {tokens} tokens, saved ~{saved} of {num_predict}")
+            return {
+                "message": {"role": "assistant", "content": buffer[:sent].strip()},
+                "eval_count": tokens,
+                "stopped_early": False,
+                "cancelled": True,
+                "tokens_saved": saved
+            }
+
+        stopped_early = cut is not None
+        if not stopped_early:
+            tokens = final.get("eval_count", tokens)
+            cut = self._cut_point(buffer, finished=True)
+        text = buffer[:cut] if cut is not None else buffer
+        if on_token and len(text) > sent:
+            on_token(text[sent:])
+        saved = max(0, num_predict - tokens) if stopped_early else 0
+
+        with self._lock:
+            self.counters["generations"] += 1
+            self.counters["tokens_generated"] += tokens
+            if stopped_early:
+                self.counters["stopped_early"] += 1
+                self.counters["tokens_saved"] += saved
+        if stopped_early:
+            logger.info(f"Stopped generation after {tokens} tokens, saved ~{saved} of {num_predict}")
+
+        return {
+            "message": {"role": "assistant", "content": text.strip()},
+            "eval_count": tokens,
+            "stopped_early": stopped_early,
+            "cancelled": False,
+            "tokens_saved": saved
+        }
+
+    def _cut_point(self, text, finished):
+        """Index to cut `text` at, or None to keep reading"""
+        boundaries = [m.end() for m in self.SENTENCE_END.finditer(text)]
+        if finished and text.rstrip() and (not boundaries or boundaries[-1] < len(text.rstrip())):
+            # The end of a finished generation is a boundary too
+            boundaries.append(len(text.rstrip()))
+
+        if len(boundaries) >= self.max_sentences:
+            return boundaries[self.max_sentences - 1]
+
+        if len(text) >= self.max_chars:
+            usable = [b for b in boundaries if b >= self.min_chars]
+            within = [b for b in usable if b <= self.max_chars]
+            if within:
+                return within[-1]
+            if usable:
+                return usable[0]
+            if len(text) >= self.hard_limit:
+                # One runaway sentence: give up on a clean ending, cut at a word
+                space = text.rfind(" ", 0, self.hard_limit)
+                return space if space > 0 else self.hard_limit
+        return None
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
@@ -0,0 +1,147 @@
+import threading
+import logging
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+INSTRUCTIONS = """# Instructions:
+1. Be conversational and engaging
+2. Keep responses under 3 sentences when possible
+3. Remember and reference previous conversations when relevant
+4. Use the user's name if you know it
+5. Reference the user's preferences when appropriate
+"""
+
+GUIDELINES = """# Response Guidelines:
+- Be natural and vary your responses
+- Show genuine interest in the user
+- Reference past conversations when relevant
+- Personalize responses using known information
+- Avoid repetitive or generic responses
+- Adapt to the user's communication style
+"""
+
+def personal_context(profile):
+    """The "# Personal Context" lines of the system prompt"""
+    parts = []
+    if profile.get("name"):
+        parts.append(f"The user's name is {profile['name']}.")
+    prefs = profile.get("preferences") or {}
+    if prefs.get("likes"):
+        parts.append(f"They like: {', '.join(prefs['likes'][:3])}.")
+    if prefs.get("dislikes"):
+        parts.append(f"They dislike: {', '.join(prefs['dislikes'][:2])}.")
+    if prefs.get("profession"):
+        parts.append(f"They work as: {prefs['profession']}.")
+    if prefs.get("location"):
+        parts.append(f"They're from: {prefs['location']}.")
+    return " ".join(parts)
+
+def profile_lines(profile):
+    """Profile part of memory_manager.format_context_for_prompt()"""
+    lines = []
+    if profile.get("name"):
+        lines.append(f"User's name: {profile['name']}")
+    prefs = profile.get("preferences") or {}
+    if prefs.get("likes"):
+        lines.append(f"User likes: {', '.join(prefs['likes'][:3])}")
+    if prefs.get("dislikes"):
+        lines.append(f"User dislikes: {', '.join(prefs['dislikes'][:2])}")
+    # Add other known preferences
+    for key, value in prefs.items():
+        if key not in ["likes", "dislikes"] and value:
+            if isinstance(value, list):
+                lines.append(f"User's {key}: {', '.join(value[:2])}")
+            else:
+                lines.append(f"User's {key}: {value}")
+    return lines
+
+class ProfileFragments:
+    """Prompt text derived from one version of a user's profile"""
+
+    __slots__ = ("version", "personal_block", "context_lines")
+
+    def __init__(self, version, profile):
+        self.version = version
+        self.personal_block = f"# Personal Context:\n{personal_context(profile)}\n\n"
+        self.context_lines = tuple(profile_lines(profile))
+
+class PromptCache:
+    """Precompiled system prompt fragments.
+
+    A prompt is the persona and instructions (built once), the user's
+    profile block (kept per user until the profile's version changes),
+    the tone block (one per known tone, built up front) and this turn's
+    emotional markers and memory context, in that order. The parts that
+    change least come first, so consecutive prompts of a user share the
+    longest possible byte-identical prefix with the model server's cache.
+    Only the memory context is trimmed: it gets what MAX_CONTEXT_LENGTH
+    leaves once everything but the guidelines is in, as when the guidelines
+    closed the prompt and were cut first.
+    At most `max_users` profiles are held, least recently used dropped
+    first.
+    """
+
+    def __init__(self, tones=(), max_users=None, config=Config):
+        self.max_length = config.MAX_CONTEXT_LENGTH
+        self.max_users = max_users or config.PROMPT_CACHE_MAX_USERS
+        self.head = f"You are {config.BOT_NAME}, {config.BOT_PERSONA}.\n\n{INSTRUCTIONS}\n{GUIDELINES}\n"
+        self.tone_blocks = {tone: self._tone_block(tone) for tone in tones}
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "uncached": 0, "evictions": 0}
+
+    def _tone_block(self, tone):
+        return f"# Tone:\n{tone}\n\n"
+
+    def profile(self, profile):
+        """ProfileFragments for a profile as the database returns it.
+
+        Profiles without a user id and version (defaults, test dicts) are
+        rendered every time.
+        """
+        profile = profile or {}
+        user_id = profile.get("user_id")
+        version = profile.get("version")
+        if user_id is None or version is None:
+            with self._lock:
+                self.counters["uncached"] += 1
+            return ProfileFragments(None, profile)
+        # A user archived and recreated restarts at version 1
+        key = (version, profile.get("last_updated"))
+        with self._lock:
+            fragments = self._profiles.get(user_id)
+            if fragments is not None and fragments.version == key:
+                self._profiles.move_to_end(user_id)
+                self.counters["hits"] += 1
+                return fragments
+            self.counters["misses"] += 1
+        fragments = ProfileFragments(key, profile)
+        with self._lock:
+            self._profiles[user_id] = fragments
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.max_users:
+                self._profiles.popitem(last=False)
+                self.counters["evictions"] += 1
+        return fragments
+
+    def system_prompt(self, user_context, emotional_context, user_profile):
+        tone = emotional_context['tone']
+        tone_block = self.tone_blocks.get(tone) or self._tone_block(tone)
+        prefix = "".join((
+            self.head,
+            self.profile(user_profile).personal_block,
+            tone_block,
+            f"# Emotional context:\n{emotional_context['emotional_markers']}\n\n# User Context:\n"
+        ))
+        room = self.max_length + len(GUIDELINES) - len(prefix) - 1
+        return f"{prefix}{user_context[:max(0, room)]}\n"
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["users"] = len(self._profiles)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,192 @@
+"""Replay a traffic capture (traffic_capture.py) against the app.
+
+Every captured user gets its own Socket.IO session and sends their events
+in captured order, one at a time: the next message waits for the reply to
+the previous one, as a real client does. Events are scheduled at their
+captured offset divided by --speed (1, 10, ... or "max" to send each one
+as soon as the previous reply arrives), so the arrival shape of production
+traffic is kept while per-user ordering is never broken.
+
+  python replay.py traffic_capture.jsonl --serve --speed 10
+
+--serve runs the app in-process against fake_ollama.py (the stub LLM);
+otherwise --url targets a running app. Messages captured with hashed PII
+are replaced by filler text of the captured length.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import tempfile
+import threading
+import time
+import logging
+from collections import OrderedDict
+import fake_ollama
+import load_test
+from load_test import ChatClient, LoadReport, TurnError, distribution, record_reply
+from traffic_capture import load_trace
+
+logger = logging.getLogger(__name__)
+
+# Events that produce a reply, and so are sent during replay
+REPLAYED_EVENTS = ("user_message", "request_topic")
+
+FILLER_WORDS = ("so", "today", "I", "really", "think", "about", "my", "work", "and", "the", "weekend",
+                "feel", "like", "maybe", "we", "could", "talk", "more", "music", "friends")
+
+def parse_speed(value):
+    """Time scale factor; "max" means no waiting between a user's events"""
+    if value == "max":
+        return math.inf
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+def filler_message(digest, length):
+    """Deterministic stand-in text of `length` characters for a hashed message"""
+    rng = random.Random(digest)
+    words = []
+    size = -1
+    while size < length:
+        words.append(rng.choice(FILLER_WORDS))
+        size += len(words[-1]) + 1
+    return " ".join(words)[:max(1, length)]
+
+def event_payload(entry):
+    """Socket.IO data to send for a captured event"""
+    if entry["event"] != "user_message":
+        return None
+    if "message" in entry:
+        return {"message": entry["message"]}
+    return {"message": filler_message(entry.get("message_sha"), entry.get("message_len", 20))}
+
+def group_by_user(events):
+    """{user: [events...]} in first-appearance order, replayable events only"""
+    users = OrderedDict()
+    for entry in events:
+        if entry["event"] in REPLAYED_EVENTS:
+            users.setdefault(entry.get("user"), []).append(entry)
+    return users
+
+class Replay:
+    """Runs one capture against an app URL and collects a LoadReport"""
+
+    def __init__(self, url, events, speed=1.0, turn_timeout=30.0, transports=("websocket",)):
+        self.url = url
+        self.users = group_by_user(events)
+        self.speed = speed
+        self.turn_timeout = turn_timeout
+        self.transports = transports
+        self.report = LoadReport()
+        self.trace_start = min((user_events[0]["ts"] for user_events in self.users.values()), default=0.0)
+        self.captured_latency = [
+            entry["latency_ms"] / 1000 for user_events in self.users.values() for entry in user_events
+            if entry["event"] == "user_message" and entry.get("latency_ms") is not None
+        ]
+        self._lag = []
+        self._lock = threading.Lock()
+        self.wall_start = None
+
+    def due(self, entry):
+        """Wall-clock time the event should be sent at"""
+        if math.isinf(self.speed):
+            return self.wall_start
+        return self.wall_start + (entry["ts"] - self.trace_start) / self.speed
+
+    def _wait_until(self, moment):
+        delay = moment - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def replay_user(self, user_events):
+        self._wait_until(self.due(user_events[0]))
+        client = ChatClient(self.url, self.turn_timeout, self.transports)
+        ok = False
+        try:
+            self.report.record("connect", client.connect())
+            for entry in user_events:
+                due = self.due(entry)
+                self._wait_until(due)
+                with self._lock:
+                    # How far behind the captured schedule this send is
+                    self._lag.append(max(0.0, time.perf_counter() - due))
+                record_reply(self.report, entry["event"], client.turn(entry["event"], event_payload(entry)))
+            ok = True
+        except TurnError as e:
+            self.report.record_error(e.kind)
+        finally:
+            self.report.record_session(ok)
+            client.close()
+
+    def run(self):
+        """Replay every user; returns the report summary"""
+        self.wall_start = time.perf_counter()
+        self.report.started = self.wall_start
+        threads = []
+        for index, user_events in enumerate(self.users.values()):
+            # Start each user's thread just before their first event
+            self._wait_until(self.due(user_events[0]) - 0.05)
+            thread = threading.Thread(target=self.replay_user, args=(user_events,), name=f"replay-user-{index}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        self.report.finished = time.perf_counter()
+        summary = self.report.summary()
+        summary["replay"] = {
+            "users": len(self.users),
+            "events": sum(len(user_events) for user_events in self.users.values()),
+            "speed": "max" if math.isinf(self.speed) else self.speed,
+            "trace_duration_s": round(max((e[-1]["ts"] for e in self.users.values()), default=0.0) - self.trace_start, 3),
+            "schedule_lag": distribution(self._lag),
+            "captured_turn_latency": distribution(self.captured_latency)
+        }
+        return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a traffic capture against the chat app")
+    parser.add_argument("trace", help="capture file (TRAFFIC_CAPTURE_PATH)")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="time scale: 1, 10, ... or max")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="app to replay against (ignored with --serve)")
+    parser.add_argument("--serve", action="store_true", help="run the app and a fake Ollama in this process")
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    fake_ollama.add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if load_test.socketio is None:
+        sys.exit('Replay needs the Socket.IO client: pip install "python-socketio[client]"')
+    events = load_trace(args.trace)
+    fake_server = flask_app = app_server = data_dir = None
+    url = args.url
+    if args.serve:
+        fake_server = fake_ollama.FakeOllamaServer(behaviour=fake_ollama.behaviour_from_args(args)).start()
+        data_dir = tempfile.TemporaryDirectory()
+        config = load_test.load_test_config(fake_server.url, data_dir.name)
+
+        class ReplayConfig(config):
+            # Captured traffic already went through the production rate limits;
+            # at 10x speed every user would otherwise be throttled
+            RATE_LIMIT_USER_PER_MINUTE = 1e9
+            RATE_LIMIT_USER_BURST = 10 ** 9
+
+        flask_app, app_server, url = load_test.start_app(ReplayConfig)
+
+    summary = Replay(url, events, args.speed, args.turn_timeout).run()
+    summary["server"] = load_test.fetch_metrics(url)
+    if fake_server:
+        summary["fake_ollama"] = fake_server.behaviour.stats()
+        app_server.shutdown()
+        fake_server.stop()
+        flask_app.extensions['chatbot'].close()
+        data_dir.cleanup()
+
+    output = json.dumps(summary, indent=2)
+    print(output)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            f.write(output + "\n")
@@ -0,0 +1,171 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Client message ids are opaque strings; anything else is treated as no id
+MAX_MESSAGE_ID_LENGTH = 64
+
+def valid_message_id(value):
+    return isinstance(value, str) and 0 < len(value) <= MAX_MESSAGE_ID_LENGTH
+
+class ReplyStream:
+    """Streamed tokens and final payload of one reply, readable from any offset"""
+
+    def __init__(self, user_id, message_id, clock=time.monotonic):
+        self.user_id = user_id
+        self.message_id = message_id
+        self.tokens = []
+        self.resets = 0
+        self.result = None
+        self.event = None
+        self.done = False
+        self.created = clock()
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    @property
+    def key(self):
+        return (self.user_id, self.message_id)
+
+    def append(self, token):
+        with self._cond:
+            self.tokens.append(token)
+            self._cond.notify_all()
+
+    def reset(self):
+        """Drop the streamed tokens: the reply starts over (on a larger model tier)"""
+        with self._cond:
+            self.tokens = []
+            self.resets += 1
+            self._cond.notify_all()
+
+    def finish(self, result, at, event="bot_response"):
+        with self._cond:
+            self.result = result
+            self.event = event
+            self.done = True
+            self.finished_at = at
+            self._cond.notify_all()
+
+    def follow(self, offset=0, timeout=30.0):
+        """Yield (offset, token) from `offset` on until the reply is finished.
+
+        If the reply starts over meanwhile, (0, None) is yielded and the
+        tokens follow again from offset 0. Stops early if no new token
+        arrives within `timeout` seconds; the caller can tell by `done`
+        still being False.
+        """
+        index = max(0, offset)
+        with self._cond:
+            resets = self.resets
+        while True:
+            with self._cond:
+                if index >= len(self.tokens) and not self.done and self.resets == resets:
+                    self._cond.wait(timeout)
+                restarted = self.resets != resets
+                if restarted:
+                    resets = self.resets
+                    index = 0
+                tokens = self.tokens[index:]
+                done = self.done
+            if restarted:
+                yield 0, None
+            elif not tokens and not done:
+                return
+            for token in tokens:
+                yield index, token
+                index += 1
+            if done and index >= len(self.tokens):
+                return
+
+class ReplyCache:
+    """Short-lived replies keyed by (user_id, client message id).
+
+    A retried or duplicated user_message whose id is already here does not
+    start a second generation: the sender follows the running one, or gets
+    the finished reply replayed, from the token offset it already has.
+    Finished replies are kept for `ttl` seconds; at most `max_entries` are
+    held, oldest dropped first.
+    """
+
+    def __init__(self, ttl=None, max_entries=None, config=Config, clock=time.monotonic):
+        self.ttl = ttl if ttl is not None else config.REPLY_CACHE_TTL
+        self.max_entries = max_entries or config.REPLY_CACHE_MAX_ENTRIES
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            "started": 0,
+            "duplicates": 0,
+            "followed_running": 0,
+            "replayed_finished": 0,
+            "tokens_replayed": 0,
+            "expired": 0,
+            "evicted": 0
+        }
+
+    def begin(self, user_id, message_id):
+        """(stream, created): a new stream, or the existing one for this message"""
+        key = (user_id, message_id)
+        with self._lock:
+            self._expire()
+            stream = self._entries.get(key)
+            if stream is not None:
+                self.counters["duplicates"] += 1
+                self.counters["followed_running" if not stream.done else "replayed_finished"] += 1
+                return stream, False
+            stream = ReplyStream(user_id, message_id, self.clock)
+            self._entries[key] = stream
+            self.counters["started"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evicted"] += 1
+            return stream, True
+
+    def get(self, user_id, message_id):
+        with self._lock:
+            self._expire()
+            return self._entries.get((user_id, message_id))
+
+    def finish(self, stream, result, keep=True, event="bot_response"):
+        """Complete a stream and wake its followers.
+
+        With keep=False (busy, fallback and error replies) the entry is
+        dropped, so a retry of the message generates again.
+        """
+        stream.finish(result, self.clock(), event)
+        if not keep:
+            self.discard(stream)
+
+    def discard(self, stream):
+        with self._lock:
+            if self._entries.get(stream.key) is stream:
+                del self._entries[stream.key]
+
+    def note_replayed(self, tokens):
+        with self._lock:
+            self.counters["tokens_replayed"] += tokens
+
+    def _expire(self):
+        # Entries are in creation order, so finished ones expire roughly in
+        # order: stop at the first one still fresh, skip running ones
+        cutoff = self.clock() - self.ttl
+        expired = []
+        for key, stream in self._entries.items():
+            if not stream.done:
+                continue
+            if stream.finished_at >= cutoff:
+                break
+            expired.append(key)
+        for key in expired:
+            del self._entries[key]
+        self.counters["expired"] += len(expired)
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for stream in self._entries.values() if not stream.done)
+            return dict(self.counters, entries=len(self._entries), running=running)
@@ -0,0 +1,193 @@
+import threading
+import logging
+import ollama
+from config import Config
+from admission import AdmissionGate
+from cancellation import ActiveGenerations
+from archive import UserArchiver
+from batch_chat import BatchChat
+from circuit_breaker import CircuitBreaker
+from emotion_engine import EmotionEngine
+from fact_extraction import FactExtractor
+from fallback import FallbackResponder
+from memory_manager import MemoryManager as ChatMemoryManager
+from model_router import ModelRouter
+from output_controller import OutputController
+from prompt_cache import PromptCache
+from reply_cache import ReplyCache
+from sharding import open_memory_store
+from static_assets import StaticAssets
+from summarizer import LLMSummarizer, RollingSummarizer
+from traffic_capture import TrafficRecorder
+
+logger = logging.getLogger(__name__)
+
+class ChatServices:
+    """Subsystems used by the chat handlers, built on first use.
+
+    Nothing here touches the database or the network when the app is
+    created, so importing the app (tests, gunicorn workers) stays cheap.
+    Each subsystem is constructed once, the first time a handler asks for
+    it, or all together via init_all() when eager startup is wanted.
+    """
+
+    def __init__(self, config=Config):
+        self.config = config
+        self._lock = threading.RLock()
+        self._instances = {}
+        self._maintenance_thread = None
+
+    def _get(self, name, factory):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = factory()
+                    self._instances[name] = instance
+        return instance
+
+    @property
+    def db(self):
+        return self._get("db", self._create_db)
+
+    @property
+    def emotion_engine(self):
+        return self._get("emotion_engine", EmotionEngine)
+
+    @property
+    def memory_manager(self):
+        return self._get("memory_manager", lambda: ChatMemoryManager(
+            self.db,
+            summarizer=self.summarizer,
+            fact_extractor=self.fact_extractor if self.config.FACT_EXTRACTION_LLM else None,
+            prompt_cache=self.prompt_cache
+        ))
+
+    @property
+    def prompt_cache(self):
+        return self._get("prompt_cache", lambda: PromptCache(self.emotion_engine.tone_profiles, config=self.config))
+
+    @property
+    def fact_extractor(self):
+        return self._get("fact_extractor", lambda: FactExtractor(
+            self.db,
+            ollama.Client(host=self.config.OLLAMA_BASE_URL, timeout=self.config.TIMEOUT),
+            self.config.FACT_EXTRACTION_MODEL,
+            self.admission_gate.controller,
+            config=self.config
+        ))
+    
+    @property
+    def summarizer(self):
+        return self._get("summarizer", self._create_summarizer)
+
+    @property
+    def archiver(self):
+        return self._get("archiver", lambda: UserArchiver(self.db, config=self.config))
+
+    @property
+    def admission_gate(self):
+        return self._get("admission_gate", lambda: AdmissionGate(self.config))
+
+    @property
+    def fallback_responder(self):
+        return self._get("fallback_responder", lambda: FallbackResponder(self.db, self.emotion_engine))
+
+    @property
+    def llm_breaker(self):
+        # Ollama calls are guarded by a circuit breaker so an outage fails
+        # fast instead of tying up a thread for every message
+        return self._get("llm_breaker", lambda: CircuitBreaker(
+            name="ollama",
+            window=self.config.BREAKER_WINDOW,
+            min_calls=self.config.BREAKER_MIN_CALLS,
+            failure_rate=self.config.BREAKER_FAILURE_RATE,
+            slow_call_seconds=self.config.BREAKER_SLOW_CALL_SECONDS,
+            slow_call_rate=self.config.BREAKER_SLOW_CALL_RATE,
+            open_seconds=self.config.BREAKER_OPEN_SECONDS,
+            half_open_calls=self.config.BREAKER_HALF_OPEN_CALLS
+        ))
+
+    @property
+    def output_controller(self):
+        return self._get("output_controller", lambda: OutputController(config=self.config))
+
+    @property
+    def model_router(self):
+        # Tiered models (each client with its own timeout) chosen per message;
+        # the output controller stops each stream once the reply budget is hit
+        return self._get("model_router", lambda: ModelRouter.from_config(
+            breaker=self.llm_breaker,
+            output_controller=self.output_controller,
+            config=self.config
+        ))
+
+    @property
+    def generations(self):
+        return self._get("generations", lambda: ActiveGenerations(config=self.config))
+
+    @property
+    def reply_cache(self):
+        return self._get("reply_cache", lambda: ReplyCache(config=self.config))
+
+    @property
+    def batch_chat(self):
+        return self._get("batch_chat", lambda: BatchChat(self, config=self.config))
+
+    @property
+    def static_assets(self):
+        return self._get("static_assets", lambda: StaticAssets(config=self.config))
+
+    @property
+    def traffic_recorder(self):
+        return self._get("traffic_recorder", lambda: TrafficRecorder(config=self.config))
+
+    def _create_db(self):
+        db = open_memory_store(self.config)
+        # Retention cleanup used to block import; run it off the request path
+        self._maintenance_thread = threading.Thread(target=self._maintenance, args=(db,), name="memory-cleanup", daemon=True)
+        self._maintenance_thread.start()
+        return db
+
+    def _maintenance(self, db):
+        db.run_online_migrations()
+        db.cleanup_old_memories()
+        db.enforce_memory_quota()
+        # Keep hot tables proportional to active users
+        self.archiver.archive_inactive()
+
+    def _create_summarizer(self):
+        llm = None
+        if self.config.SUMMARY_USE_LLM:
+            # Rollups are rewritten by the model only while chat traffic is idle
+            llm = LLMSummarizer(
+                ollama.Client(host=self.config.OLLAMA_BASE_URL, timeout=self.config.TIMEOUT),
+                self.config.SUMMARY_MODEL,
+                self.admission_gate.controller
+            )
+        return RollingSummarizer(self.db, llm=llm, config=self.config)
+    
+    def init_all(self):
+        """Eagerly build every subsystem (e.g. before serving traffic)"""
+        for name in ("db", "archiver", "emotion_engine", "summarizer", "memory_manager", "admission_gate",
+                     "fallback_responder", "llm_breaker", "output_controller", "model_router", "reply_cache", "generations",
+                     "static_assets", "prompt_cache"):
+            getattr(self, name)
+        return self
+
+    def is_initialized(self, name):
+        return name in self._instances
+
+    def close(self):
+        """Let background work on the database finish, then close it"""
+        if self._maintenance_thread is not None:
+            self._maintenance_thread.join()
+        if self.is_initialized("summarizer"):
+            self.summarizer.flush()
+        if self.is_initialized("fact_extractor"):
+            self.fact_extractor.flush()
+        if self.is_initialized("traffic_recorder"):
+            self.traffic_recorder.close()
+        if self.is_initialized("db"):
+            self.db.close()
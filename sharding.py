@@ -0,0 +1,332 @@
+import argparse
+import hashlib
+import os
+import threading
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from config import Config
+import emotion_codec
+from database import USER_TABLES, MemoryManager
+
+logger = logging.getLogger(__name__)
+
+def jump_hash(user_id, buckets):
+    """Stable shard index for user_id (jump consistent hash).
+
+    Growing from n to n + 1 shards only moves about 1/(n + 1) of the users,
+    unlike a plain modulo which reshuffles almost all of them.
+    """
+    key = int.from_bytes(hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).digest(), "big")
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+def shard_paths(db_path, shard_count):
+    """One shard is the plain database file, so unsharded setups keep working"""
+    if shard_count == 1:
+        return [db_path]
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}.{i}-of-{shard_count}{ext or '.db'}" for i in range(shard_count)]
+
+def manifest_path(db_path):
+    return os.path.splitext(db_path)[0] + ".shards"
+
+def read_shard_count(db_path, default=1):
+    """Shard count recorded by the last reshard, else `default`"""
+    try:
+        with open(manifest_path(db_path)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return default
+
+def write_shard_count(db_path, shard_count):
+    tmp_path = manifest_path(db_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"{shard_count}\n")
+    os.replace(tmp_path, manifest_path(db_path))
+
+def open_memory_store(config=Config):
+    """The app's memory store: a single file, or shards when configured"""
+    shard_count = read_shard_count(config.SQLITE_DB, config.SQLITE_SHARDS)
+    if shard_count == 1:
+        return MemoryManager(config.SQLITE_DB)
+    return ShardedMemoryManager(config.SQLITE_DB, shard_count)
+
+def copy_user(source, target, user_id):
+    """Move every row of `user_id` from one shard to another.
+
+    Autoincrement ids are reassigned by the target. Any partial copy left on
+    the target by an interrupted move is cleared first, so re-running a move
+    never duplicates rows.
+    """
+    with source._write_lock, target._write_lock:
+        read = source.conn.cursor()
+        write = target.conn.cursor()
+        try:
+            for table in USER_TABLES:
+                write.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+                read.execute(f"SELECT * FROM {table} WHERE user_id = ?", (user_id,))
+                rows = read.fetchall()
+                if not rows:
+                    continue
+                columns = [column for column in rows[0].keys() if column != "id"]
+                write.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [[row[column] for column in columns] for row in rows]
+                )
+            target.conn.commit()
+        except Exception:
+            target.conn.rollback()
+            raise
+        try:
+            for table in USER_TABLES:
+                read.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            source.conn.commit()
+        except Exception:
+            source.conn.rollback()
+            raise
+
+def _routed(name):
+    def method(self, user_id, *args, **kwargs):
+        with self.pinned(user_id) as shard:
+            return getattr(shard, name)(user_id, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(MemoryManager, name).__doc__
+    return method
+
+class ShardedMemoryManager:
+    """database.MemoryManager spread over several SQLite files.
+
+    Each user lives in exactly one shard, picked by jump_hash(user_id), and
+    every shard has its own connection and write lock, so writes for users
+    on different shards no longer queue behind one SQLite writer. The
+    per-user API is the same as MemoryManager's; maintenance (migrations on
+    open, cleanup, vacuum) runs on all shards in parallel.
+
+    reshard() moves users to a new shard count while the store stays in
+    use: each user is moved only when none of their calls are in flight,
+    and calls for that user wait until the move is done. It coordinates
+    threads of one process, so run it in the serving process only when it
+    is the only one, or with the app stopped (python sharding.py --to N).
+    """
+
+    def __init__(self, db_path=None, shard_count=None):
+        self.db_path = db_path or Config.SQLITE_DB
+        shard_count = shard_count or read_shard_count(self.db_path, Config.SQLITE_SHARDS)
+        self._cond = threading.Condition()
+        self._inflight = Counter()
+        self._moving = set()
+        self._moved = set()
+        self._swapping = False
+        self._next_shards = None
+        self._reshard_lock = threading.Lock()
+        self._shards = self._open(shard_count)
+        logger.info(f"Using {shard_count} SQLite shards for memory storage")
+
+    def _open(self, shard_count):
+        # Opening a shard runs its schema migrations; do them side by side
+        with ThreadPoolExecutor(max_workers=shard_count) as pool:
+            return list(pool.map(MemoryManager, shard_paths(self.db_path, shard_count)))
+
+    @property
+    def shard_count(self):
+        return len(self._shards)
+
+    @property
+    def shards(self):
+        return self._shards + (self._next_shards or [])
+
+    def shard_for(self, user_id):
+        if self._next_shards is not None and user_id in self._moved:
+            return self._next_shards[jump_hash(user_id, len(self._next_shards))]
+        return self._shards[jump_hash(user_id, len(self._shards))]
+
+    @contextmanager
+    def pinned(self, user_id):
+        """The shard holding `user_id`; the user is not moved until the block exits"""
+        with self._cond:
+            while self._swapping or user_id in self._moving:
+                self._cond.wait()
+            self._inflight[user_id] += 1
+            shard = self.shard_for(user_id)
+        try:
+            yield shard
+        finally:
+            with self._cond:
+                self._inflight[user_id] -= 1
+                if not self._inflight[user_id]:
+                    del self._inflight[user_id]
+                self._cond.notify_all()
+
+    @contextmanager
+    def pinned_many(self, user_ids):
+        """[(shard, user_ids)] for a group of users, all pinned at once.
+        
+        Pinning them one by one could deadlock with a reshard swap waiting
+        for the users already pinned.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        with self._cond:
+            while self._swapping or self._moving.intersection(user_ids):
+                self._cond.wait()
+            groups = {}
+            for user_id in user_ids:
+                self._inflight[user_id] += 1
+                shard = self.shard_for(user_id)
+                groups.setdefault(id(shard), (shard, []))[1].append(user_id)
+        try:
+            yield list(groups.values())
+        finally:
+            with self._cond:
+                for user_id in user_ids:
+                    self._inflight[user_id] -= 1
+                    if not self._inflight[user_id]:
+                        del self._inflight[user_id]
+                self._cond.notify_all()
+
+    def get_user_contexts(self, user_ids, *args, **kwargs):
+        contexts = {}
+        with self.pinned_many(user_ids) as groups:
+            for shard, shard_users in groups:
+                contexts.update(shard.get_user_contexts(shard_users, *args, **kwargs))
+        return contexts
+
+    def store_exchanges(self, exchanges):
+        with self.pinned_many(exchange["user_id"] for exchange in exchanges) as groups:
+            stored = True
+            for shard, shard_users in groups:
+                members = set(shard_users)
+                stored = shard.store_exchanges([exchange for exchange in exchanges if exchange["user_id"] in members]) and stored
+            return stored
+
+    get_user_profile = _routed("get_user_profile")
+    update_user_profile = _routed("update_user_profile")
+    store_memory = _routed("store_memory")
+    store_turns = _routed("store_turns")
+    get_recent_turns = _routed("get_recent_turns")
+    get_recent_memories = _routed("get_recent_memories")
+    get_important_memories = _routed("get_important_memories")
+    create_memory_summary = _routed("create_memory_summary")
+    get_memory_summaries = _routed("get_memory_summaries")
+    get_summary_set = _routed("get_summary_set")
+    get_summary_for_period = _routed("get_summary_for_period")
+    replace_summaries = _routed("replace_summaries")
+    update_summary_text = _routed("update_summary_text")
+    get_conversation_history = _routed("get_conversation_history")
+    get_conversation_page = _routed("get_conversation_page")
+    get_memory_count = _routed("get_memory_count")
+    # Pins the user per page, not for the whole iteration
+    iter_conversation_history = MemoryManager.iter_conversation_history
+
+    def _fan_out(self, name):
+        shards = self.shards
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            return list(pool.map(lambda shard: getattr(shard, name)(), shards))
+
+    def cleanup_old_memories(self):
+        self._fan_out("cleanup_old_memories")
+
+    def vacuum(self):
+        return all(self._fan_out("vacuum"))
+
+    def enforce_memory_quota(self):
+        return sum(self._fan_out("enforce_memory_quota"))
+
+    def run_online_migrations(self):
+        return sum(self._fan_out("run_online_migrations"))
+
+    def list_users(self):
+        return [user_id for users in self._fan_out("list_users") for user_id in users]
+
+    def get_tone_counts(self, user_id=None):
+        if user_id is not None:
+            with self.pinned(user_id) as shard:
+                return shard.get_tone_counts(user_id)
+        totals = Counter()
+        for counts in self._fan_out("get_tone_counts"):
+            totals.update(counts)
+        return dict(totals)
+
+    def get_emotion_arrays(self, user_id=None):
+        if user_id is not None:
+            with self.pinned(user_id) as shard:
+                return shard.get_emotion_arrays(user_id)
+        parts = self._fan_out("get_emotion_arrays")
+        np = emotion_codec.np
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+    def reshard(self, shard_count):
+        """Move every user onto `shard_count` shards; returns users moved"""
+        with self._reshard_lock:
+            if shard_count == len(self._shards):
+                return 0
+            next_shards = self._open(shard_count)
+            with self._cond:
+                self._next_shards = next_shards
+                self._moved = set()
+
+            moved = 0
+            # Users first seen mid-move land on the old shards; sweep until empty
+            while True:
+                pending = [user_id for shard in self._shards for user_id in shard.list_users()]
+                if not pending:
+                    break
+                for user_id in pending:
+                    self._move_user(user_id)
+                    moved += 1
+
+            with self._cond:
+                self._swapping = True
+                while self._inflight:
+                    self._cond.wait()
+                old_shards = self._shards
+                self._shards = next_shards
+                self._next_shards = None
+                self._moved = set()
+                self._swapping = False
+                self._cond.notify_all()
+            write_shard_count(self.db_path, shard_count)
+            for shard in old_shards:
+                shard.conn.close()
+            logger.info(f"Resharded {moved} users onto {shard_count} shards")
+            return moved
+
+    def _move_user(self, user_id):
+        with self._cond:
+            self._moving.add(user_id)
+            while self._inflight.get(user_id):
+                self._cond.wait()
+        try:
+            copy_user(
+                self._shards[jump_hash(user_id, len(self._shards))],
+                self._next_shards[jump_hash(user_id, len(self._next_shards))],
+                user_id
+            )
+            with self._cond:
+                self._moved.add(user_id)
+        finally:
+            with self._cond:
+                self._moving.discard(user_id)
+                self._cond.notify_all()
+
+    def close(self):
+        for shard in self.shards:
+            shard.conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move every user of the memory store onto a new shard count")
+    parser.add_argument("--to", type=int, required=True, dest="shard_count", help="target number of shards")
+    parser.add_argument("--db", default=Config.SQLITE_DB, help="base database path (SQLITE_DB)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = ShardedMemoryManager(args.db)
+    before = store.shard_count
+    moved = store.reshard(args.shard_count)
+    print(f"Moved {moved} users from {before} to {args.shard_count} shards")
+    store.close()
@@ -0,0 +1,120 @@
+import os
+import gzip
+import hashlib
+import logging
+import mimetypes
+from flask import Response, request
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Preferred first when the browser accepts several
+ENCODINGS = ("br", "gzip")
+# Compressing tiny or already-compressed files costs more than it saves
+COMPRESS_MIN_SIZE = 256
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+class Asset:
+    """One static file: its bytes, content hash and pre-compressed variants"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        self.hashed_name = f"{stem}.{self.digest}{ext}"
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.variants = {"identity": data}
+        if len(data) >= COMPRESS_MIN_SIZE and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            self._compress(data)
+
+    def _compress(self, data):
+        candidates = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates["br"] = brotli.compress(data, quality=11)
+        for encoding, compressed in candidates.items():
+            if len(compressed) < len(data):
+                self.variants[encoding] = compressed
+
+    def negotiate(self, accept_encodings):
+        """Smallest representation the client accepts: (encoding, bytes)"""
+        for encoding in ENCODINGS:
+            if encoding in self.variants and accept_encodings[encoding]:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+class StaticAssets:
+    """Fingerprinted static files served from memory.
+
+    Every file under `folder` is read once, hashed and compressed (gzip, and
+    brotli when the module is installed) when the manifest is built, so a
+    request only picks a variant. Pages link assets with url(), which gives
+    the content-hashed name, e.g. /static/style.3f2a9c1b7e4d.css: those are
+    immutable and cached for STATIC_MAX_AGE. The plain name still works for
+    old links but must be revalidated (ETag, 304) on every use.
+    """
+
+    def __init__(self, folder=None, max_age=None, url_prefix="/static", config=Config):
+        self.folder = folder or config.STATIC_FOLDER
+        self.max_age = config.STATIC_MAX_AGE if max_age is None else max_age
+        self.url_prefix = url_prefix
+        self._assets = {}
+        self._by_hashed_name = {}
+        self.build()
+
+    def build(self):
+        assets = {}
+        for root, _, files in os.walk(self.folder):
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.folder).replace(os.sep, "/")
+                try:
+                    with open(path, "rb") as f:
+                        assets[name] = Asset(name, f.read())
+                except OSError as e:
+                    logger.error(f"Error reading static file {path}: {e}")
+        self._assets = assets
+        self._by_hashed_name = {asset.hashed_name: asset for asset in assets.values()}
+        logger.info(f"Static assets: {len(assets)} files from {self.folder}" + ("" if brotli else " (brotli not installed, gzip only)"))
+
+    def url(self, name):
+        asset = self._assets.get(name)
+        return f"{self.url_prefix}/{asset.hashed_name if asset else name}"
+
+    def lookup(self, name):
+        """(asset, immutable) for a hashed or plain name; (None, False) if unknown"""
+        asset = self._by_hashed_name.get(name)
+        if asset is not None:
+            return asset, True
+        return self._assets.get(name), False
+
+    def response(self, name):
+        asset, immutable = self.lookup(name)
+        if asset is None:
+            return Response("Not found", status=404, mimetype="text/plain")
+        encoding, data = asset.negotiate(request.accept_encodings)
+        # One strong ETag per representation, as the bytes differ
+        etag = asset.digest if encoding == "identity" else f"{asset.digest}-{encoding}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(data, mimetype=asset.mimetype)
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        if immutable:
+            response.headers["Cache-Control"] = f"public, max-age={self.max_age}, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def stats(self):
+        return {
+            name: {encoding: len(data) for encoding, data in asset.variants.items()}
+            for name, asset in self._assets.items()
+        }
@@ -0,0 +1,248 @@
+import queue
+import re
+import threading
+import time
+import logging
+from collections import Counter
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SESSION = "session"
+DAILY = "daily"
+LONG_TERM = "long_term"
+
+TOPIC_KEYWORDS = {
+    'movies': ('movie', 'film'),
+    'music': ('music', 'song'),
+    'reading': ('book', 'read'),
+    'sports': ('sport', 'game'),
+    'work': ('work', 'job'),
+    'travel': ('travel', 'vacation')
+}
+
+LEGACY_SUMMARY = re.compile(r'Conversation about (.+?)\. Overall tone was (\w+)\. (\d+) exchanges\.')
+
+def extract_topics(text):
+    """Simple keyword topic extraction (in a real implementation, use NLP)"""
+    text = text.lower()
+    return [topic for topic, words in TOPIC_KEYWORDS.items() if any(word in text for word in words)]
+
+def summarize_exchanges(exchanges):
+    """Structured summary data for one session's buffered exchanges"""
+    topics = Counter()
+    tones = Counter()
+    for exchange in exchanges:
+        topics.update(extract_topics(exchange.get('user_input', '')))
+        if 'emotional_context' in exchange:
+            tones[exchange['emotional_context'].get('tone', 'neutral')] += 1
+    return {
+        "topics": dict(topics),
+        "tones": dict(tones),
+        "exchanges": len(exchanges),
+        "sessions": 1
+    }
+
+def merge_summary_data(items):
+    """Fold several summaries' data into one (counts add up)"""
+    topics = Counter()
+    tones = Counter()
+    exchanges = 0
+    sessions = 0
+    for data in items:
+        topics.update(data.get("topics", {}))
+        tones.update(data.get("tones", {}))
+        exchanges += data.get("exchanges", 0)
+        sessions += data.get("sessions", 1)
+    return {"topics": dict(topics), "tones": dict(tones), "exchanges": exchanges, "sessions": sessions}
+
+def parse_legacy_summary(text):
+    """Recover structured data from a pre-tier flat summary row"""
+    match = LEGACY_SUMMARY.search(text or "")
+    if not match:
+        return {"topics": {}, "tones": {}, "exchanges": 0, "sessions": 1}
+    topics = [] if match.group(1) == "various topics" else match.group(1).split(", ")
+    return {
+        "topics": {topic: 1 for topic in topics},
+        "tones": {match.group(2): 1},
+        "exchanges": int(match.group(3)),
+        "sessions": 1
+    }
+
+def top_topics(data, limit=3):
+    topics = data.get("topics") or {}
+    return [topic for topic, _ in sorted(topics.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+
+def render_summary(tier, data, period=None):
+    """Human-readable text for a summary row"""
+    topics = top_topics(data)
+    topic_str = ", ".join(topics) if topics else "various topics"
+    tones = data.get("tones") or {}
+    tone = max(tones.items(), key=lambda item: item[1])[0] if tones else "neutral"
+
+    if tier == SESSION:
+        return f"Conversation about {topic_str}. Overall tone was {tone}. {data.get('exchanges', 0)} exchanges."
+    if tier == DAILY:
+        return f"On {period}: talked about {topic_str} across {data.get('sessions', 1)} conversations, mostly {tone}."
+    return (f"Over {data.get('sessions', 1)} conversations ({data.get('exchanges', 0)} exchanges) "
+            f"they most often talked about {topic_str}; usual tone {tone}.")
+
+class LLMSummarizer:
+    """Optional model-written rollup text, produced in batches when the model is idle"""
+
+    def __init__(self, client, model, admission_controller=None, num_predict=200):
+        self.client = client
+        self.model = model
+        self.admission_controller = admission_controller
+        self.num_predict = num_predict
+
+    def is_idle(self):
+        # Never compete with live chat traffic for a generation slot
+        if not self.admission_controller:
+            return True
+        stats = self.admission_controller.stats()
+        return stats["inflight"] == 0 and stats["queued"] == 0
+
+    def summarize_batch(self, items):
+        """items: list of source texts; returns one summary (or None) per item.
+
+        The call holds an admission slot like a chat turn, so turns that
+        arrive meanwhile still count it against MAX_INFLIGHT_GENERATIONS.
+        """
+        if not items or not self.is_idle():
+            return [None] * len(items)
+        if self.admission_controller is not None and not self.admission_controller.acquire():
+            return [None] * len(items)
+        numbered = "\n".join(f"{i + 1}. {text}" for i, text in enumerate(items))
+        prompt = (
+            "Rewrite each numbered note below as one short, natural sentence describing "
+            "what the user and the assistant talked about. Answer with the same numbers, "
+            "one line each.\n\n" + numbered
+        )
+        try:
+            response = self.client.chat(
+                model=self.model,
+                messages=[{'role': 'user', 'content': prompt}],
+                options={'temperature': 0.2, 'num_predict': self.num_predict}
+            )
+        except Exception as e:
+            logger.warning(f"LLM summarization skipped: {e}")
+            return [None] * len(items)
+        finally:
+            if self.admission_controller is not None:
+                self.admission_controller.release()
+
+        results = [None] * len(items)
+        for line in response['message']['content'].splitlines():
+            match = re.match(r'\s*(\d+)[.):]\s*(.+)', line)
+            if match and 1 <= int(match.group(1)) <= len(items):
+                results[int(match.group(1)) - 1] = match.group(2).strip()
+        return results
+
+class RollingSummarizer:
+    """Hierarchical per-user summaries maintained off the request path.
+
+    Finished sessions are queued and written by a background worker as
+    `session` summaries. Each user keeps at most SUMMARY_MAX_SESSIONS of
+    those; older ones are folded into one `daily` summary per day, and
+    dailies beyond SUMMARY_MAX_DAILY are folded into a single `long_term`
+    summary. Every step only touches the rows being rolled up, so the
+    per-user summary count (and the context built from it) stays constant.
+    """
+
+    def __init__(self, database, llm=None, config=Config):
+        self.db = database
+        self.llm = llm
+        self.max_sessions = config.SUMMARY_MAX_SESSIONS
+        self.max_daily = config.SUMMARY_MAX_DAILY
+        self.batch_size = config.SUMMARY_BATCH_SIZE
+        self.batch_window = config.SUMMARY_BATCH_WINDOW
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, user_id, exchanges):
+        """Queue a finished session for background summarization"""
+        self._queue.put((user_id, list(exchanges)))
+        self._ensure_worker()
+
+    def summarize_now(self, user_id, exchanges):
+        """Summarize and compact synchronously"""
+        self._process([(user_id, list(exchanges))])
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        self._queue.join()
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="summarizer", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Give other sessions a moment to finish so they share one batch
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                logger.error(f"Error summarizing conversations: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _process(self, jobs):
+        rollups = []
+        for user_id, exchanges in jobs:
+            if exchanges:
+                data = summarize_exchanges(exchanges)
+                self.db.create_memory_summary(user_id, render_summary(SESSION, data), tier=SESSION, summary_data=data)
+            rollups.extend((user_id, summary_id, text) for summary_id, text in self.compact(user_id))
+
+        if self.llm and rollups:
+            texts = self.llm.summarize_batch([text for _, _, text in rollups])
+            for (user_id, summary_id, _), text in zip(rollups, texts):
+                if text:
+                    self.db.update_summary_text(user_id, summary_id, text)
+
+    def compact(self, user_id):
+        """Roll overflowing tiers upward; returns [(summary_id, text)] rewritten"""
+        rewritten = []
+
+        sessions = self.db.get_memory_summaries(user_id, limit=None, tier=SESSION, oldest_first=True)
+        overflow = sessions[:max(0, len(sessions) - self.max_sessions)]
+        by_day = {}
+        for row in overflow:
+            by_day.setdefault(row["created_at"][:10], []).append(row)
+        for period, rows in by_day.items():
+            rewritten.append(self._fold(user_id, DAILY, period, rows))
+
+        dailies = self.db.get_memory_summaries(user_id, limit=None, tier=DAILY, oldest_first=True)
+        overflow = dailies[:max(0, len(dailies) - self.max_daily)]
+        if overflow:
+            rewritten.append(self._fold(user_id, LONG_TERM, None, overflow))
+
+        return rewritten
+
+    def _fold(self, user_id, tier, period, rows):
+        """Merge `rows` into the (user, tier, period) summary and delete them"""
+        target = self.db.get_summary_for_period(user_id, tier, period)
+        parts = [row["data"] or parse_legacy_summary(row["text"]) for row in rows]
+        if target:
+            parts.append(target["data"] or parse_legacy_summary(target["text"]))
+        data = merge_summary_data(parts)
+        text = render_summary(tier, data, period)
+        summary_id = self.db.replace_summaries(
+            user_id,
+            [row["id"] for row in rows],
+            target["id"] if target else None,
+            text, tier, data, period
+        )
+        return summary_id, text
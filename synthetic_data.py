@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import random
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from config import Config
+import emotion_codec
+from database import MemoryManager
+from load_test import JOBS, NAMES, PLACES, THINGS, MessageMix
+from summarizer import DAILY, LONG_TERM, SESSION, merge_summary_data, render_summary, summarize_exchanges
+
+logger = logging.getLogger(__name__)
+
+REPLIES = (
+    "That sounds lovely! What do you enjoy most about it?",
+    "I'm sorry you're going through that. Want to talk about it?",
+    "Great question! I'd start small and build a routine.",
+    "Haha, I know what you mean. How was the rest of your day?",
+    "Thanks for telling me, I'll remember that."
+)
+
+# Tone codes are not uniform in real traffic: mostly friendly
+TONE_WEIGHTS = (50, 10, 15, 15, 10)
+
+def user_id_for(index):
+    return f"user-{index:06d}"
+
+def memories_per_user(rng, scale=3.0, alpha=1.16, cap=None):
+    """Pareto-distributed memory count: most users have a handful, a few hit the quota.
+
+    alpha 1.16 is the classic 80/20 split; cap defaults to MAX_MEMORIES_PER_USER.
+    """
+    cap = cap or Config.MAX_MEMORIES_PER_USER
+    return max(1, min(cap, int(scale * rng.paretovariate(alpha))))
+
+def _timestamp(moment):
+    # Same format as CURRENT_TIMESTAMP (UTC)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def _profile(rng, user_id):
+    preferences = {
+        "likes": rng.sample(THINGS, rng.randint(1, 3)),
+        "dislikes": rng.sample(THINGS, rng.randint(0, 2))
+    }
+    if rng.random() < 0.5:
+        preferences["profession"] = rng.choice(JOBS)
+    if rng.random() < 0.4:
+        preferences["location"] = rng.choice(PLACES)
+    return (user_id, rng.choice(NAMES), json.dumps(preferences), json.dumps({}))
+
+class _Pools:
+    """Pre-drawn messages, emotion values and session summaries.
+
+    Drawing from pools instead of building every row from scratch keeps
+    generating 100k users to well under a minute.
+    """
+
+    def __init__(self, rng, size=2048):
+        mix = MessageMix(rng)
+        self.exchanges = []
+        for _ in range(size):
+            kind, message = mix.next()
+            reply = rng.choice(REPLIES)
+            if kind == "personal":
+                memory = (f"User likes {rng.choice(THINGS)}", "preference", 2)
+            else:
+                memory = (f"User: {message[:100]}... | Bot: {reply[:100]}...", "conversation_exchange", 1)
+            self.exchanges.append((message, reply, memory))
+        self.emotions = [
+            emotion_codec.encode({
+                "tone": rng.choices(emotion_codec.TONES, weights=TONE_WEIGHTS)[0],
+                "emotion_scores": {emotion: rng.random() for emotion in emotion_codec.EMOTIONS}
+            })
+            for _ in range(size)
+        ]
+        self.sessions = [
+            summarize_exchanges([
+                {"user_input": rng.choice(self.exchanges)[0], "emotional_context": {"tone": rng.choice(emotion_codec.TONES)}}
+                for _ in range(Config.MEMORY_SUMMARY_THRESHOLD)
+            ])
+            for _ in range(size // 4)
+        ]
+
+def _user_rows(rng, pools, user_id, memory_count, now):
+    """Rows for one user across all per-user tables"""
+    moment = now - timedelta(days=min(60.0, rng.expovariate(1 / 10)))
+    memories = []
+    exchanges = []
+    for _ in range(memory_count):
+        message, reply, (text, memory_type, importance) = rng.choice(pools.exchanges)
+        created_at = _timestamp(moment)
+        memories.append((user_id, text, memory_type, importance, created_at) + rng.choice(pools.emotions))
+        exchanges.append((message, reply, created_at))
+        moment -= timedelta(minutes=rng.expovariate(1 / 240))
+    memories.reverse()
+    exchanges.reverse()
+
+    # conversation_turns keeps only the tail (MAX_TURNS_PER_USER)
+    turns = []
+    tail = exchanges[-(Config.MAX_TURNS_PER_USER // 2):]
+    for seq, (message, reply, created_at) in enumerate(tail):
+        turns.append((user_id, 2 * seq + 1, "user", message, created_at))
+        turns.append((user_id, 2 * seq + 2, "assistant", reply, created_at))
+
+    summaries = _summary_rows(rng, pools, user_id, exchanges)
+    return memories, turns, summaries
+
+def _summary_rows(rng, pools, user_id, exchanges):
+    """Session/daily/long-term rows shaped like RollingSummarizer's output"""
+    size = Config.MEMORY_SUMMARY_THRESHOLD
+    sessions = [
+        (exchanges[end - 1][2], rng.choice(pools.sessions))
+        for end in range(size, len(exchanges) + 1, size)
+    ]
+    if not sessions:
+        return []
+
+    rows = []
+    keep = sessions[-Config.SUMMARY_MAX_SESSIONS:]
+    older = sessions[:-Config.SUMMARY_MAX_SESSIONS]
+    days = {}
+    for created_at, data in older:
+        days.setdefault(created_at[:10], []).append(data)
+    day_items = sorted(days.items())
+    recent_days = day_items[-Config.SUMMARY_MAX_DAILY:]
+    folded = [data for _, items in day_items[:-Config.SUMMARY_MAX_DAILY] for data in items]
+    if folded:
+        data = merge_summary_data(folded)
+        rows.append((user_id, render_summary(LONG_TERM, data), LONG_TERM, None, json.dumps(data), day_items[0][0] + " 00:00:00"))
+    for period, items in recent_days:
+        data = merge_summary_data(items)
+        rows.append((user_id, render_summary(DAILY, data, period), DAILY, period, json.dumps(data), period + " 23:59:59"))
+    for created_at, data in keep:
+        rows.append((user_id, render_summary(SESSION, data), SESSION, None, json.dumps(data), created_at))
+    return rows
+
+def generate_dataset(db_path, users=100000, seed=1, scale=3.0, alpha=1.16, profile_rate=0.7, batch_users=1000):
+    """Fill db_path (current schema) with `users` synthetic users; returns stats.
+
+    Memories per user follow memories_per_user(); each user also gets a
+    profile (profile_rate of them), the matching conversation_turns tail and
+    summary rows. Bulk inserts bypass MemoryManager so 100k users take
+    seconds, not hours; the result is byte-for-byte reproducible per seed
+    except for timestamps, which are relative to now.
+    """
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    pools = _Pools(rng)
+    now = datetime.now(timezone.utc)
+    store = MemoryManager(db_path)
+    conn = store.conn
+    conn.execute("PRAGMA synchronous = OFF")
+    memory_columns = "user_id, memory_text, memory_type, importance, created_at, " + ", ".join(emotion_codec.COLUMNS)
+    memory_sql = f"INSERT INTO conversation_memories ({memory_columns}) VALUES ({', '.join('?' for _ in range(5 + len(emotion_codec.COLUMNS)))})"
+
+    counts = {"users": users, "profiles": 0, "memories": 0, "turns": 0, "summaries": 0}
+    per_user = []
+    try:
+        for first in range(0, users, batch_users):
+            profiles, memories, turns, summaries = [], [], [], []
+            for index in range(first, min(users, first + batch_users)):
+                user_id = user_id_for(index)
+                memory_count = memories_per_user(rng, scale, alpha)
+                per_user.append(memory_count)
+                if rng.random() < profile_rate:
+                    profiles.append(_profile(rng, user_id))
+                user_memories, user_turns, user_summaries = _user_rows(rng, pools, user_id, memory_count, now)
+                memories.extend(user_memories)
+                turns.extend(user_turns)
+                summaries.extend(user_summaries)
+            conn.executemany("INSERT INTO user_profiles (user_id, name, preferences, personality_traits) VALUES (?, ?, ?, ?)", profiles)
+            conn.executemany(memory_sql, memories)
+            conn.executemany("INSERT INTO conversation_turns (user_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)", turns)
+            conn.executemany(
+                "INSERT INTO memory_summaries (user_id, summary_text, tier, period, summary_data, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                summaries
+            )
+            conn.commit()
+            counts["profiles"] += len(profiles)
+            counts["memories"] += len(memories)
+            counts["turns"] += len(turns)
+            counts["summaries"] += len(summaries)
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        store.close()
+
+    per_user.sort()
+    counts.update({
+        "seed": seed,
+        "memories_p50": per_user[len(per_user) // 2] if per_user else 0,
+        "memories_p99": per_user[int(len(per_user) * 0.99)] if per_user else 0,
+        "memories_max": per_user[-1] if per_user else 0,
+        "seconds": round(time.perf_counter() - start, 2)
+    })
+    logger.info(f"Generated synthetic dataset {db_path}: {counts}")
+    return counts
+
+def dataset_path(directory, users, seed):
+    return os.path.join(directory, f"synthetic-{users}-{seed}.db")
+
+def ensure_dataset(directory, users=100000, seed=1):
+    """Path of the cached dataset for (users, seed), generating it on first use"""
+    path = dataset_path(directory, users, seed)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        stats = generate_dataset(tmp_path, users, seed)
+        with open(path + ".json", "w") as f:
+            json.dump(stats, f, indent=2)
+        os.replace(tmp_path, path)
+    return path
+
+def dataset_stats(path):
+    try:
+        with open(path + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def sample_users(store, count, seed=1):
+    """User ids drawn in proportion to their memory count (active users are read more)"""
+    cursor = store.conn.cursor()
+    cursor.execute("SELECT user_id, memory_count FROM user_memory_stats")
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+    rng = random.Random(seed)
+    return rng.choices([row[0] for row in rows], weights=[row[1] for row in rows], k=count)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic user/memory database for benchmarks")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scale", type=float, default=3.0, help="minimum memories of the Pareto distribution")
+    parser.add_argument("--out", required=True, help="database file to create (must not exist)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if os.path.exists(args.out):
+        parser.error(f"{args.out} already exists")
+    print(json.dumps(generate_dataset(args.out, args.users, args.seed, args.scale), indent=2))
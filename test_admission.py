@@ -0,0 +1,93 @@
+import threading
+import unittest
+from admission import AdmissionController, RateLimiter
+from emotion_engine import EmotionEngine
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_then_refill(self):
+        """A key gets `burst` messages at once and then the sustained rate"""
+        clock = FakeClock()
+        limiter = RateLimiter(per_minute=60, burst=3, clock=clock)
+
+        self.assertEqual([limiter.allow("u") for _ in range(4)], [True, True, True, False])
+        clock.now += 1.0
+        self.assertTrue(limiter.allow("u"))
+        self.assertFalse(limiter.allow("u"))
+        # Other keys have their own bucket
+        self.assertTrue(limiter.allow("other"))
+
+    def test_idle_buckets_are_evicted(self):
+        """The key table stays bounded"""
+        clock = FakeClock()
+        limiter = RateLimiter(per_minute=60, burst=1, max_keys=10, clock=clock)
+        for i in range(10):
+            limiter.allow(f"user{i}")
+        clock.now += 5
+        limiter.allow("new")
+        self.assertEqual(len(limiter), 1)
+
+    def test_least_recently_used_buckets_go_past_the_cap(self):
+        clock = FakeClock()
+        limiter = RateLimiter(per_minute=60, burst=1, max_keys=3, clock=clock)
+        for key in ("a", "b", "c"):
+            self.assertTrue(limiter.allow(key))
+        self.assertFalse(limiter.allow("a"))
+        # None has refilled, yet the table stays at the cap
+        for i in range(50):
+            limiter.allow(f"burst{i}")
+            self.assertLessEqual(len(limiter), 3)
+        self.assertFalse(limiter.allow("burst49"))
+
+        limiter = RateLimiter(per_minute=60, burst=1, max_keys=3, clock=clock)
+        for key in ("a", "b", "c"):
+            limiter.allow(key)
+        limiter.allow("a")
+        limiter.allow("d")
+        # "b" was the least recently seen; "a" keeps its spent bucket
+        self.assertFalse(limiter.allow("a"))
+        self.assertTrue(limiter.allow("b"))
+
+class TestAdmissionController(unittest.TestCase):
+    def test_sheds_when_queue_is_full(self):
+        controller = AdmissionController(max_inflight=1, max_queue=0, max_wait=1)
+        self.assertTrue(controller.acquire())
+        self.assertFalse(controller.acquire())
+        controller.release()
+        self.assertTrue(controller.acquire())
+        self.assertEqual(controller.stats()["shed_queue_full"], 1)
+
+    def test_sheds_after_max_wait(self):
+        controller = AdmissionController(max_inflight=1, max_queue=4, max_wait=0.05)
+        self.assertTrue(controller.acquire())
+        self.assertFalse(controller.acquire())
+        self.assertEqual(controller.stats()["shed_timeout"], 1)
+
+    def test_waiter_gets_released_slot(self):
+        controller = AdmissionController(max_inflight=1, max_queue=4, max_wait=2)
+        self.assertTrue(controller.acquire())
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(controller.acquire()))
+        waiter.start()
+        controller.release()
+        waiter.join()
+        self.assertEqual(result, [True])
+        stats = controller.stats()
+        self.assertEqual(stats["inflight"], 1)
+        self.assertEqual(stats["admitted"], 2)
+
+class TestBusyResponse(unittest.TestCase):
+    def test_template_reply_has_emotional_context(self):
+        engine = EmotionEngine()
+        message, emotional_context = engine.get_busy_response("Why is this so slow?")
+        self.assertTrue(message)
+        self.assertIn(emotional_context["tone"], engine.tone_profiles)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from archive import ColdArchive, UserArchiver
+from config import Config
+from database import MemoryManager as DatabaseManager
+
+class ArchiveConfig(Config):
+    ARCHIVE_INACTIVE_DAYS = 30
+    ARCHIVE_BATCH_SIZE = 100
+
+class TestUserArchiver(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmpdir.name, "hot.db"))
+        self.archive = ColdArchive(os.path.join(self.tmpdir.name, "cold.db"), "zlib")
+        self.archiver = UserArchiver(self.db, self.archive, config=ArchiveConfig)
+
+    def tearDown(self):
+        self.db.conn.close()
+        self.archive.conn.close()
+        self.tmpdir.cleanup()
+
+    def add_user(self, user_id, days_ago):
+        self.db.update_user_profile(user_id, {"name": user_id.title(), "preferences": {"likes": ["jazz"]}})
+        for i in range(20):
+            self.db.store_memory(user_id, f"User: talking about jazz {i} | Bot: lovely", "conversation_exchange",
+                                 {"tone": "playful", "emotion_scores": {"happiness": 0.8}})
+        self.db.store_turns(user_id, [("user", "hi"), ("assistant", "hello!")])
+        self.db.create_memory_summary(user_id, "Conversation about music.")
+        stamp = (datetime.now(timezone.utc) - timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
+        for table, column in (("user_profiles", "updated_at"), ("conversation_memories", "created_at")):
+            self.db.conn.execute(f"UPDATE {table} SET {column} = ? WHERE user_id = ?", (stamp, user_id))
+        self.db.conn.commit()
+
+    def hot_rows(self, user_id):
+        return sum(
+            self.db.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = ?", (user_id,)).fetchone()[0]
+            for table in ("user_profiles", "conversation_memories", "memory_summaries", "conversation_turns")
+        )
+
+    def test_only_inactive_users_are_archived(self):
+        self.add_user("idle", days_ago=45)
+        self.add_user("active", days_ago=2)
+        before = self.hot_rows("idle")
+
+        self.assertEqual(self.archiver.archive_inactive(), 1)
+        self.assertEqual(self.hot_rows("idle"), 0)
+        self.assertEqual(self.hot_rows("active"), before)
+
+        stats = self.archive.stats()
+        self.assertEqual(stats["users"], 1)
+        self.assertLess(stats["packed_bytes"], stats["raw_bytes"] / 3)
+
+    def test_rehydrate_restores_everything(self):
+        self.add_user("idle", days_ago=45)
+        profile = self.db.get_user_profile("idle")
+        memories = self.db.get_recent_memories("idle", 50)
+        self.archiver.archive_inactive()
+        self.assertIsNone(self.db.get_user_profile("idle"))
+
+        self.assertTrue(self.archiver.rehydrate("idle"))
+        self.assertEqual(self.db.get_user_profile("idle"), profile)
+        self.assertEqual(self.db.get_recent_memories("idle", 50), memories)
+        self.assertEqual(self.db.get_recent_turns("idle")[-1]["content"], "hello!")
+        self.assertEqual(self.archive.stats()["users"], 0)
+        self.assertFalse(self.archiver.rehydrate("idle"))
+
+    def test_rehydrate_after_interrupted_archival_does_not_duplicate(self):
+        self.add_user("idle", days_ago=45)
+        before = self.hot_rows("idle")
+        # Blob written but the hot rows never deleted
+        tables = {}
+        for table in ("user_profiles", "conversation_memories"):
+            rows = self.db.conn.execute(f"SELECT * FROM {table} WHERE user_id = ?", ("idle",)).fetchall()
+            tables[table] = {"columns": list(rows[0].keys()), "rows": [list(row) for row in rows]}
+        self.archive.put("idle", tables)
+
+        self.assertTrue(self.archiver.rehydrate("idle"))
+        self.assertEqual(self.hot_rows("idle"), before)
+
+    def test_lzma_archive_round_trip(self):
+        archive = ColdArchive(os.path.join(self.tmpdir.name, "cold-lzma.db"), "lzma")
+        self.addCleanup(archive.conn.close)
+        archive.put("u1", {"user_profiles": {"columns": ["user_id"], "rows": [["u1"]]}})
+        self.assertEqual(archive.get("u1")["user_profiles"]["rows"], [["u1"]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from admission import RateLimiter
+from app_test_case import AppTestCase
+from batch_chat import BatchError, item_error, parse_ndjson
+from database import MemoryManager
+from fake_ollama import FakeOllama, FakeOllamaServer
+from sharding import ShardedMemoryManager
+
+CONTEXT = {"tone": "friendly", "emotion_scores": {"happiness": 0.6}}
+
+class TestBatchItems(unittest.TestCase):
+    def test_ndjson(self):
+        self.assertEqual(parse_ndjson(['{"user_id": "u1", "message": "hi"}', '', '[1]']),
+                         [{"user_id": "u1", "message": "hi"}, [1]])
+        with self.assertRaises(BatchError):
+            parse_ndjson(['{"user_id": "u1"}', '{oops'])
+
+    def test_item_validation(self):
+        self.assertIsNone(item_error({"user_id": "u1", "message": "hi", "id": 7}))
+        for item in ([1], {"message": "hi"}, {"user_id": "", "message": "hi"}, {"user_id": "u1", "message": "  "},
+                     {"user_id": "u1", "message": "hi", "id": [1]}):
+            self.assertIsNotNone(item_error(item), item)
+
+class TestGroupedStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def fill(self, store, users):
+        for user_id in users:
+            store.update_user_profile(user_id, {"name": user_id.title(), "preferences": {"likes": ["tea"]}})
+            store.store_turns(user_id, [("user", f"{user_id} {i}") for i in range(9)], tone="friendly")
+            for i in range(5):
+                store.store_memory(user_id, f"{user_id} fact {i}", "personal_info", CONTEXT, importance=2 + i % 2)
+            for tier in ("session", "daily", "long_term", "session"):
+                store.create_memory_summary(user_id, f"{user_id} {tier}", tier=tier)
+
+    def assert_matches_per_user_reads(self, store):
+        users = ["alice", "bob", "carol", "dave"]
+        self.fill(store, users[:3])
+        contexts = store.get_user_contexts(users, turns_limit=6, memories_limit=3)
+        for user_id in users:
+            context = contexts[user_id]
+            self.assertEqual(context["user_profile"], store.get_user_profile(user_id))
+            self.assertEqual(context["recent_conversation"], store.get_recent_turns(user_id, 6))
+            self.assertEqual(context["important_memories"], store.get_important_memories(user_id, 3))
+            self.assertEqual(context["memory_summaries"], store.get_summary_set(user_id))
+        self.assertIsNone(contexts["dave"]["user_profile"])
+
+    def test_grouped_reads(self):
+        store = MemoryManager(os.path.join(self.tmpdir.name, "memory.db"))
+        self.addCleanup(store.close)
+        self.assert_matches_per_user_reads(store)
+
+    def test_grouped_reads_across_shards(self):
+        store = ShardedMemoryManager(os.path.join(self.tmpdir.name, "memory.db"), 2)
+        self.addCleanup(store.close)
+        self.assert_matches_per_user_reads(store)
+
+    def test_grouped_writes(self):
+        store = ShardedMemoryManager(os.path.join(self.tmpdir.name, "memory.db"), 2)
+        self.addCleanup(store.close)
+        store.store_turns("alice", [("user", "earlier")])
+        exchanges = [
+            {"user_id": user_id, "turns": [("user", f"hi from {user_id}"), ("assistant", "hello")], "tone": "friendly",
+             "memory": (f"User: hi from {user_id}", "conversation_exchange", CONTEXT, 1)}
+            for user_id in ("alice", "bob", "alice")
+        ]
+        self.assertTrue(store.store_exchanges(exchanges))
+        self.assertEqual([turn["content"] for turn in store.get_recent_turns("alice", 10)],
+                         ["earlier", "hi from alice", "hello", "hi from alice", "hello"])
+        self.assertEqual(store.get_memory_count("alice"), 2)
+        self.assertEqual(store.get_memory_count("bob"), 1)
+
+class TestBatchEndpoint(AppTestCase):
+    """POST /api/chat/batch against the app and a fake Ollama"""
+
+    # Short replies, so no stream is cut early and still counted active upstream
+    fake_ollama = dict(prompt_eval_ms=20, token_ms=2, tokens=5, jitter=0, seed=1)
+
+    def configure(self, config):
+        class BatchConfig(config):
+            BATCH_CONCURRENCY = 2
+            BATCH_WRITE_SIZE = 4
+            BATCH_MAX_ITEMS = 50
+            BATCH_API_TOKEN = "secret"
+        return BatchConfig
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.flask_app.test_client()
+
+    def post(self, **kwargs):
+        kwargs.setdefault('headers', {'Authorization': 'Bearer secret'})
+        response = self.client.post('/api/chat/batch', **kwargs)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        return lines[:-1], lines[-1]["summary"]
+
+    def test_batch_answers_every_item(self):
+        items = [{"user_id": f"user{i % 5}", "message": f"message {i}", "id": f"m{i}"} for i in range(20)]
+        results, summary = self.post(json={"items": items + [{"user_id": "user1"}]})
+        self.assertEqual(summary["outcomes"], {"reply": 20, "invalid": 1})
+        self.assertEqual(sorted(result["index"] for result in results), list(range(21)))
+        for result in results:
+            if result["outcome"] == "reply":
+                self.assertEqual(result["id"], f"m{result['index']}")
+                self.assertTrue(result["reply"])
+
+        # Each user's messages were answered in order and stored as history
+        turns = self.services.db.get_recent_turns("user2", 10)
+        self.assertEqual([turn["content"] for turn in turns if turn["role"] == "user"],
+                         ["message 2", "message 7", "message 12", "message 17"])
+        self.assertEqual(self.fake.behaviour.stats()["requests"], 20)
+        self.assertLessEqual(self.fake.behaviour.stats()["peak_active"], 2)
+        stats = self.services.batch_chat.stats()
+        self.assertEqual(stats["write_groups"], 5)
+        self.assertEqual(stats["reply"], 20)
+
+    def test_ndjson_body(self):
+        body = "\n".join(json.dumps({"user_id": "alice", "message": text}) for text in ("hi", "My name is Alice"))
+        results, summary = self.post(data=body, content_type='application/x-ndjson')
+        self.assertEqual(summary["outcomes"], {"reply": 2})
+        self.assertEqual([result["index"] for result in results], [0, 1])
+        self.assertEqual(self.services.db.get_user_profile("alice")["name"], "Alice")
+
+    def test_rejected_batches(self):
+        auth = {'Authorization': 'Bearer secret'}
+        self.assertEqual(self.client.post('/api/chat/batch', json={"items": "nope"}, headers=auth).status_code, 400)
+        too_many = [{"user_id": "u", "message": "hi"}] * 51
+        self.assertEqual(self.client.post('/api/chat/batch', json=too_many, headers=auth).status_code, 400)
+        self.assertEqual(self.client.post('/api/chat/batch', data="{bad", content_type='application/x-ndjson',
+                                          headers=auth).status_code, 400)
+        self.assertEqual(self.client.post('/api/chat/batch', json=[]).status_code, 401)
+        self.assertEqual(self.client.post('/api/chat/batch', json=[], headers={'Authorization': 'Bearer nope'}).status_code, 401)
+        results, summary = self.post(json=[])
+        self.assertEqual((results, summary["items"]), ([], 0))
+
+        # Without a configured token there is no endpoint at all
+        self.services.config.BATCH_API_TOKEN = ""
+        self.assertEqual(self.client.post('/api/chat/batch', json=[], headers=auth).status_code, 404)
+
+    def test_archived_users_are_restored_first(self):
+        db = self.services.db
+        db.update_user_profile("oldie", {"name": "Olive"})
+        db.store_turns("oldie", [("user", "long ago"), ("assistant", "indeed")])
+        self.assertTrue(self.services.archiver.archive_user("oldie", now=datetime.now(timezone.utc) + timedelta(days=3650)))
+        self.assertIsNone(db.get_user_profile("oldie"))
+
+        results, summary = self.post(json=[{"user_id": "oldie", "message": "what did we talk about?"}])
+        self.assertEqual(summary["outcomes"], {"reply": 1})
+        self.assertEqual(db.get_user_profile("oldie")["name"], "Olive")
+        self.assertEqual([turn["content"] for turn in db.get_recent_turns("oldie", 10)][:3], ["long ago", "indeed", "what did we talk about?"])
+        self.assertIsNone(self.services.archiver.archive.get("oldie"))
+
+    def test_items_skip_the_chat_rate_limit(self):
+        # A transcript import sends far more than the interactive burst for one user
+        burst = self.services.config.RATE_LIMIT_USER_BURST
+        items = [{"user_id": "chatty", "message": f"message {i}"} for i in range(burst * 3)]
+        results, summary = self.post(json=items)
+        self.assertEqual(summary["outcomes"], {"reply": burst * 3})
+        self.assertEqual(self.services.admission_gate.stats()["rate_limited_user"], 0)
+        # The user can still chat interactively afterwards
+        self.assertIsNone(self.services.admission_gate.check_rate("chatty", None))
+
+    def test_items_count_against_the_batch_rate_limit(self):
+        self.services.batch_chat.limiter = RateLimiter(per_minute=60, burst=4)
+        items = [{"user_id": f"user{i % 2}", "message": f"message {i}"} for i in range(6)]
+        results, summary = self.post(json=items)
+        self.assertEqual(summary["outcomes"], {"reply": 4, "rate_limited": 2})
+        limited = sorted(result["index"] for result in results if result["outcome"] == "rate_limited")
+        self.assertEqual(limited, [4, 5])
+        self.assertEqual(self.services.batch_chat.stats()["rate_limited"], 2)
+
+class TestBatchCommand(unittest.TestCase):
+    def test_offline_batch_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fake = FakeOllamaServer(behaviour=FakeOllama(prompt_eval_ms=5, token_ms=1, tokens=5, jitter=0, seed=1)).start()
+            self.addCleanup(fake.stop)
+            source = os.path.join(tmpdir, "items.ndjson")
+            with open(source, "w") as f:
+                for i in range(6):
+                    f.write(json.dumps({"user_id": f"u{i % 2}", "message": f"hello {i}"}) + "\n")
+            env = dict(os.environ, OLLAMA_BASE_URL=fake.url, SQLITE_DB=os.path.join(tmpdir, "memory.db"),
+                       ARCHIVE_DB=os.path.join(tmpdir, "archive.db"))
+            result = subprocess.run([sys.executable, "batch_chat.py", source, "--concurrency", "2"], env=env,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=60)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            lines = [json.loads(line) for line in result.stdout.splitlines()]
+            self.assertEqual(lines[-1]["summary"]["outcomes"], {"reply": 6})
+            self.assertEqual(fake.behaviour.stats()["requests"], 6)
+
+if __name__ == '__main__':
+    unittest.main()
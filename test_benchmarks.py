@@ -0,0 +1,100 @@
+import copy
+import os
+import random
+import tempfile
+import unittest
+import benchmarks
+import synthetic_data
+from database import MemoryManager as DatabaseManager
+
+class TestSyntheticData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.path = synthetic_data.ensure_dataset(cls.tmpdir.name, users=400, seed=7)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_dataset_is_skewed_and_consistent(self):
+        stats = synthetic_data.dataset_stats(self.path)
+        self.assertEqual(stats["users"], 400)
+        # Most users have a handful of memories, a few have many more
+        self.assertLessEqual(stats["memories_p50"], 10)
+        self.assertGreater(stats["memories_max"], 5 * stats["memories_p50"])
+
+        db = DatabaseManager(self.path)
+        try:
+            counted = db.conn.execute("SELECT COUNT(*) FROM conversation_memories").fetchone()[0]
+            tracked = db.conn.execute("SELECT SUM(memory_count) FROM user_memory_stats").fetchone()[0]
+            self.assertEqual(counted, stats["memories"])
+            self.assertEqual(tracked, counted)
+            heavy = db.conn.execute("SELECT user_id FROM user_memory_stats ORDER BY memory_count DESC LIMIT 1").fetchone()[0]
+            self.assertEqual(len(db.get_recent_turns(heavy, 6)), 6)
+            self.assertTrue(db.get_summary_set(heavy))
+        finally:
+            db.close()
+
+    def test_cached_dataset_is_reused(self):
+        mtime = os.path.getmtime(self.path)
+        self.assertEqual(synthetic_data.ensure_dataset(self.tmpdir.name, users=400, seed=7), self.path)
+        self.assertEqual(os.path.getmtime(self.path), mtime)
+
+    def test_memory_counts_follow_a_heavy_tail(self):
+        rng = random.Random(1)
+        counts = sorted(synthetic_data.memories_per_user(rng) for _ in range(10000))
+        top = sum(counts[-2000:])
+        self.assertGreater(top / sum(counts), 0.6)
+        self.assertLessEqual(counts[-1], synthetic_data.Config.MAX_MEMORIES_PER_USER)
+
+    def test_suite_reports_every_metric_without_touching_the_dataset(self):
+        mtime = os.path.getmtime(self.path)
+        report = benchmarks.run_suite(self.path, names=["db.get_recent", "db.store_memory", "emotion."],
+                                      min_time=0.01, repeat=1, sample_size=50)
+        self.assertEqual(set(report["results"]), {
+            "db.get_recent_turns", "db.get_recent_memories", "db.store_memory",
+            "emotion.analyze_emotion", "emotion.get_emotional_response"
+        })
+        for result in report["results"].values():
+            self.assertGreater(result["ops_per_sec"], 0)
+            self.assertGreater(result["alloc_peak_bytes"], 0)
+        self.assertEqual(report["meta"]["dataset"]["users"], 400)
+        self.assertEqual(os.path.getmtime(self.path), mtime)
+
+class TestCompare(unittest.TestCase):
+    def setUp(self):
+        self.baseline = {"results": {
+            "db.get_user_profile": {"ops_per_sec": 1000.0, "alloc_peak_bytes": 2000},
+            "emotion.analyze_emotion": {"ops_per_sec": 5000.0, "alloc_peak_bytes": 400}
+        }}
+
+    def test_within_threshold_passes(self):
+        current = copy.deepcopy(self.baseline)
+        current["results"]["db.get_user_profile"]["ops_per_sec"] = 850.0
+        self.assertEqual(benchmarks.compare(current, self.baseline, threshold=0.2), [])
+
+    def test_slowdown_and_allocation_growth_are_flagged(self):
+        current = copy.deepcopy(self.baseline)
+        current["results"]["db.get_user_profile"]["ops_per_sec"] = 700.0
+        current["results"]["emotion.analyze_emotion"]["alloc_peak_bytes"] = 900
+        regressions = benchmarks.compare(current, self.baseline, threshold=0.2)
+        self.assertEqual(
+            [(r["benchmark"], r["metric"]) for r in regressions],
+            [("db.get_user_profile", "ops_per_sec"), ("emotion.analyze_emotion", "alloc_peak_bytes")]
+        )
+
+    def test_per_benchmark_threshold_overrides_default(self):
+        current = copy.deepcopy(self.baseline)
+        current["results"]["db.get_user_profile"]["ops_per_sec"] = 700.0
+        thresholds = benchmarks.parse_thresholds(["db.get_user_profile=0.4"])
+        self.assertEqual(benchmarks.compare(current, self.baseline, threshold=0.2, thresholds=thresholds), [])
+
+    def test_stored_baseline_covers_the_suite(self):
+        here = os.path.dirname(os.path.abspath(__file__))
+        baseline = benchmarks.load_json(os.path.join(here, benchmarks.BASELINE_PATH))
+        self.assertIn("db.get_conversation_page", baseline["results"])
+        self.assertIn("app.get_system_prompt", baseline["results"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+from app_test_case import AppTestCase
+from cancellation import DISCONNECTED, SUPERSEDED, ActiveGenerations
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestActiveGenerations(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.generations = ActiveGenerations(on_new_message=True, on_disconnect=True, disconnect_grace=5, clock=self.clock)
+
+    def test_newer_message_supersedes(self):
+        first = self.generations.start("u1", "sid-a")
+        other_user = self.generations.start("u2", "sid-b")
+        second = self.generations.start("u1", "sid-a")
+        self.assertTrue(first.cancelled())
+        self.assertEqual(first.reason, SUPERSEDED)
+        self.assertFalse(second.cancelled())
+        self.assertFalse(other_user.cancelled())
+        self.generations.finish(first)
+        stats = self.generations.stats()
+        self.assertEqual((stats[SUPERSEDED], stats["skipped"], stats["active"]), (1, 1, 2))
+
+    def test_disconnect_without_message_id_cancels_at_once(self):
+        generation = self.generations.start("u1", "sid-a")
+        self.generations.disconnected("sid-b")
+        self.assertFalse(generation.cancelled())
+        self.generations.disconnected("sid-a")
+        self.assertTrue(generation.cancelled())
+        self.assertEqual(generation.reason, DISCONNECTED)
+
+    def test_resumable_reply_gets_a_grace_period(self):
+        generation = self.generations.start("u1", "sid-a", message_id="m1")
+        self.generations.disconnected("sid-a")
+        self.clock.now += 4
+        self.assertFalse(generation.cancelled())
+        # The client reconnects and follows the reply
+        self.generations.adopt("u1", "m1", "sid-c")
+        self.clock.now += 10
+        self.assertFalse(generation.cancelled())
+        self.generations.disconnected("sid-c")
+        self.clock.now += 5
+        self.assertTrue(generation.cancelled())
+
+    def test_policy_can_be_turned_off(self):
+        generations = ActiveGenerations(on_new_message=False, on_disconnect=False, disconnect_grace=0)
+        first = generations.start("u1", "sid-a")
+        generations.start("u1", "sid-a")
+        generations.disconnected("sid-a")
+        self.assertFalse(first.cancelled())
+
+    def test_finished_generation_is_counted_once(self):
+        with self.generations.track("u1", "sid-a") as generation:
+            generation.generating = True
+            generation.cancel(SUPERSEDED)
+        stats = self.generations.stats()
+        self.assertEqual((stats[SUPERSEDED], stats["skipped"], stats["active"]), (1, 0, 0))
+
+class TestCancellationEndToEnd(AppTestCase):
+    """A long streamed reply against the app and a fake Ollama"""
+
+    fake_ollama = dict(prompt_eval_ms=5, token_ms=20, tokens=300, jitter=0, seed=1)
+
+    def configure(self, config):
+        class LongReplies(config):
+            # Let the fake model talk until cancelled
+            MAX_RESPONSE_SENTENCES = 1000
+            MAX_RESPONSE_LENGTH = 100000
+        return LongReplies
+
+    def send_in_background(self, client, message):
+        received = []
+        def send():
+            client.emit('user_message', {'message': message})
+            if client.is_connected():
+                received.extend(client.get_received())
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        # Wait until the reply is streaming
+        deadline = time.time() + 5
+        while not self.fake.behaviour.stats()['active'] and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        return sender, received
+
+    def test_newer_message_cancels_the_running_reply(self):
+        sender, received = self.send_in_background(self.connect(), 'My name is Alice, tell me a very long story')
+        other_tab = self.connect()
+        other_tab.emit('user_message', {'message': 'actually, never mind'})
+        replies = [event for event in other_tab.get_received() if event['name'] == 'bot_response']
+        sender.join(10)
+
+        self.assertEqual([event['name'] for event in received][-1], 'generation_cancelled')
+        self.assertEqual(received[-1]['args'][0]['reason'], SUPERSEDED)
+        self.assertNotIn('bot_response', [event['name'] for event in received])
+        self.assertEqual(len(replies), 1)
+        self.assertEqual(self.services.generations.stats()[SUPERSEDED], 1)
+        output = self.services.output_controller.stats()
+        self.assertEqual(output['cancelled'], 1)
+        self.assertGreater(output['tokens_saved_cancelled'], 0)
+        # The upstream stream was closed and the slot freed
+        self.assertEqual(self.services.admission_gate.controller.inflight, 0)
+        # Only the reply was dropped: the first message and its facts are kept
+        self.assertEqual(self.services.db.get_user_profile('alice')['name'], 'Alice')
+        turns = self.services.db.get_recent_turns('alice', 10)
+        self.assertEqual([(turn['role'], turn['content']) for turn in turns][:2],
+                         [('user', 'My name is Alice, tell me a very long story'), ('user', 'actually, never mind')])
+        self.assertEqual([turn['role'] for turn in turns], ['user', 'user', 'assistant'])
+
+    def test_disconnect_cancels_the_running_reply(self):
+        client = self.connect()
+        sender, _ = self.send_in_background(client, 'tell me a very long story')
+        client.disconnect()
+        sender.join(10)
+        self.assertFalse(sender.is_alive())
+        self.assertEqual(self.services.generations.stats()[DISCONNECTED], 1)
+        self.assertEqual([turn['content'] for turn in self.services.db.get_recent_turns('alice', 10)],
+                         ['tell me a very long story'])
+        self.assertEqual(self.services.output_controller.stats()['cancelled'], 1)
+        deadline = time.time() + 2
+        while self.fake.behaviour.stats()['active'] and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.fake.behaviour.stats()['active'], 0)
+        self.assertGreater(self.fake.behaviour.stats()['cancelled'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import ollama
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from database import MemoryManager as DatabaseManager
+from emotion_engine import EmotionEngine
+from fallback import FallbackResponder
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        server.hits += 1
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if server.delay:
+            time.sleep(server.delay)
+        if server.fail:
+            body = json.dumps({"error": "injected failure"}).encode()
+            self.send_response(500)
+        else:
+            body = json.dumps({
+                "model": "stub",
+                "message": {"role": "assistant", "content": "Hello from the stub!"},
+                "done": True
+            }).encode()
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Timed-out clients hang up mid-response; that's the point of the test
+        pass
+
+class StubOllamaServer:
+    """Local /api/chat stand-in with failure and latency injection"""
+
+    def __init__(self):
+        self.httpd = QuietHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+        self.httpd.hits = 0
+        self.httpd.fail = False
+        self.httpd.delay = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class TestCircuitBreakerAgainstStub(unittest.TestCase):
+    def setUp(self):
+        self.server = StubOllamaServer()
+        self.client = ollama.Client(host=self.server.url, timeout=0.5)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def chat(self, breaker):
+        return breaker.call(self.client.chat, model="stub", messages=[{"role": "user", "content": "hi"}])
+
+    def test_opens_on_failures_and_fails_fast(self):
+        breaker = CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, open_seconds=60)
+        self.server.httpd.fail = True
+        for _ in range(4):
+            with self.assertRaises(ollama.ResponseError):
+                self.chat(breaker)
+        self.assertEqual(breaker.state, OPEN)
+
+        hits = self.server.httpd.hits
+        start = time.monotonic()
+        with self.assertRaises(CircuitOpenError):
+            self.chat(breaker)
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(self.server.httpd.hits, hits)
+        self.assertEqual(breaker.stats()["short_circuited"], 1)
+
+    def test_opens_on_slow_calls(self):
+        breaker = CircuitBreaker(window=3, min_calls=3, slow_call_seconds=0.1, slow_call_rate=0.6, open_seconds=60)
+        self.server.httpd.delay = 0.15
+        for _ in range(3):
+            self.assertEqual(self.chat(breaker)["message"]["content"], "Hello from the stub!")
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_timeouts_count_as_failures(self):
+        breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, open_seconds=60)
+        self.server.httpd.delay = 1.0
+        for _ in range(2):
+            with self.assertRaises(httpx.TimeoutException):
+                self.chat(breaker)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_half_open_probe_closes_on_recovery(self):
+        breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, open_seconds=0.1)
+        self.server.httpd.fail = True
+        for _ in range(2):
+            with self.assertRaises(ollama.ResponseError):
+                self.chat(breaker)
+        self.assertEqual(breaker.state, OPEN)
+
+        time.sleep(0.15)
+        self.assertEqual(breaker.stats()["state"], HALF_OPEN)
+        self.server.httpd.fail = False
+        self.chat(breaker)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, open_seconds=0.1)
+        self.server.httpd.fail = True
+        for _ in range(2):
+            with self.assertRaises(ollama.ResponseError):
+                self.chat(breaker)
+        time.sleep(0.15)
+        with self.assertRaises(ollama.ResponseError):
+            self.chat(breaker)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.stats()["opened"], 2)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestCircuitBreakerStates(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, open_seconds=10, clock=self.clock)
+
+    def trip(self):
+        for _ in range(2):
+            self.breaker.record(self.breaker.admit(), failed=True, elapsed=0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_call_from_before_the_trip_is_not_a_probe(self):
+        slow = self.breaker.admit()
+        self.trip()
+        self.clock.now = 11
+        self.assertEqual(self.breaker.stats()["state"], HALF_OPEN)
+        self.breaker.record(slow, failed=False, elapsed=0.5)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertEqual(self.breaker._probes_in_flight, 0)
+
+        probe = self.breaker.admit()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.admit()
+        self.breaker.record(probe, failed=False, elapsed=0.5)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker._probes_in_flight, 0)
+
+    def test_late_failure_does_not_count_after_recovery(self):
+        slow = self.breaker.admit()
+        self.trip()
+        self.clock.now = 11
+        self.breaker.record(self.breaker.admit(), failed=False, elapsed=0.5)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record(slow, failed=True, elapsed=12)
+        self.breaker.record(self.breaker.admit(), failed=True, elapsed=0.5)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.stats()["failures"], 4)
+
+class TestFallbackResponder(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+        self.responder = FallbackResponder(self.db, EmotionEngine())
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.remove(self.db_path)
+
+    def test_uses_profile_and_last_summary(self):
+        self.db.update_user_profile("u1", {"name": "Maya", "preferences": {"likes": ["jazz"]}})
+        self.db.create_memory_summary("u1", "Conversation about music, travel. Overall tone was friendly. 5 exchanges.")
+        message, emotional_context = self.responder.respond("u1", "How are you?")
+        self.assertIn("Maya", message)
+        self.assertIn("music, travel", message)
+        self.assertIn("tone", emotional_context)
+
+    def test_unknown_user_still_gets_reply(self):
+        message, _ = self.responder.respond("nobody", "hello")
+        self.assertTrue(message.strip())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from database import MemoryManager as DatabaseManager
+from memory_manager import MemoryManager as ChatMemoryManager
+from user_serializer import UserSerializer
+
+class TestUserSerializer(unittest.TestCase):
+    def test_same_user_runs_in_arrival_order(self):
+        """Work for one user never overlaps and keeps submission order"""
+        serializer = UserSerializer()
+        order = []
+        active = []
+        overlaps = []
+        started = []
+
+        def worker(i):
+            with serializer.serialize("user"):
+                active.append(i)
+                if len(active) > 1:
+                    overlaps.append(i)
+                order.append(i)
+                time.sleep(0.002)
+                active.remove(i)
+
+        threads = []
+        for i in range(20):
+            t = threading.Thread(target=worker, args=(i,))
+            t.start()
+            threads.append(t)
+            # Stagger starts so arrival order is well defined
+            time.sleep(0.001)
+            started.append(i)
+        for t in threads:
+            t.join()
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(order, started)
+        self.assertEqual(serializer.active_users(), 0)
+
+    def test_different_users_run_in_parallel(self):
+        """A slow user does not block anyone else"""
+        serializer = UserSerializer()
+        slow_entered = threading.Event()
+        release = threading.Event()
+        fast_done = threading.Event()
+
+        def slow():
+            with serializer.serialize("slow"):
+                slow_entered.set()
+                release.wait(5)
+
+        def fast():
+            with serializer.serialize("fast"):
+                fast_done.set()
+
+        t1 = threading.Thread(target=slow)
+        t1.start()
+        slow_entered.wait(5)
+        t2 = threading.Thread(target=fast)
+        t2.start()
+        self.assertTrue(fast_done.wait(2))
+        release.set()
+        t1.join()
+        t2.join()
+
+    def test_reentrant_for_owning_thread(self):
+        """Nested serialize calls from the same thread do not deadlock"""
+        serializer = UserSerializer()
+        with serializer.serialize("user"):
+            with serializer.serialize("user"):
+                pass
+        self.assertEqual(serializer.active_users(), 0)
+
+class TestConcurrentProfileUpdates(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+        self.memory_manager = ChatMemoryManager(self.db)
+
+    def tearDown(self):
+        # Background summaries still use the connection
+        self.memory_manager.summarizer.flush()
+        self.db.conn.close()
+        os.remove(self.db_path)
+
+    def test_no_lost_facts_under_concurrent_load(self):
+        """Every 'I like ...' fact survives many concurrent messages per user"""
+        users = [f"stress_user_{u}" for u in range(4)]
+        facts_per_user = 25
+        barrier = threading.Barrier(len(users) * facts_per_user)
+        errors = []
+
+        def send(user_id, i):
+            try:
+                barrier.wait(5)
+                self.memory_manager.extract_user_info(user_id, f"I like hobby{i}", "")
+                self.memory_manager.update_conversation_buffer(
+                    user_id, f"I like hobby{i}", "Nice!", {"tone": "friendly"}
+                )
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=send, args=(user_id, i))
+            for user_id in users
+            for i in range(facts_per_user)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        for user_id in users:
+            likes = self.db.get_user_profile(user_id)["preferences"]["likes"]
+            expected = {f"hobby{i}" for i in range(facts_per_user)}
+            self.assertEqual(set(likes), expected, f"lost facts for {user_id}")
+
+if __name__ == '__main__':
+    unittest.main()
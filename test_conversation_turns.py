@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from config import Config
+from database import MemoryManager as DatabaseManager
+from memory_manager import MemoryManager as ChatMemoryManager
+
+class TestConversationTurns(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.remove(self.db_path)
+
+    def test_recent_turns_are_chat_messages_oldest_first(self):
+        memory_manager = ChatMemoryManager(self.db)
+        memory_manager.update_conversation_buffer("u1", "I love jazz", "Me too!", {"tone": "playful"})
+        memory_manager.update_conversation_buffer("u1", "Any tips?", "Try Coltrane.", {"tone": "friendly"})
+
+        context = memory_manager.get_conversation_context("u1", max_exchanges=2)
+        self.assertEqual(context["recent_conversation"], [
+            {"role": "user", "content": "I love jazz"},
+            {"role": "assistant", "content": "Me too!"},
+            {"role": "user", "content": "Any tips?"},
+            {"role": "assistant", "content": "Try Coltrane."}
+        ])
+        # Turns are not repeated as prompt text
+        self.assertNotIn("Coltrane", memory_manager.format_context_for_prompt(context))
+
+    def test_turns_are_trimmed_per_user(self):
+        with mock.patch.object(Config, "MAX_TURNS_PER_USER", 4):
+            for i in range(5):
+                self.db.store_turns("u1", [("user", f"q{i}"), ("assistant", f"a{i}")])
+            self.db.store_turns("u2", [("user", "other")])
+
+        count = self.db.conn.execute("SELECT COUNT(*) FROM conversation_turns WHERE user_id = 'u1'").fetchone()[0]
+        self.assertEqual(count, 4)
+        self.assertEqual(
+            [turn["content"] for turn in self.db.get_recent_turns("u1", limit=10)],
+            ["q3", "a3", "q4", "a4"]
+        )
+        self.assertEqual(len(self.db.get_recent_turns("u2")), 1)
+
+    def test_recent_turns_query_uses_primary_key(self):
+        plan = self.db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT role, content FROM conversation_turns "
+            "WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+            ("u1", 6)
+        ).fetchall()
+        detail = " ".join(row[-1] for row in plan)
+        self.assertIn("PRIMARY KEY", detail)
+        self.assertNotIn("TEMP B-TREE", detail)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+import emotion_codec
+from database import MemoryManager as DatabaseManager
+from emotion_engine import EmotionEngine
+
+class TestEmotionCodec(unittest.TestCase):
+    def test_round_trip_keeps_tone_and_scores(self):
+        context = EmotionEngine().get_emotional_response("I'm so happy today!! What should we do?")
+        decoded = emotion_codec.decode(emotion_codec.encode(context))
+        self.assertEqual(decoded["tone"], context["tone"])
+        for emotion, score in context["emotion_scores"].items():
+            self.assertAlmostEqual(decoded["emotion_scores"][emotion], score, delta=0.5 / emotion_codec.SCORE_SCALE)
+
+    def test_values_fit_in_one_byte(self):
+        values = emotion_codec.encode({"tone": "curious", "emotion_scores": {e: 1.7 for e in emotion_codec.EMOTIONS}})
+        self.assertTrue(all(0 <= value <= 127 for value in values))
+        self.assertEqual(emotion_codec.decode(emotion_codec.encode({}))["tone"], "neutral")
+
+    def test_tones_cover_emotion_engine(self):
+        self.assertEqual(set(emotion_codec.TONES), set(EmotionEngine().tone_profiles))
+
+class TestEmotionColumns(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def test_legacy_json_is_backfilled(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''CREATE TABLE conversation_memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, memory_text TEXT, memory_type TEXT,
+            emotional_context TEXT, importance INTEGER DEFAULT 1, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+        legacy = {"tone": "empathetic", "emotion_scores": {"sadness": 0.75}, "response_opener": "Oh no", "is_playful": False}
+        conn.executemany(
+            "INSERT INTO conversation_memories (user_id, memory_text, memory_type, emotional_context) VALUES (?, ?, ?, ?)",
+            [("u1", "sad day", "conversation_exchange", json.dumps(legacy)),
+             ("u1", "broken", "conversation_exchange", "{not json")]
+        )
+        conn.commit()
+        conn.close()
+
+        db = DatabaseManager(self.db_path)
+        self.addCleanup(db.conn.close)
+        remaining = db.conn.execute("SELECT COUNT(*) FROM conversation_memories WHERE emotional_context IS NOT NULL").fetchone()[0]
+        self.assertEqual(remaining, 0)
+        contexts = {memory["text"]: memory["emotional_context"] for memory in db.get_recent_memories("u1")}
+        self.assertEqual(contexts["sad day"], {"tone": "empathetic", "emotion_scores": {"sadness": 0.75}})
+        self.assertEqual(contexts["broken"]["tone"], "neutral")
+
+    def test_tone_aggregation_and_arrays(self):
+        db = DatabaseManager(self.db_path)
+        self.addCleanup(db.conn.close)
+        for tone in ("curious", "curious", "empathetic"):
+            db.store_memory("u1", "text", "conversation_exchange",
+                            {"tone": tone, "emotion_scores": {e: 0.5 for e in emotion_codec.EMOTIONS}})
+        db.store_memory("u2", "hi", "conversation_exchange", {"tone": "friendly", "emotion_scores": {}})
+
+        self.assertEqual(db.get_tone_counts("u1"), {"curious": 2, "empathetic": 1})
+        self.assertEqual(sum(db.get_tone_counts().values()), 4)
+
+        if emotion_codec.np is None:
+            self.skipTest("numpy not installed")
+        tone_codes, scores = db.get_emotion_arrays()
+        self.assertEqual(scores.shape, (4, len(emotion_codec.EMOTIONS)))
+        self.assertEqual(emotion_codec.decode_tone(int(tone_codes[0])), "curious")
+        self.assertTrue(emotion_codec.np.isnan(scores[3]).all())
+
+    def test_neutral_rows_are_counted_together(self):
+        db = DatabaseManager(self.db_path)
+        self.addCleanup(db.conn.close)
+        # Unknown tones (code 0) and rows from before the column (NULL) both read as neutral
+        for text, tone in (("a", "mystery"), ("b", "mystery"), ("c", "friendly")):
+            db.store_memory("u1", text, "conversation_exchange", {"tone": tone})
+        db.conn.execute("UPDATE conversation_memories SET tone_code = NULL WHERE memory_text = 'a'")
+        self.assertEqual(db.get_tone_counts("u1"), {"neutral": 2, "friendly": 1})
+
+if __name__ == '__main__':
+    unittest.main()
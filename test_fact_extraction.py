@@ -0,0 +1,152 @@
+import json
+import os
+import random
+import re
+import tempfile
+import unittest
+from config import Config
+from database import MemoryManager as DatabaseManager
+from fact_extraction import MAX_ATTEMPTS, FactExtractor, parse_facts
+from load_test import MessageMix
+from memory_manager import MemoryManager as ChatMemoryManager
+
+class FastBatches(Config):
+    FACT_BATCH_SIZE = 16
+    FACT_BATCH_WINDOW = 0.05
+
+# What the fake model "knows" about a message
+KNOWN_FACTS = {
+    "Call me maybe later, I'm Priya by the way": [{"type": "name", "value": "Priya"}],
+    "honestly I'm really into bouldering these days": [{"type": "likes", "value": "bouldering"}],
+    "I work at a school, teaching chemistry": [{"type": "profession", "value": "teaching chemistry"}],
+    "my sister Maya is visiting from Porto": [{"type": "relationship", "value": "Maya", "relation": "sister"}],
+    "I love pizza": [{"type": "likes", "value": "pizza"}],
+}
+
+class FakeLLM:
+    """Answers the extraction prompt from KNOWN_FACTS"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, model, messages, format, options):
+        self.calls += 1
+        facts = []
+        for number, text in re.findall(r'^(\d+)\. (".*")$', messages[0]["content"], re.MULTILINE):
+            for fact in KNOWN_FACTS.get(json.loads(text), []):
+                facts.append(dict(fact, message=int(number)))
+        return {"message": {"content": json.dumps({"facts": facts})}}
+
+class Shedding:
+    def acquire(self):
+        return False
+
+    def release(self):
+        raise AssertionError("nothing was acquired")
+
+class TestParseFacts(unittest.TestCase):
+    def test_only_facts_grounded_in_the_message_are_kept(self):
+        messages = ["I live in Lisbon and my brother Tom cooks", "I'm tired"]
+        answer = json.dumps({"facts": [
+            {"message": 1, "type": "location", "value": "Lisbon."},
+            {"message": 1, "type": "relationship", "value": "Tom", "relation": "brother"},
+            {"message": 2, "type": "name", "value": "Sarah"},  # not in the message
+            {"message": 3, "type": "likes", "value": "tea"},  # no such message
+            {"message": 1, "type": "shoe_size", "value": "Lisbon"},
+            {"message": 1, "type": "relationship", "value": "Tom", "relation": "pet"},
+            {"message": 1, "type": "likes"}
+        ]})
+        facts, rejected = parse_facts(answer, messages)
+        self.assertEqual(facts, {0: [
+            {"type": "location", "value": "Lisbon", "relation": None},
+            {"type": "relationship", "value": "Tom", "relation": "brother"}
+        ]})
+        self.assertEqual(rejected, 5)
+
+    def test_unusable_answers(self):
+        for content in ("not json", "[]", json.dumps({"facts": "none"})):
+            self.assertEqual(parse_facts(content, ["hi"]), ({}, 0))
+
+class TestFactExtractor(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+        self.llm = FakeLLM()
+        self.extractor = FactExtractor(self.db, self.llm, "small", config=FastBatches)
+        self.memory = ChatMemoryManager(self.db, fact_extractor=self.extractor)
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.remove(self.db_path)
+
+    def test_many_users_share_one_call(self):
+        for i, text in enumerate(list(KNOWN_FACTS)[:4]):
+            self.memory.extract_user_info(f"u{i}", text, "")
+        self.extractor.flush()
+        self.assertEqual(self.llm.calls, 1)
+        self.assertEqual(self.db.get_user_profile("u0")["name"], "Priya")
+        self.assertEqual(self.db.get_user_profile("u1")["preferences"]["likes"], ["bouldering"])
+        self.assertEqual(self.db.get_user_profile("u2")["preferences"]["profession"], "teaching chemistry")
+        self.assertEqual(self.db.get_user_profile("u3")["preferences"]["relationships"], {"sister": "Maya"})
+        self.assertIn("User likes bouldering", [memory["text"] for memory in self.db.get_important_memories("u1")])
+        self.assertEqual(self.extractor.stats()["profiles_updated"], 4)
+
+    def test_loose_patterns_are_left_to_the_model(self):
+        self.memory.extract_user_info("u1", "I'm Sam", "")
+        self.memory.extract_user_info("u1", "I do love a good nap", "")
+        self.extractor.flush()
+        self.assertIsNone(self.db.get_user_profile("u1"))
+        self.assertEqual(self.extractor.stats()["submitted"], 2)
+
+        # Moods and one-word replies are not even worth the model's time
+        for text in ("I'm tired", "I'm feeling really sad today", "nice", "ok cool", "good morning"):
+            self.memory.extract_user_info("u1", text, "")
+        self.assertEqual(self.extractor.stats()["submitted"], 2)
+
+        # The regex extractor alone still takes them at face value
+        regex_only = ChatMemoryManager(self.db)
+        regex_only.extract_user_info("u2", "I'm tired", "")
+        self.assertEqual(self.db.get_user_profile("u2")["name"], "Tired")
+
+    def test_facts_found_by_both_are_stored_once(self):
+        self.memory.extract_user_info("u1", "I love pizza", "")
+        self.extractor.flush()
+        self.assertEqual(self.db.get_user_profile("u1")["preferences"]["likes"], ["pizza"])
+        self.assertEqual(self.extractor.stats()["profiles_updated"], 0)
+        self.assertEqual([memory["text"] for memory in self.db.get_important_memories("u1")], ["User likes pizza"])
+
+    def test_inference_calls_grow_by_a_small_fraction(self):
+        chat = ["how was your day?", "lol", "what should I cook tonight?", "tell me a joke", "ok thanks"]
+        messages = (chat * 8) + list(KNOWN_FACTS)
+        for i, text in enumerate(messages):
+            self.memory.extract_user_info(f"u{i % 7}", text, "")
+        self.extractor.flush()
+        stats = self.extractor.stats()
+        # One chat generation per message; extraction adds one call per batch of flagged messages
+        self.assertLessEqual(stats["llm_calls"], 3)
+        self.assertLess(stats["llm_calls"] / len(messages), 0.1)
+        self.assertLess(stats["submitted"], len(messages))
+
+    def test_one_message_per_window(self):
+        # At interactive rates every flagged message goes out in its own call;
+        # about a quarter of the load test's mix states a fact
+        mix = MessageMix(random.Random(3))
+        messages = [mix.next()[1] for _ in range(200)]
+        for i, text in enumerate(messages):
+            self.memory.extract_user_info(f"u{i % 7}", text, "")
+            self.extractor.flush()
+        stats = self.extractor.stats()
+        self.assertEqual(stats["llm_calls"], stats["submitted"])
+        self.assertLess(stats["llm_calls"] / len(messages), 0.35)
+
+    def test_shed_batches_are_retried_then_dropped(self):
+        extractor = FactExtractor(self.db, self.llm, "small", admission_controller=Shedding(), config=FastBatches)
+        extractor.submit("u1", "I love pizza")
+        extractor.flush()
+        stats = extractor.stats()
+        self.assertEqual((stats["batches"], stats["llm_calls"], stats["dropped"]), (MAX_ATTEMPTS, 0, 1))
+        self.assertIsNone(self.db.get_user_profile("u1"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+from config import Config
+from database import MemoryManager as DatabaseManager, decode_cursor
+
+HEAVY_ROWS = 100000
+
+def add_rows(db, user_id, count, start="2025-01-01"):
+    db.conn.executemany(
+        "INSERT INTO conversation_memories (user_id, memory_text, memory_type, importance, created_at, tone_code) "
+        "VALUES (?, ?, 'conversation_exchange', 1, datetime(?, '+' || ? || ' seconds'), 1)",
+        # Pairs of rows share a timestamp so the id tiebreak is exercised
+        ((user_id, f"exchange {i}", start, i // 2) for i in range(count))
+    )
+    db.conn.commit()
+
+class TestKeysetPagination(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.remove(self.db_path)
+
+    def test_pages_cover_history_exactly_once(self):
+        add_rows(self.db, "u1", 25)
+        add_rows(self.db, "u2", 5)
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = self.db.get_conversation_page("u1", after=cursor, limit=7)
+            seen.extend(row["text"] for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f"exchange {i}" for i in reversed(range(25))])
+        self.assertEqual(decode_cursor(self.db.get_conversation_page("u1", limit=3)[1])[1], 23)
+
+    def test_page_query_is_an_index_range_scan(self):
+        plan = self.db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM conversation_memories WHERE user_id = ? "
+            "AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+            ("u1", "2025-01-01 00:00:00", 10, 10)
+        ).fetchall()
+        detail = " ".join(row[-1] for row in plan)
+        self.assertIn("idx_user_memories_recent", detail)
+        self.assertNotIn("TEMP B-TREE", detail)
+
+    def test_history_is_bounded(self):
+        add_rows(self.db, "u1", 30, start="2999-01-01")
+        self.assertEqual(len(self.db.get_conversation_history("u1", limit=10)), 10)
+        rows, _ = self.db.get_conversation_page("u1", limit=10 ** 9)
+        self.assertLessEqual(len(rows), Config.HISTORY_MAX_PAGE_SIZE)
+
+    def test_heavy_user_iterates_in_constant_memory(self):
+        add_rows(self.db, "heavy", HEAVY_ROWS)
+        tracemalloc.start()
+        count = 0
+        previous = None
+        for row in self.db.iter_conversation_history("heavy", page_size=1000):
+            key = (row["timestamp"], row["id"])
+            self.assertTrue(previous is None or key < previous)
+            previous = key
+            count += 1
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(count, HEAVY_ROWS)
+        # A handful of pages at most, nowhere near the whole history
+        self.assertLess(peak, 8 * 1024 * 1024)
+
+    def test_bad_cursor_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.db.get_conversation_page("u1", after="not-a-cursor")
+
+class TestHistoryEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        class TestConfig(Config):
+            SQLITE_DB = os.path.join(self.tmpdir.name, "history.db")
+            DEBUG_STREAM_MAX_ROWS = 50
+            DEBUG_API_TOKEN = "secret"
+
+        from app import create_app
+        self.flask_app = create_app(TestConfig)
+        self.services = self.flask_app.extensions['chatbot']
+        add_rows(self.services.db, "u1", 120, start="now")
+
+    def tearDown(self):
+        self.services.close()
+        self.tmpdir.cleanup()
+
+    def get_lines(self, url):
+        response = self.flask_app.test_client().get(url, headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_streams_ndjson_with_server_limit_and_cursor(self):
+        lines = self.get_lines("/debug/user/u1/history?page_size=20&limit=1000")
+        rows, trailer = lines[:-1], lines[-1]
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(trailer["rows"], 50)
+
+        texts = [row["text"] for row in rows]
+        cursor = trailer["next_cursor"]
+        while cursor:
+            lines = self.get_lines(f"/debug/user/u1/history?cursor={cursor}")
+            texts.extend(row["text"] for row in lines[:-1])
+            cursor = lines[-1]["next_cursor"]
+        self.assertEqual(texts, [f"exchange {i}" for i in reversed(range(120))])
+
+    def test_bad_cursor_is_a_client_error(self):
+        response = self.flask_app.test_client().get("/debug/user/u1/history?cursor=zzz",
+                                                    headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_the_debug_token(self):
+        client = self.flask_app.test_client()
+        self.assertEqual(client.get("/debug/user/u1/history").status_code, 401)
+        self.assertEqual(client.get("/debug/user/u1/history", headers={'Authorization': 'Bearer nope'}).status_code, 401)
+        self.services.config.DEBUG_API_TOKEN = ""
+        self.assertEqual(client.get("/debug/user/u1/history", headers={'Authorization': 'Bearer secret'}).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
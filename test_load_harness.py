@@ -0,0 +1,96 @@
+import time
+import unittest
+import ollama
+import load_test
+from app_test_case import AppTestCase
+from fake_ollama import FakeOllama, FakeOllamaServer
+
+def chat(client, **kwargs):
+    return client.chat(model="fake", messages=[{"role": "user", "content": "hello there"}], **kwargs)
+
+class TestFakeOllama(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOllamaServer(behaviour=FakeOllama(prompt_eval_ms=30, token_ms=1, tokens=40, jitter=0, seed=1)).start()
+        self.client = ollama.Client(host=self.server.url, timeout=5)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_streams_tokens_after_prompt_eval(self):
+        start = time.perf_counter()
+        stream = chat(self.client, stream=True, options={"num_predict": 12})
+        first = next(stream)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.03)
+        chunks = [first] + list(stream)
+        self.assertTrue(chunks[-1]["done"])
+        self.assertEqual(chunks[-1]["eval_count"], 12)
+        self.assertEqual(len(chunks), 13)
+        self.assertTrue("".join(chunk["message"]["content"] for chunk in chunks).strip())
+
+    def test_non_streaming_reply(self):
+        response = chat(self.client)
+        self.assertTrue(response["done"])
+        self.assertEqual(response["eval_count"], 40)
+        self.assertTrue(response["message"]["content"])
+
+    def test_injected_failures(self):
+        self.server.behaviour.failure_rate = 1.0
+        with self.assertRaises(ollama.ResponseError) as raised:
+            chat(self.client)
+        self.assertEqual(raised.exception.status_code, 500)
+
+        self.server.behaviour.failure_rate = 0.0
+        self.server.behaviour.midstream_failure_rate = 1.0
+        with self.assertRaises(ollama.ResponseError):
+            list(chat(self.client, stream=True))
+        self.assertEqual(self.server.behaviour.stats()["failed"], 2)
+
+    def test_client_hang_up_is_counted(self):
+        self.server.behaviour.token_ms = 5
+        stream = chat(self.client, stream=True)
+        next(stream)
+        stream.close()
+        deadline = time.time() + 2
+        while not self.server.behaviour.stats()["cancelled"] and time.time() < deadline:
+            time.sleep(0.01)
+        stats = self.server.behaviour.stats()
+        self.assertEqual(stats["cancelled"], 1)
+        self.assertGreater(stats["tokens_unsent"], 0)
+
+class TestLoadReport(unittest.TestCase):
+    def test_percentiles_and_gates(self):
+        report = load_test.LoadReport()
+        for i in range(1, 101):
+            report.record_turn("small_talk", i / 100, i / 50, 0.001)
+        report.record_error("timeout")
+        summary = report.summary()
+        self.assertEqual(summary["ttft"]["p50"], 0.5)
+        self.assertEqual(summary["ttft"]["p95"], 0.95)
+        self.assertEqual(summary["ttft"]["p99"], 0.99)
+        self.assertAlmostEqual(summary["error_rate"], 1 / 101, places=4)
+        self.assertEqual(load_test.check_gates(summary, max_p95_ttft=1.0, max_error_rate=0.05), [])
+        self.assertEqual(len(load_test.check_gates(summary, max_p95_ttft=0.5, max_p99_latency=1.0)), 2)
+
+    def test_message_mix_covers_every_kind(self):
+        import random
+        mix = load_test.MessageMix(random.Random(3))
+        kinds = {mix.next()[0] for _ in range(500)}
+        self.assertEqual(kinds, {kind for _, kind, _ in load_test.MESSAGE_MIX})
+
+@unittest.skipIf(load_test.socketio is None, "Socket.IO client extras not installed")
+class TestSwarm(AppTestCase):
+    fake_ollama = dict(prompt_eval_ms=20, token_ms=1, seed=2)
+    serve = True
+
+    def test_end_to_end_turns_are_measured(self):
+        summary = load_test.run_swarm(self.url, sessions=3, messages=2, think_time=0, turn_timeout=10, seed=4)
+        self.assertEqual(summary["sessions_failed"], 0, summary["errors"])
+        self.assertEqual(summary["turns"], 6)
+        self.assertEqual(summary["ttft"]["count"], 6)
+        # Every reply waited for the fake model's prompt evaluation
+        self.assertGreaterEqual(summary["ttft"]["p50"], 0.015)
+        self.assertGreaterEqual(self.fake.behaviour.stats()["requests"], 6)
+        self.assertEqual(load_test.check_gates(summary, max_error_rate=0), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import statistics
+import tempfile
+import unittest
+from unittest import mock
+from config import Config
+from database import MemoryManager as DatabaseManager
+
+CONTEXT = {"tone": "friendly", "emotion_scores": {"happiness": 0.5}}
+
+class QuotaTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+        for name, value in (("MAX_MEMORIES_PER_USER", 50), ("MEMORY_EVICTION_SLACK", 10)):
+            patcher = mock.patch.object(Config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.db.close()
+        os.remove(self.db_path)
+
+    def rows(self, user_id):
+        return self.db.conn.execute("SELECT COUNT(*) FROM conversation_memories WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def backdate(self, memory_text, days):
+        self.db.conn.execute(
+            "UPDATE conversation_memories SET created_at = datetime('now', ?) WHERE memory_text = ?",
+            (f"-{days} days", memory_text)
+        )
+        self.db.conn.commit()
+
+class TestMemoryQuota(QuotaTestCase):
+    def test_count_is_maintained(self):
+        for i in range(7):
+            self.db.store_memory("u1", f"exchange {i}", "conversation_exchange", CONTEXT)
+        self.assertEqual(self.db.get_memory_count("u1"), 7)
+        self.db.conn.execute("DELETE FROM conversation_memories WHERE memory_text IN ('exchange 0', 'exchange 1')")
+        self.db.conn.commit()
+        self.assertEqual(self.db.get_memory_count("u1"), 5)
+        self.assertEqual(self.db.get_memory_count("nobody"), 0)
+
+    def test_quota_keeps_important_memories(self):
+        self.db.store_memory("u1", "User's name is Sam", "personal_info", CONTEXT, importance=3)
+        self.backdate("User's name is Sam", 60)
+        for i in range(200):
+            self.db.store_memory("u1", f"exchange {i}", "conversation_exchange", CONTEXT)
+            self.assertLessEqual(self.db.get_memory_count("u1"), 60)
+        self.assertEqual(self.db.get_memory_count("u1"), self.rows("u1"))
+        texts = [memory["text"] for memory in self.db.get_recent_memories("u1", 100)]
+        self.assertIn("User's name is Sam", texts)
+        self.assertIn("exchange 199", texts)
+        self.assertNotIn("exchange 0", texts)
+
+    def test_restated_facts_are_mentions(self):
+        for _ in range(7):
+            self.db.store_memory("u1", "User likes jazz", "preference", CONTEXT, importance=2)
+        self.assertEqual(self.rows("u1"), 1)
+        mentions = self.db.conn.execute("SELECT mention_count FROM conversation_memories").fetchone()[0]
+        self.assertEqual(mentions, 6)
+
+    def test_mentions_outweigh_age(self):
+        self.db.store_memory("u1", "User likes jazz", "preference", CONTEXT, importance=2)
+        for _ in range(7):
+            self.db.store_memory("u1", "User likes jazz", "preference", CONTEXT, importance=2)
+        self.db.store_memory("u1", "User likes tea", "preference", CONTEXT, importance=2)
+        self.backdate("User likes jazz", 20)
+        self.backdate("User likes tea", 10)
+        for i in range(58):
+            self.db.store_memory("u1", f"exchange {i}", "conversation_exchange", CONTEXT, importance=2)
+            self.backdate(f"exchange {i}", 5)
+        self.db.store_memory("u1", "trigger", "conversation_exchange", CONTEXT, importance=3)
+
+        texts = [memory["text"] for memory in self.db.get_recent_memories("u1", 100)]
+        self.assertIn("User likes jazz", texts)
+        self.assertNotIn("User likes tea", texts)
+
+    def test_background_pass_trims_existing_users(self):
+        self.db.conn.executemany(
+            "INSERT INTO conversation_memories (user_id, memory_text, importance) VALUES (?, ?, 1)",
+            [("u1", f"old {i}") for i in range(120)]
+        )
+        self.db.conn.commit()
+        self.assertEqual(self.db.enforce_memory_quota(), 70)
+        self.assertEqual(self.db.get_memory_count("u1"), 50)
+
+    def test_eviction_reads_candidates_from_index(self):
+        plan = self.db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, importance, mention_count, created_at FROM conversation_memories "
+            "WHERE user_id = ? ORDER BY importance, created_at, id LIMIT ?", ("u1", 40)
+        ).fetchall()
+        detail = " ".join(row[-1] for row in plan)
+        self.assertIn("idx_user_memories_importance", detail)
+        self.assertNotIn("TEMP B-TREE", detail)
+
+class StepClock:
+    """Clock that advances with the SQLite VM instructions run on a connection.
+
+    It measures the work a query does, not the wall time it took, so the
+    readings don't depend on how busy the machine is.
+    """
+
+    def __init__(self, conn, resolution=1):
+        self.now = 0
+        self.resolution = resolution
+        conn.set_progress_handler(self._tick, resolution)
+
+    def _tick(self):
+        self.now += self.resolution
+        return 0
+
+    def __call__(self):
+        return self.now
+
+class TestLatencyStaysFlat(QuotaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = StepClock(self.db.conn)
+
+    def median_turn_cost(self, user_id, rounds=60):
+        samples = []
+        for i in range(rounds):
+            start = self.clock()
+            self.db.store_memory(user_id, f"probe {i}", "conversation_exchange", CONTEXT)
+            self.db.get_recent_memories(user_id, 5)
+            self.db.get_important_memories(user_id, 3)
+            samples.append(self.clock() - start)
+        return statistics.median(samples)
+
+    def fill(self, user_id, count):
+        for i in range(count):
+            self.db.store_memory(user_id, f"exchange {i}", "conversation_exchange", CONTEXT, importance=1 + i % 3)
+
+    def test_per_user_latency_independent_of_history(self):
+        self.fill("u1", 50)
+        early = self.median_turn_cost("u1")
+        self.fill("u1", 3000)
+        late = self.median_turn_cost("u1")
+        self.assertLessEqual(self.rows("u1"), 60)
+        self.assertGreater(early, 0)
+        # Bounded rows per user keep the work per turn flat
+        self.assertLess(late, early * 1.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from database import MemoryManager as DatabaseManager
+
+EMOTIONAL_CONTEXT = {
+    "tone": "playful",
+    "emotion_scores": {"happiness": 0.8, "sadness": 0.0, "excitement": 0.6, "calmness": 0.55,
+                       "curiosity": 0.9, "empathy": 0.1},
+    "response_opener": "Oh, that's fun!",
+    "emotional_markers": "😊 🤔",
+    "should_show_empathy": False,
+    "is_excited": False,
+    "is_curious": True,
+    "is_playful": True
+}
+
+# What is kept of an emotional context after encoding
+STORED_CONTEXT = {"tone": EMOTIONAL_CONTEXT["tone"], "emotion_scores": EMOTIONAL_CONTEXT["emotion_scores"]}
+
+# The double write (conversation_memories + recent_memories JSON copy) cost
+# ~1350 bytes per exchange with this context, one JSON write about half that;
+# the compact emotion columns bring it down to roughly the text itself
+MAX_BYTES_PER_TURN = 320
+
+def exchange_text(i):
+    return f"User: I love jazz music, what about you? {i}... | Bot: Jazz is wonderful, especially Coltrane {i}..."
+
+class TestMemoryStorage(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def open_db(self):
+        db = DatabaseManager(self.db_path)
+        self.addCleanup(db.conn.close)
+        return db
+
+    def db_bytes(self, db):
+        page_count = db.conn.execute("PRAGMA page_count").fetchone()[0]
+        return page_count * db.conn.execute("PRAGMA page_size").fetchone()[0]
+
+    def test_exchange_is_written_once(self):
+        db = self.open_db()
+        db.store_memory("u1", exchange_text(0), "conversation_exchange", EMOTIONAL_CONTEXT)
+        tables = {row[0] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn("recent_memories", tables)
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM conversation_memories").fetchone()[0], 1)
+
+        recent = db.get_recent_memories("u1", 5)
+        self.assertEqual(recent[0]["text"], exchange_text(0))
+        self.assertEqual(recent[0]["emotional_context"], STORED_CONTEXT)
+
+    def test_bytes_written_per_turn(self):
+        db = self.open_db()
+        db.store_memory("warmup", exchange_text(0), "conversation_exchange", EMOTIONAL_CONTEXT)
+        before = self.db_bytes(db)
+        turns = 500
+        for i in range(turns):
+            db.store_memory(f"u{i % 20}", exchange_text(i), "conversation_exchange", EMOTIONAL_CONTEXT)
+        self.assertLess((self.db_bytes(db) - before) / turns, MAX_BYTES_PER_TURN)
+
+    def test_recent_memories_newest_first_from_index(self):
+        db = self.open_db()
+        for i in range(5):
+            db.store_memory("u1", exchange_text(i), "conversation_exchange", EMOTIONAL_CONTEXT)
+        self.assertEqual([memory["text"] for memory in db.get_recent_memories("u1", 2)],
+                         [exchange_text(4), exchange_text(3)])
+
+        plan = db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT memory_text FROM conversation_memories "
+            "WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT 5", ("u1",)
+        ).fetchall()
+        detail = " ".join(row[-1] for row in plan)
+        self.assertIn("idx_user_memories_recent", detail)
+        self.assertNotIn("TEMP B-TREE", detail)
+
+    def test_legacy_recent_memories_are_migrated(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript('''
+            CREATE TABLE conversation_memories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, memory_text TEXT, memory_type TEXT,
+                emotional_context TEXT, importance INTEGER DEFAULT 1, created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE recent_memories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, memory_data TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+        ''')
+        conn.execute(
+            "INSERT INTO conversation_memories (user_id, memory_text, memory_type, emotional_context) VALUES (?, ?, ?, ?)",
+            ("u1", "both", "conversation_exchange", json.dumps(EMOTIONAL_CONTEXT))
+        )
+        for text in ("both", "only recent"):
+            conn.execute(
+                "INSERT INTO recent_memories (user_id, memory_data) VALUES (?, ?)",
+                ("u1", json.dumps({"text": text, "type": "conversation_exchange", "emotional_context": EMOTIONAL_CONTEXT}))
+            )
+        conn.commit()
+        conn.close()
+
+        db = self.open_db()
+        self.assertEqual(sorted(memory["text"] for memory in db.get_recent_memories("u1")), ["both", "only recent"])
+        migrated = [memory for memory in db.get_recent_memories("u1") if memory["text"] == "only recent"][0]
+        self.assertEqual(migrated["emotional_context"], STORED_CONTEXT)
+        tables = {row[0] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn("recent_memories", tables)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+import migrations
+from database import MemoryManager as DatabaseManager
+
+CONTEXT = {"tone": "friendly", "emotion_scores": {"happiness": 0.5}}
+
+def plan(conn, sql):
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def open_db(self):
+        db = DatabaseManager(self.db_path)
+        self.addCleanup(db.close)
+        return db
+
+    def indexes(self, conn):
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+
+    def test_fresh_database_is_fully_migrated_once(self):
+        db = self.open_db()
+        self.assertEqual(migrations.applied_versions(db.conn), {m.version for m in migrations.MIGRATIONS})
+        self.assertEqual(migrations.pending(db.conn), [])
+        self.assertEqual(migrations.migrate(db.conn), [])
+        versions = [m.version for m in migrations.MIGRATIONS]
+        self.assertEqual(versions, sorted(set(versions)))
+
+    def test_original_schema_is_upgraded(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript('''
+            CREATE TABLE user_profiles (user_id TEXT PRIMARY KEY, name TEXT, preferences TEXT, personality_traits TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE conversation_memories (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, memory_text TEXT,
+                memory_type TEXT, emotional_context TEXT, importance INTEGER DEFAULT 1,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE memory_summaries (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, summary_text TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE recent_memories (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, memory_data TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+            CREATE INDEX idx_user_memories ON conversation_memories(user_id);
+            CREATE INDEX idx_user_summaries ON memory_summaries(user_id);
+            CREATE INDEX idx_memory_importance ON conversation_memories(importance);
+            INSERT INTO conversation_memories (user_id, memory_text, memory_type, emotional_context, importance)
+                VALUES ('u1', 'likes jazz', 'preference', '{"tone": "playful"}', 3);
+            INSERT INTO memory_summaries (user_id, summary_text) VALUES ('u1', 'Conversation about music.');
+        ''')
+        conn.close()
+
+        db = self.open_db()
+        self.assertEqual(migrations.pending(db.conn), [])
+        indexes = self.indexes(db.conn)
+        self.assertTrue({"idx_user_memories_recent", "idx_user_memories_importance", "idx_user_summary_order"} <= indexes)
+        self.assertFalse({"idx_user_memories", "idx_user_summaries", "idx_memory_importance"} & indexes)
+        self.assertEqual(db.get_important_memories("u1")[0]["emotional_context"]["tone"], "playful")
+        self.assertEqual(db.get_summary_set("u1")[0]["tier"], "session")
+
+    def test_failed_migration_rolls_back(self):
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+        broken = [migrations.Migration(1, "half done", [
+            "CREATE TABLE half_done (id INTEGER)",
+            "INSERT INTO missing_table VALUES (1)"
+        ])]
+        with self.assertRaises(sqlite3.OperationalError):
+            migrations.migrate(conn, broken)
+        self.assertEqual(migrations.applied_versions(conn), set())
+        self.assertIsNone(conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone())
+
+    def test_index_builds_on_large_tables_are_deferred(self):
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+        base = [m for m in migrations.MIGRATIONS if not m.online]
+        migrations.migrate(conn, base)
+        conn.executemany("INSERT INTO conversation_memories (user_id, memory_text) VALUES (?, ?)",
+                         [(f"u{i % 7}", f"text {i}") for i in range(200)])
+        conn.commit()
+
+        deferred = migrations.migrate(conn, online_min_rows=100)
+        self.assertIn("recent memories index", [m.name for m in deferred])
+        self.assertNotIn("idx_user_memories_recent", self.indexes(conn))
+        # Profiles and summaries are small, so their indexes were built right away
+        self.assertIn("idx_user_summary_order", self.indexes(conn))
+
+        self.assertEqual(migrations.run_online(conn, threading.Lock()), len(deferred))
+        self.assertIn("idx_user_memories_recent", self.indexes(conn))
+        self.assertEqual(migrations.pending(conn), [])
+
+class TestHotQueryPlans(unittest.TestCase):
+    """Every request-path query must be an index search with no sort step"""
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+        for i in range(60):
+            user_id = f"u{i % 4}"
+            self.db.store_memory(user_id, f"text {i}", "conversation_exchange", CONTEXT, importance=1 + i % 3)
+            self.db.store_turns(user_id, [("user", "hi"), ("assistant", "hello")])
+        self.db.update_user_profile("u1", {"name": "Sam"})
+        self.db.create_memory_summary("u1", "Conversation about music.")
+        self.db.conn.execute("ANALYZE")
+
+    def tearDown(self):
+        self.db.close()
+        os.remove(self.db_path)
+
+    def traced(self, call):
+        statements = []
+        self.db.conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            self.db.conn.set_trace_callback(None)
+        selects = [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+        self.assertTrue(selects)
+        return selects
+
+    def assert_index_only(self, call, covering=False):
+        for sql in self.traced(call):
+            steps = plan(self.db.conn, sql)
+            detail = " | ".join(steps)
+            self.assertNotIn("TEMP B-TREE", detail, sql)
+            for step in steps:
+                self.assertTrue(step.startswith("SEARCH"), f"{sql}\n{detail}")
+                if covering:
+                    self.assertTrue("COVERING INDEX" in step or "PRIMARY KEY" in step, f"{sql}\n{detail}")
+
+    def test_memory_queries(self):
+        self.assert_index_only(lambda: self.db.get_recent_memories("u1", 10))
+        self.assert_index_only(lambda: self.db.get_important_memories("u1", 3))
+        self.assert_index_only(lambda: self.db.get_conversation_history("u1"))
+        _, cursor = self.db.get_conversation_page("u1", limit=5)
+        self.assert_index_only(lambda: self.db.get_conversation_page("u1", after=cursor, limit=5))
+
+    def test_summary_queries(self):
+        self.assert_index_only(lambda: self.db.get_summary_set("u1"))
+        self.assert_index_only(lambda: self.db.get_memory_summaries("u1", limit=None, tier="session", oldest_first=True))
+        self.assert_index_only(lambda: self.db.get_summary_for_period("u1", "daily", "2025-01-01"))
+        self.assert_index_only(lambda: self.db.get_summary_for_period("u1", "long_term", None))
+
+    def test_profile_and_turn_queries(self):
+        self.assert_index_only(lambda: self.db.get_user_profile("u1"))
+        self.assert_index_only(lambda: self.db.get_recent_turns("u1"), covering=True)
+        self.assert_index_only(lambda: self.db.store_turns("u1", [("user", "again")]), covering=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import httpx
+from config import Config
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN
+from emotion_engine import EmotionEngine
+from model_router import ModelRouter, ModelTier
+from output_controller import OutputController
+
+class FakeClient:
+    def __init__(self, name, fail_with=None):
+        self.name = name
+        self.fail_with = fail_with
+        self.calls = []
+
+    def chat(self, model, messages, options):
+        self.calls.append(options)
+        if self.fail_with:
+            raise self.fail_with
+        return {"message": {"content": f"reply from {self.name}"}}
+
+class StreamingClient:
+    """Streams `words`, then fails with `fail_with` if given"""
+
+    def __init__(self, words, fail_with=None):
+        self.words = words
+        self.fail_with = fail_with
+
+    def chat(self, model, messages, options, stream):
+        for word in self.words:
+            yield {"message": {"content": word}}
+        if self.fail_with:
+            raise self.fail_with
+        yield {"message": {"content": ""}, "done": True, "eval_count": len(self.words)}
+
+def make_router(small_error=None, large_error=None, breaker=None):
+    small = ModelTier("small", "tiny", num_ctx=1024, num_predict=80, timeout=5, max_score=0.35)
+    large = ModelTier("large", "big", num_ctx=2048, num_predict=120, timeout=30, max_score=1.0)
+    small.client = FakeClient("small", small_error)
+    large.client = FakeClient("large", large_error)
+    return ModelRouter([small, large], breaker=breaker)
+
+class TestModelRouter(unittest.TestCase):
+    def setUp(self):
+        self.engine = EmotionEngine()
+
+    def route(self, router, message, context_size=0):
+        scores = self.engine.analyze_emotion(message)
+        return router.tiers[router.select(router.score(message, scores, context_size))].name
+
+    def test_small_talk_goes_to_small_tier(self):
+        router = make_router()
+        self.assertEqual(self.route(router, "hey, good morning!"), "small")
+        self.assertEqual(self.route(router, "thanks :)"), "small")
+
+    def test_hard_questions_go_to_large_tier(self):
+        router = make_router()
+        message = ("Can you explain how transformers differ from recurrent networks? "
+                   "Why does attention scale better, and what are the tradeoffs when "
+                   "the context window gets really long? Which one should I learn first?")
+        self.assertEqual(self.route(router, message), "large")
+
+    def test_tier_options_are_applied(self):
+        router = make_router()
+        router.chat([{"role": "user", "content": "hi"}], "hi", options={"top_p": 0.9})
+        options = router.tiers[0].client.calls[0]
+        self.assertEqual(options["num_predict"], 80)
+        self.assertEqual(options["num_ctx"], 1024)
+        self.assertEqual(options["top_p"], 0.9)
+
+    def test_timeout_escalates_to_larger_tier(self):
+        router = make_router(small_error=httpx.ReadTimeout("slow"))
+        response = router.chat([{"role": "user", "content": "hi"}], "hi")
+        self.assertEqual(response["message"]["content"], "reply from large")
+
+        stats = router.stats()
+        self.assertEqual(stats["small"]["fallbacks"], 1)
+        self.assertEqual(stats["large"]["completed"], 1)
+        self.assertEqual(stats["small"]["traffic_share"], 0.5)
+        self.assertIsNotNone(stats["large"]["latency_p95"])
+
+    def test_text_streamed_by_a_failed_tier_is_reset(self):
+        router = make_router()
+        router.output_controller = OutputController(config=Config)
+        router.tiers[0].client = StreamingClient(["Well, ", "let me"], fail_with=httpx.ReadTimeout("slow"))
+        router.tiers[1].client = StreamingClient(["Sure ", "thing."])
+        events = []
+        response = router.chat([{"role": "user", "content": "hi"}], "hi", on_token=events.append,
+                               on_reset=lambda: events.append(None))
+        self.assertEqual(events, ["Well, ", "let me", None, "Sure ", "thing."])
+        self.assertEqual(response["message"]["content"], "Sure thing.")
+
+        # Nothing streamed before the failure: nothing to reset
+        router.tiers[0].client = StreamingClient([], fail_with=httpx.ReadTimeout("slow"))
+        events.clear()
+        router.chat([{"role": "user", "content": "hi"}], "hi", on_token=events.append, on_reset=lambda: events.append(None))
+        self.assertEqual(events, ["Sure ", "thing."])
+
+    def test_escalated_failures_do_not_trip_the_breaker(self):
+        breaker = CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, open_seconds=60)
+        router = make_router(small_error=httpx.ReadTimeout("slow"), breaker=breaker)
+        for _ in range(6):
+            response = router.chat([{"role": "user", "content": "hi"}], "hi")
+            self.assertEqual(response["message"]["content"], "reply from large")
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual((breaker.stats()["calls"], breaker.stats()["failures"]), (6, 0))
+
+    def test_breaker_trips_when_every_tier_fails(self):
+        breaker = CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, open_seconds=60)
+        router = make_router(small_error=httpx.ReadTimeout("slow"), large_error=httpx.ReadTimeout("slow"), breaker=breaker)
+        for _ in range(2):
+            with self.assertRaises(httpx.ReadTimeout):
+                router.chat([{"role": "user", "content": "hi"}], "hi")
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            router.chat([{"role": "user", "content": "hi"}], "hi")
+        self.assertEqual(len(router.tiers[0].client.calls), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from output_controller import OutputController
+
+class FakeStream:
+    """Chat stream that yields one word per chunk and records being closed"""
+
+    def __init__(self, text, eval_count=None):
+        self.pieces = [word + " " for word in text.split(" ")]
+        self.pieces[-1] = self.pieces[-1].rstrip()
+        self.eval_count = eval_count
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.sent += 1
+            yield {"message": {"content": piece}, "done": False}
+        yield {"message": {"content": ""}, "done": True, "eval_count": self.eval_count or self.sent}
+
+    def close(self):
+        self.closed = True
+
+class TestOutputController(unittest.TestCase):
+    def test_stops_after_sentence_budget(self):
+        controller = OutputController(max_sentences=2, max_chars=500, min_chars=5)
+        stream = FakeStream("One. Two is here. Three goes on. Four never gets read. " * 3)
+        result = controller.consume(iter_with_close(stream), num_predict=120)
+
+        self.assertEqual(result["message"]["content"], "One. Two is here.")
+        self.assertTrue(result["stopped_early"])
+        self.assertTrue(stream.closed)
+        self.assertLess(stream.sent, len(stream.pieces))
+        self.assertEqual(result["tokens_saved"], 120 - result["eval_count"])
+        self.assertEqual(controller.stats()["stopped_early"], 1)
+
+    def test_char_budget_cuts_at_last_clean_boundary(self):
+        controller = OutputController(max_sentences=10, max_chars=40, min_chars=5)
+        stream = FakeStream("This is the first sentence. And this second one runs well past the budget. More.")
+        result = controller.consume(iter_with_close(stream), num_predict=120)
+        self.assertEqual(result["message"]["content"], "This is the first sentence.")
+
+    def test_long_first_sentence_is_finished(self):
+        controller = OutputController(max_sentences=3, max_chars=20, min_chars=5)
+        stream = FakeStream("A rather long opening sentence that overshoots. Then more text.")
+        result = controller.consume(iter_with_close(stream), num_predict=120)
+        self.assertEqual(result["message"]["content"], "A rather long opening sentence that overshoots.")
+
+    def test_short_reply_passes_through(self):
+        controller = OutputController(max_sentences=3, max_chars=150, min_chars=5)
+        stream = FakeStream("Hi there! How are you?", eval_count=7)
+        result = controller.consume(iter_with_close(stream), num_predict=120)
+        self.assertEqual(result["message"]["content"], "Hi there! How are you?")
+        self.assertFalse(result["stopped_early"])
+        self.assertEqual(result["eval_count"], 7)
+        self.assertEqual(result["tokens_saved"], 0)
+
+    def test_streamed_text_stops_at_the_cut(self):
+        controller = OutputController(max_sentences=2, max_chars=500, min_chars=5)
+        pieces = []
+        stream = FakeStream("One. Two is here. Three goes on. Four never gets read.")
+        result = controller.consume(iter_with_close(stream), num_predict=120, on_token=pieces.append)
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual("".join(pieces), "One. Two is here.")
+        self.assertEqual(result["message"]["content"], "One. Two is here.")
+
+    def test_cancelled_generation_hangs_up(self):
+        controller = OutputController(max_sentences=10, max_chars=500, min_chars=5)
+        stream = FakeStream("one two three four five six seven eight")
+        pieces = []
+        result = controller.consume(iter_with_close(stream), num_predict=120, on_token=pieces.append,
+                                    cancelled=lambda: len(pieces) >= 3)
+        self.assertTrue(result["cancelled"])
+        self.assertTrue(stream.closed)
+        self.assertEqual(result["message"]["content"], "one two three")
+        self.assertEqual(result["tokens_saved"], 120 - 4)
+        stats = controller.stats()
+        self.assertEqual((stats["cancelled"], stats["tokens_saved_cancelled"], stats["stopped_early"]), (1, 116, 0))
+
+def iter_with_close(stream):
+    """Generator over the fake stream whose close() reaches the fake"""
+    def generate():
+        try:
+            yield from stream
+        finally:
+            stream.close()
+    return generate()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from config import Config
+from database import MemoryManager as DatabaseManager
+from memory_manager import MemoryManager as ChatMemoryManager
+from prompt_cache import GUIDELINES, PromptCache
+
+def emotional(tone="friendly", markers="😊"):
+    return {"tone": tone, "emotional_markers": markers}
+
+class TestPromptCache(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+        self.cache = PromptCache(("friendly", "empathetic"))
+        self.memory = ChatMemoryManager(self.db, prompt_cache=self.cache)
+        self.db.update_user_profile("u1", {"name": "Alice", "preferences": {"likes": ["tea"], "location": "Porto"}})
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.remove(self.db_path)
+
+    def test_profile_version(self):
+        self.assertEqual(self.db.get_user_profile("u1")["version"], 1)
+        self.db.update_user_profile("u1", {"preferences": {"likes": ["jazz"]}})
+        profile = self.db.get_user_profile("u1")
+        self.assertEqual((profile["user_id"], profile["version"]), ("u1", 2))
+        self.assertEqual(self.db.get_user_contexts(["u1"])["u1"]["user_profile"], profile)
+
+    def test_prompts_are_byte_stable(self):
+        profile = self.db.get_user_profile("u1")
+        first = self.cache.system_prompt("Important memories", emotional(), profile)
+        self.assertEqual(self.cache.system_prompt("Important memories", emotional(), self.db.get_user_profile("u1")), first)
+        self.assertTrue(first.startswith(f"You are {Config.BOT_NAME}, {Config.BOT_PERSONA}."))
+        self.assertIn("The user's name is Alice. They like: tea. They're from: Porto.", first)
+        self.assertIn("# Tone:\nfriendly\n", first)
+
+        # Only the per-turn tail differs between turns of the same tone
+        other = self.cache.system_prompt("Something else", emotional(markers="🤔"), profile)
+        prefix = first[:first.index("# Emotional context:")]
+        self.assertTrue(other.startswith(prefix))
+        self.assertIn("# Tone:\nplayful\n", self.cache.system_prompt("", emotional("playful"), profile))
+
+    def test_long_context_keeps_its_budget(self):
+        profile = self.db.get_user_profile("u1")
+        prompt = self.cache.system_prompt("x" * 5000, emotional(), profile)
+        self.assertIn(GUIDELINES, prompt)
+        self.assertTrue(prompt.endswith("x\n"))
+        # Everything but the guidelines fills MAX_CONTEXT_LENGTH, as when the
+        # guidelines closed the prompt and were cut first (947 chars of
+        # context kept here then)
+        kept = prompt.count("x")
+        self.assertEqual(len(prompt) - len(GUIDELINES), Config.MAX_CONTEXT_LENGTH)
+        self.assertGreaterEqual(kept, 947)
+        short = self.cache.system_prompt("Important memories", emotional(), profile)
+        self.assertTrue(short.endswith("# User Context:\nImportant memories\n"))
+
+    def test_profile_change_rebuilds_the_block(self):
+        context = self.memory.get_conversation_context("u1", max_exchanges=3)
+        self.assertIn("User's location: Porto", self.memory.format_context_for_prompt(context))
+        self.cache.system_prompt("", emotional(), self.db.get_user_profile("u1"))
+        self.assertEqual((self.cache.stats()["hits"], self.cache.stats()["misses"]), (1, 1))
+
+        self.db.update_user_profile("u1", {"preferences": {"location": "Lisbon"}})
+        prompt = self.cache.system_prompt("", emotional(), self.db.get_user_profile("u1"))
+        self.assertIn("They're from: Lisbon.", prompt)
+        context = self.memory.get_conversation_context("u1", max_exchanges=3)
+        self.assertIn("User's location: Lisbon", self.memory.format_context_for_prompt(context))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["users"]), (2, 2, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_profiles_without_a_version_are_not_cached(self):
+        prompt = self.cache.system_prompt("", emotional(), {"name": "Bob"})
+        self.assertIn("The user's name is Bob.", prompt)
+        self.assertIn("# Personal Context:\n\n", self.cache.system_prompt("", emotional(), {}))
+        stats = self.cache.stats()
+        self.assertEqual((stats["uncached"], stats["users"], stats["hit_rate"]), (2, 0, 0.0))
+
+    def test_bounded(self):
+        cache = PromptCache(max_users=2)
+        for user_id in ("u1", "u2", "u3", "u1"):
+            self.db.update_user_profile(user_id, {"name": user_id.title()})
+            cache.system_prompt("", emotional(), self.db.get_user_profile(user_id))
+        stats = cache.stats()
+        self.assertEqual((stats["users"], stats["evictions"]), (2, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import threading
+import time
+import unittest
+from app_test_case import AppTestCase
+from reply_cache import ReplyCache, valid_message_id
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestReplyCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ReplyCache(ttl=60, max_entries=3, clock=self.clock)
+
+    def test_same_message_id_returns_the_existing_stream(self):
+        stream, created = self.cache.begin("u1", "m1")
+        self.assertTrue(created)
+        again, created = self.cache.begin("u1", "m1")
+        self.assertFalse(created)
+        self.assertIs(again, stream)
+        # Ids are per user
+        self.assertTrue(self.cache.begin("u2", "m1")[1])
+        stats = self.cache.stats()
+        self.assertEqual((stats["started"], stats["duplicates"], stats["followed_running"]), (2, 1, 1))
+
+    def test_follower_gets_tokens_from_its_offset_while_running(self):
+        stream, _ = self.cache.begin("u1", "m1")
+        stream.append("a")
+        stream.append("b")
+        received = []
+        follower = threading.Thread(target=lambda: received.extend(stream.follow(offset=1, timeout=5)))
+        follower.start()
+        time.sleep(0.05)
+        stream.append("c")
+        self.cache.finish(stream, {"message": "abc"})
+        follower.join(5)
+        self.assertEqual(received, [(1, "b"), (2, "c")])
+        self.assertEqual(stream.result, {"message": "abc"})
+
+    def test_follower_starts_over_when_the_reply_is_reset(self):
+        stream, _ = self.cache.begin("u1", "m1")
+        stream.append("a")
+        received = []
+        follower = threading.Thread(target=lambda: received.extend(stream.follow(offset=1, timeout=5)))
+        follower.start()
+        time.sleep(0.05)
+        stream.reset()
+        stream.append("x")
+        self.cache.finish(stream, {"message": "x"})
+        follower.join(5)
+        self.assertEqual(received, [(0, None), (0, "x")])
+
+    def test_stalled_stream_stops_following(self):
+        stream, _ = self.cache.begin("u1", "m1")
+        stream.append("a")
+        self.assertEqual(list(stream.follow(offset=0, timeout=0.05)), [(0, "a")])
+        self.assertFalse(stream.done)
+
+    def test_finished_replies_expire_after_ttl(self):
+        stream, _ = self.cache.begin("u1", "m1")
+        self.cache.finish(stream, {"message": "hi"})
+        self.clock.now += 30
+        self.assertIs(self.cache.get("u1", "m1"), stream)
+        self.clock.now += 31
+        self.assertIsNone(self.cache.get("u1", "m1"))
+        self.assertEqual(self.cache.stats()["expired"], 1)
+
+    def test_template_replies_are_not_kept(self):
+        stream, _ = self.cache.begin("u1", "m1")
+        self.cache.finish(stream, {"message": "busy"}, keep=False)
+        self.assertTrue(stream.done)
+        self.assertTrue(self.cache.begin("u1", "m1")[1])
+
+    def test_oldest_entries_are_evicted(self):
+        for i in range(5):
+            self.cache.begin("u1", f"m{i}")
+        self.assertIsNone(self.cache.get("u1", "m0"))
+        self.assertIsNotNone(self.cache.get("u1", "m4"))
+        self.assertEqual(self.cache.stats()["evicted"], 2)
+
+    def test_message_id_validation(self):
+        self.assertTrue(valid_message_id("3f2b7c1e-0a4d-4f7e-9d3c-2b1a0f9e8d7c"))
+        for value in (None, "", 42, "x" * 65, ["m1"]):
+            self.assertFalse(valid_message_id(value))
+
+class TestMessageIds(AppTestCase):
+    """user_message with client message ids against the app and a fake Ollama"""
+
+    fake_ollama = dict(prompt_eval_ms=5, token_ms=5, tokens=30, jitter=0, seed=1)
+
+    def send(self, client, **data):
+        client.emit('user_message', dict({'message': 'tell me about your day'}, **data))
+        received = client.get_received()
+        tokens = [event['args'][0] for event in received if event['name'] == 'bot_token']
+        replies = [event['args'][0] for event in received if event['name'] == 'bot_response']
+        return tokens, replies
+
+    def test_reply_streams_and_retry_replays_from_offset(self):
+        tokens, replies = self.send(self.connect(), message_id='m1')
+        self.assertEqual(len(replies), 1)
+        reply = replies[0]
+        self.assertEqual(reply['message_id'], 'm1')
+        self.assertEqual([token['offset'] for token in tokens], list(range(len(tokens))))
+        self.assertEqual("".join(token['token'] for token in tokens).strip(), reply['message'])
+        requests = self.fake.behaviour.stats()['requests']
+
+        # Reconnected client that saw the first 3 tokens
+        resumed, replies = self.send(self.connect(), message_id='m1', offset=3)
+        self.assertEqual(replies, [reply])
+        self.assertEqual(resumed, tokens[3:])
+        self.assertEqual(self.fake.behaviour.stats()['requests'], requests)
+        stats = self.services.reply_cache.stats()
+        self.assertEqual((stats['duplicates'], stats['replayed_finished'], stats['tokens_replayed']),
+                         (1, 1, len(tokens) - 3))
+
+    def test_duplicate_follows_a_running_generation(self):
+        self.fake.behaviour.token_ms = 20
+        first = {}
+        client = self.connect()
+        sender = threading.Thread(target=lambda: first.update(zip(('tokens', 'replies'), self.send(client, message_id='m2'))))
+        sender.start()
+        deadline = time.time() + 5
+        while self.services.reply_cache.get('alice', 'm2') is None and time.time() < deadline:
+            time.sleep(0.01)
+        tokens, replies = self.send(self.connect(), message_id='m2')
+        sender.join(10)
+        self.assertEqual(replies, first['replies'])
+        self.assertEqual(tokens, first['tokens'])
+        self.assertEqual(self.fake.behaviour.stats()['requests'], 1)
+        self.assertEqual(self.services.reply_cache.stats()['followed_running'], 1)
+
+    def test_messages_without_ids_still_stream(self):
+        tokens, replies = self.send(self.connect())
+        self.assertTrue(tokens)
+        self.assertIsNone(tokens[0]['message_id'])
+        self.assertNotIn('message_id', replies[0])
+        self.assertEqual(self.services.reply_cache.stats()['started'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from config import Config
+from sharding import ShardedMemoryManager, jump_hash, open_memory_store, read_shard_count, shard_paths
+
+CONTEXT = {"tone": "friendly", "emotion_scores": {"happiness": 0.6}}
+
+class TestJumpHash(unittest.TestCase):
+    def test_stable_and_balanced(self):
+        users = [f"user_{i}" for i in range(4000)]
+        counts = Counter(jump_hash(user_id, 4) for user_id in users)
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        self.assertTrue(all(800 < count < 1200 for count in counts.values()))
+        self.assertEqual(jump_hash("user_7", 4), jump_hash("user_7", 4))
+
+    def test_growing_moves_few_users(self):
+        users = [f"user_{i}" for i in range(4000)]
+        moved = sum(jump_hash(user_id, 4) != jump_hash(user_id, 5) for user_id in users)
+        self.assertLess(moved, len(users) * 0.3)
+
+class TestShardedMemoryManager(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "memory.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def open_store(self, shard_count):
+        store = ShardedMemoryManager(self.db_path, shard_count)
+        self.addCleanup(store.close)
+        return store
+
+    def add_user(self, store, user_id, exchanges=3):
+        store.update_user_profile(user_id, {"name": user_id})
+        for i in range(exchanges):
+            store.store_memory(user_id, f"{user_id} exchange {i}", "conversation_exchange", CONTEXT)
+        store.store_turns(user_id, [("user", "hi"), ("assistant", "hello")])
+        store.create_memory_summary(user_id, f"Summary for {user_id}")
+
+    def test_users_live_in_their_own_shard(self):
+        store = self.open_store(3)
+        for i in range(30):
+            self.add_user(store, f"u{i}")
+        for shard in store.shards:
+            for user_id in shard.list_users():
+                self.assertIs(store.shard_for(user_id), shard)
+        self.assertEqual(len(store.list_users()), 30)
+        self.assertEqual(store.get_user_profile("u7")["name"], "u7")
+        self.assertEqual(len(store.get_recent_memories("u7")), 3)
+        self.assertEqual(sum(store.get_tone_counts().values()), 90)
+
+    def test_maintenance_fans_out(self):
+        store = self.open_store(3)
+        self.add_user(store, "u1")
+        store.cleanup_old_memories()
+        self.assertTrue(store.vacuum())
+        self.assertTrue(all(os.path.exists(path) for path in shard_paths(self.db_path, 3)))
+
+    def test_reshard_moves_everyone_and_is_recorded(self):
+        store = self.open_store(1)
+        for i in range(20):
+            self.add_user(store, f"u{i}")
+        self.assertEqual(store.reshard(4), 20)
+        self.assertEqual(store.shard_count, 4)
+        self.assertEqual(read_shard_count(self.db_path), 4)
+        for i in range(20):
+            self.assertEqual(len(store.get_recent_memories(f"u{i}")), 3)
+            self.assertEqual(store.get_memory_summaries(f"u{i}")[0]["text"], f"Summary for u{i}")
+
+        class ShardConfig(Config):
+            SQLITE_DB = self.db_path
+            SQLITE_SHARDS = 1
+        reopened = open_memory_store(ShardConfig)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.shard_count, 4)
+        self.assertEqual(reopened.get_user_profile("u3")["name"], "u3")
+
+    def test_reshard_online_keeps_concurrent_writes(self):
+        store = self.open_store(2)
+        for i in range(40):
+            self.add_user(store, f"u{i}", exchanges=1)
+        stop = threading.Event()
+        written = Counter()
+
+        def writer(user_id):
+            while not stop.is_set():
+                if store.store_memory(user_id, "live write", "conversation_exchange", CONTEXT):
+                    written[user_id] += 1
+
+        threads = [threading.Thread(target=writer, args=(f"u{i}",)) for i in range(0, 40, 8)]
+        for thread in threads:
+            thread.start()
+        store.reshard(3)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        for user_id, count in written.items():
+            self.assertEqual(len(store.get_recent_memories(user_id, 100000)), count + 1)
+
+if __name__ == '__main__':
+    unittest.main()
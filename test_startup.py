@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from config import Config
+
+# Cold start (import + create_app) must stay well under a second so test
+# runs and freshly forked/autoscaled workers are fast
+STARTUP_BUDGET_SECONDS = 1.0
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+app.create_app()
+print(time.perf_counter() - start)
+"""
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "startup.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cold_start_within_budget_and_side_effect_free(self):
+        env = dict(os.environ, SQLITE_DB=self.db_path)
+        here = os.path.dirname(os.path.abspath(__file__))
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            cwd=here, env=env, capture_output=True, text=True, timeout=30
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        elapsed = float(result.stdout.strip().splitlines()[-1])
+        self.assertLess(elapsed, STARTUP_BUDGET_SECONDS)
+        # Importing the app must not open or create the database
+        self.assertFalse(os.path.exists(self.db_path))
+
+class TestAppFactory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        class TestConfig(Config):
+            SQLITE_DB = os.path.join(self.tmpdir.name, "factory.db")
+            # Nothing listens here, so generations fail fast into the fallback
+            OLLAMA_BASE_URL = "http://127.0.0.1:9"
+
+        self.config = TestConfig
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_subsystems_are_lazy(self):
+        from app import create_app
+        flask_app = create_app(self.config)
+        services = flask_app.extensions['chatbot']
+        response = flask_app.test_client().get('/health')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(services.is_initialized("db"))
+        self.assertFalse(os.path.exists(self.config.SQLITE_DB))
+
+        services.init_all()
+        self.assertTrue(services.is_initialized("db"))
+        services.close()
+
+    def test_socket_turn_uses_app_config(self):
+        from app import create_app, socketio
+        flask_app = create_app(self.config)
+        client = socketio.test_client(flask_app)
+        self.assertTrue(client.is_connected())
+        welcome = client.get_received()
+        self.assertEqual(welcome[-1]["name"], "bot_response")
+
+        client.emit("user_message", {"message": "Hello there"})
+        replies = [event for event in client.get_received() if event["name"] == "bot_response"]
+        self.assertEqual(len(replies), 1)
+        self.assertTrue(replies[0]["args"][0]["message"])
+        client.disconnect()
+
+        services = flask_app.extensions['chatbot']
+        self.assertEqual(services.db.db_path, self.config.SQLITE_DB)
+        services.close()
+
+    def test_page_and_replies_use_app_config(self):
+        class Renamed(self.config):
+            BOT_NAME = "Nova"
+            OLLAMA_MODEL = "tiny-model"
+            TEMPERATURE = 0.2
+
+        from app import create_app, generate_reply, socketio
+        flask_app = create_app(Renamed)
+        services = flask_app.extensions['chatbot']
+        self.addCleanup(services.close)
+        self.assertIn("<h1>Nova</h1>", flask_app.test_client().get('/').get_data(as_text=True))
+        self.assertEqual(flask_app.test_client().get('/health').get_json()["model"], "tiny-model")
+        greeting = socketio.test_client(flask_app).get_received()[-1]["args"][0]["message"]
+        self.assertIn("I'm Nova.", greeting)
+
+        calls = []
+
+        class Router:
+            def chat(self, **kwargs):
+                calls.append(kwargs["options"])
+                return {"message": {"content": "hi"}}
+
+        services._instances["model_router"] = Router()
+        with flask_app.app_context():
+            generate_reply("system", "hello", {})
+        self.assertAlmostEqual(calls[0]["temperature"], 0.3)
+
+if __name__ == '__main__':
+    unittest.main()
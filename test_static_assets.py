@@ -0,0 +1,178 @@
+import gzip
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import unittest
+import load_test
+import static_assets
+from app_test_case import AppTestCase
+from static_assets import StaticAssets
+
+# Page-load budget of the chat page, as bytes of response bodies
+FIRST_VISIT_MAX_REQUESTS = 3
+FIRST_VISIT_MAX_BYTES = 28 * 1024
+REPEAT_VISIT_MAX_REQUESTS = 1
+REPEAT_VISIT_MAX_BYTES = 0
+
+class FakeConfig:
+    STATIC_FOLDER = None
+    STATIC_MAX_AGE = 3600
+
+class TestStaticAssets(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.write('app.css', 'body { color: #333; }\n' * 50)
+        self.write('tiny.js', 'x=1')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, text):
+        with open(os.path.join(self.folder, name), 'w') as f:
+            f.write(text)
+
+    def test_names_follow_the_content(self):
+        assets = StaticAssets(self.folder, config=FakeConfig)
+        url = assets.url('app.css')
+        self.assertRegex(url, r'^/static/app\.[0-9a-f]{12}\.css$')
+        self.assertEqual(assets.url('missing.css'), '/static/missing.css')
+        self.write('app.css', 'body { color: #000; }\n' * 50)
+        assets.build()
+        self.assertNotEqual(assets.url('app.css'), url)
+
+    def test_variants_are_built_once(self):
+        asset, immutable = StaticAssets(self.folder, config=FakeConfig).lookup('app.css')
+        self.assertFalse(immutable)
+        self.assertEqual(gzip.decompress(asset.variants['gzip']), asset.variants['identity'])
+        self.assertEqual(asset.negotiate({'gzip': 1, 'br': 0})[0], 'gzip')
+        self.assertEqual(asset.negotiate({'gzip': 0, 'br': 0})[0], 'identity')
+        if static_assets.brotli is not None:
+            self.assertEqual(asset.negotiate({'gzip': 1, 'br': 1})[0], 'br')
+        # Too small to be worth compressing
+        tiny, _ = StaticAssets(self.folder, config=FakeConfig).lookup('tiny.js')
+        self.assertEqual(list(tiny.variants), ['identity'])
+
+class Browser:
+    """Fetches the chat page and its assets the way a caching browser does"""
+
+    def __init__(self, client):
+        self.client = client
+        self.cache = {}
+
+    def get(self, url, log):
+        headers = {'Accept-Encoding': 'gzip, deflate, br'}
+        cached = self.cache.get(url)
+        if cached is not None:
+            if 'immutable' in cached.headers.get('Cache-Control', ''):
+                return cached
+            headers['If-None-Match'] = cached.headers['ETag']
+        response = self.client.get(url, headers=headers)
+        log.append((url, response.status_code, len(response.data)))
+        if response.status_code == 304:
+            return cached
+        self.cache[url] = response
+        return response
+
+    def visit(self):
+        log = []
+        page = self.get('/', log)
+        for url in re.findall(r'(?:href|src)="([^"]+)"', page.get_data(as_text=True)):
+            self.get(url, log)
+        return log
+
+class TestPageLoadBudget(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        from app import create_app
+        self.flask_app = create_app(load_test.load_test_config('http://127.0.0.1:9', self.tmpdir.name))
+
+    def tearDown(self):
+        self.flask_app.extensions['chatbot'].close()
+        self.tmpdir.cleanup()
+
+    def test_first_and_repeat_visit(self):
+        browser = Browser(self.flask_app.test_client())
+        first = browser.visit()
+        self.assertTrue(all(url.startswith('/') for url, _, _ in first), first)
+        self.assertEqual([status for _, status, _ in first], [200] * len(first))
+        self.assertLessEqual(len(first), FIRST_VISIT_MAX_REQUESTS)
+        self.assertLessEqual(sum(size for _, _, size in first), FIRST_VISIT_MAX_BYTES)
+
+        repeat = browser.visit()
+        self.assertEqual([(url, status) for url, status, _ in repeat], [('/', 304)])
+        self.assertLessEqual(len(repeat), REPEAT_VISIT_MAX_REQUESTS)
+        self.assertLessEqual(sum(size for _, _, size in repeat), REPEAT_VISIT_MAX_BYTES)
+
+    def test_asset_headers(self):
+        client = self.flask_app.test_client()
+        client.get('/')
+        url = self.flask_app.extensions['chatbot'].static_assets.url('style.css')
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        # Nothing that stops a shared cache from storing it
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertNotIn('Cookie', response.headers['Vary'])
+
+        revalidated = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        plain = client.get('/static/style.css')
+        self.assertEqual(plain.headers['Cache-Control'], 'no-cache')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(client.get('/static/../config.py').status_code, 404)
+
+def node_has_websocket():
+    node = shutil.which('node')
+    if node is None:
+        return False
+    result = subprocess.run([node, '--experimental-websocket', '-e', 'process.exit(typeof WebSocket === "function" ? 0 : 1)'],
+                            capture_output=True)
+    return result.returncode == 0
+
+# Loads the vendored client the way the page does and has one exchange with the app.
+# Node has no XMLHttpRequest, so it skips the polling transport the page starts on.
+NODE_CLIENT = """
+const [script, host] = process.argv.slice(-2);
+globalThis.location = { host: host, protocol: "http:" };
+const io = require(script);
+const socket = io({ auth: { protocol: 2 }, transports: ["websocket"] });
+const events = [];
+socket.on("connect", () => events.push("connect"));
+socket.on("bot_response", (data) => {
+  events.push(data);
+  if (!data.id) {
+    socket.emit("user_message", { message: "hello there", message_id: "m1" });
+  } else {
+    socket.disconnect();
+  }
+});
+socket.on("disconnect", () => {
+  console.log(JSON.stringify(events));
+  process.exit(0);
+});
+setTimeout(() => process.exit(1), 10000);
+"""
+
+@unittest.skipUnless(node_has_websocket(), "needs node with WebSocket support")
+class TestBundledSocketClient(AppTestCase):
+    serve = True
+
+    def test_chat_exchange(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'socket.io.min.js')
+        result = subprocess.run(['node', '--experimental-websocket', '--no-warnings', '-e', NODE_CLIENT,
+                                 script, self.url.split('://')[1]], capture_output=True, text=True, timeout=20)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        events = json.loads(result.stdout)
+        # The greeting is sent from the connect handler and may arrive first
+        self.assertIn('connect', events)
+        replies = [event for event in events if event != 'connect']
+        self.assertEqual(set(replies[0]), {'m', 't', 'e'})
+        self.assertEqual(replies[-1]['id'], 'm1')
+        self.assertTrue(replies[-1]['m'])
+
+if __name__ == '__main__':
+    unittest.main()
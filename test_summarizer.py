@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from admission import AdmissionController
+from config import Config
+from database import MemoryManager as DatabaseManager
+from memory_manager import MemoryManager as ChatMemoryManager
+from summarizer import DAILY, LONG_TERM, SESSION, LLMSummarizer, RollingSummarizer, summarize_exchanges
+
+class SmallTiers(Config):
+    SUMMARY_MAX_SESSIONS = 2
+    SUMMARY_MAX_DAILY = 2
+    SUMMARY_BATCH_WINDOW = 0.01
+
+def exchanges(topic_word, count=5, tone="friendly"):
+    return [
+        {"user_input": f"let's talk about {topic_word}", "bot_response": "ok", "emotional_context": {"tone": tone}}
+        for _ in range(count)
+    ]
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def chat(self, model, messages, options):
+        prompt = messages[0]["content"]
+        self.prompts.append(prompt)
+        lines = [line for line in prompt.splitlines() if line[:1].isdigit()]
+        return {"message": {"content": "\n".join(f"{i + 1}. Rewritten note {i + 1}" for i in range(len(lines)))}}
+
+class TestRollingSummarizer(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DatabaseManager(self.db_path)
+        self.summarizer = RollingSummarizer(self.db, config=SmallTiers)
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.remove(self.db_path)
+
+    def add_session(self, user_id, day, topic_word):
+        data = summarize_exchanges(exchanges(topic_word))
+        self.db.create_memory_summary(user_id, "session", tier=SESSION, summary_data=data)
+        self.db.conn.execute(
+            "UPDATE memory_summaries SET created_at = ? WHERE id = (SELECT MAX(id) FROM memory_summaries)",
+            (f"{day} 12:00:00",)
+        )
+        self.db.conn.commit()
+
+    def test_buffer_summarized_in_background(self):
+        memory_manager = ChatMemoryManager(self.db, summarizer=self.summarizer)
+        for _ in range(Config.MEMORY_SUMMARY_THRESHOLD):
+            memory_manager.update_conversation_buffer("u1", "I love this movie", "Me too!", {"tone": "playful"})
+        self.assertEqual(memory_manager.conversation_buffers["u1"], [])
+
+        self.summarizer.flush()
+        summaries = self.db.get_memory_summaries("u1", tier=SESSION)
+        self.assertEqual(len(summaries), 1)
+        self.assertIn("movies", summaries[0]["text"])
+        self.assertEqual(summaries[0]["data"]["exchanges"], Config.MEMORY_SUMMARY_THRESHOLD)
+
+    def test_tiers_stay_bounded_and_lose_nothing(self):
+        days = [f"2025-01-{day:02d}" for day in range(1, 11)]
+        for day in days:
+            for topic_word in ("music", "travel"):
+                self.add_session("u1", day, topic_word)
+                self.summarizer.compact("u1")
+
+        sessions = self.db.get_memory_summaries("u1", limit=None, tier=SESSION)
+        dailies = self.db.get_memory_summaries("u1", limit=None, tier=DAILY)
+        long_term = self.db.get_memory_summaries("u1", limit=None, tier=LONG_TERM)
+        self.assertLessEqual(len(sessions), SmallTiers.SUMMARY_MAX_SESSIONS)
+        self.assertLessEqual(len(dailies), SmallTiers.SUMMARY_MAX_DAILY)
+        self.assertEqual(len(long_term), 1)
+
+        total = sum(row["data"]["exchanges"] for row in sessions + dailies + long_term)
+        self.assertEqual(total, len(days) * 2 * 5)
+        self.assertIn("music", long_term[0]["text"])
+
+        # Context always reads one summary per tier, however long the history
+        self.assertEqual([row["tier"] for row in self.db.get_summary_set("u1")], [LONG_TERM, DAILY, SESSION])
+
+    def test_legacy_flat_rows_are_folded(self):
+        for day in ("2025-01-01", "2025-01-02", "2025-01-03"):
+            self.db.create_memory_summary("u2", "Conversation about work. Overall tone was professional. 5 exchanges.")
+            self.db.conn.execute(
+                "UPDATE memory_summaries SET created_at = ? WHERE id = (SELECT MAX(id) FROM memory_summaries)",
+                (f"{day} 09:00:00",)
+            )
+        self.db.conn.commit()
+        self.summarizer.compact("u2")
+        daily = self.db.get_memory_summaries("u2", tier=DAILY)[0]
+        self.assertEqual(daily["period"], "2025-01-01")
+        self.assertEqual(daily["data"]["topics"], {"work": 1})
+
+    def test_llm_rewrites_rollups_in_one_batch(self):
+        llm = FakeLLM()
+        summarizer = RollingSummarizer(self.db, llm=LLMSummarizer(llm, "tiny"), config=SmallTiers)
+        for day in ("2025-02-01", "2025-02-02", "2025-02-03"):
+            self.add_session("u3", day, "music")
+        summarizer.summarize_now("u3", exchanges("books"))
+
+        self.assertEqual(len(llm.prompts), 1)
+        daily = self.db.get_memory_summaries("u3", tier=DAILY)[0]
+        self.assertTrue(daily["text"].startswith("Rewritten note"))
+
+    def test_llm_rollups_hold_a_generation_slot(self):
+        controller = AdmissionController(max_inflight=1, max_queue=0, max_wait=0)
+        admitted = []
+
+        class ChatArrives(FakeLLM):
+            def chat(self, model, messages, options):
+                # A turn arriving mid-rollup must not exceed the cap
+                admitted.append(controller.acquire())
+                return FakeLLM.chat(self, model, messages, options)
+
+        llm = LLMSummarizer(ChatArrives(), "tiny", admission_controller=controller)
+        self.assertEqual(llm.summarize_batch(["note"]), ["Rewritten note 1"])
+        self.assertEqual(admitted, [False])
+        self.assertEqual(controller.stats()["inflight"], 0)
+
+        # Busy model: the rollup keeps its plain text
+        self.assertTrue(controller.acquire())
+        self.assertEqual(llm.summarize_batch(["note"]), [None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import stat
+import threading
+import unittest
+import load_test
+import replay
+from app_test_case import AppTestCase
+from config import Config
+from traffic_capture import TrafficRecorder, load_trace
+
+class TestTrafficRecorder(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "capture.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_events_are_written_in_the_background(self):
+        recorder = TrafficRecorder(self.path, hash_pii=False, salt="s")
+        recorder.record("connect", "alice", latency_ms=1.5)
+        recorder.record("user_message", "alice", message="hello", ts=1000.0, tone="friendly")
+        recorder.close()
+        events = load_trace(self.path)
+        self.assertEqual([e["event"] for e in events], ["user_message", "connect"])
+        self.assertEqual(events[0]["message"], "hello")
+        self.assertEqual(events[0]["tone"], "friendly")
+        self.assertEqual(recorder.stats()["written"], 2)
+        # Closed recorders ignore late events
+        self.assertFalse(recorder.record("connect", "bob"))
+
+    def test_pii_is_hashed_but_stable(self):
+        recorder = TrafficRecorder(self.path, hash_pii=True, salt="s")
+        recorder.record("user_message", "alice", message="my name is Alice")
+        recorder.record("user_message", "alice", message="my name is Alice")
+        recorder.close()
+        with open(self.path) as f:
+            raw = f.read()
+        self.assertNotIn("alice", raw.lower())
+        first, second = load_trace(self.path)
+        self.assertEqual(first["user"], second["user"])
+        self.assertEqual(first["message_sha"], second["message_sha"])
+        self.assertEqual(first["message_len"], len("my name is Alice"))
+        other = TrafficRecorder(self.path, hash_pii=True, salt="other")
+        self.assertNotEqual(other._digest("alice"), first["user"])
+
+    def test_generated_salt_is_kept_with_the_capture(self):
+        recorder = TrafficRecorder(self.path, hash_pii=True)
+        salt_path = self.path + ".salt"
+        self.assertEqual(stat.S_IMODE(os.stat(salt_path).st_mode), 0o600)
+        # The same salt after a restart, and never the session secret
+        again = TrafficRecorder(self.path, hash_pii=True)
+        self.assertEqual(again._digest("alice"), recorder._digest("alice"))
+        session_keyed = TrafficRecorder(self.path, hash_pii=True, salt=Config.FLASK_SECRET_KEY)
+        self.assertNotEqual(session_keyed._digest("alice"), recorder._digest("alice"))
+        # Nothing to key without hashing
+        TrafficRecorder(os.path.join(self.tmpdir.name, "plain.jsonl"), hash_pii=False)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "plain.jsonl.salt")))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        recorder = TrafficRecorder(self.path, hash_pii=False, salt="s", queue_size=2)
+        # Hold the writer off so the queue cannot drain
+        recorder._thread = threading.current_thread()
+        results = [recorder.record("connect", f"user-{i}") for i in range(5)]
+        self.assertEqual(results, [True, True, False, False, False])
+        self.assertEqual(recorder.stats()["dropped"], 3)
+
+    def test_unreadable_lines_are_skipped(self):
+        with open(self.path, "w") as f:
+            f.write('{"v":1,"ts":2,"event":"user_message","user":"a"}\n')
+            f.write('{"v":1,"ts":1,"ev\n')
+            f.write('{"v":1,"event":"connect"}\n')
+            f.write('\n{"v":1,"ts":1,"event":"connect","user":"a"}\n')
+        self.assertEqual([e["event"] for e in load_trace(self.path)], ["connect", "user_message"])
+
+class TestReplayScheduling(unittest.TestCase):
+    def test_filler_matches_captured_length(self):
+        for length in (1, 7, 40, 300):
+            text = replay.filler_message("abc", length)
+            self.assertEqual(len(text), length)
+            self.assertEqual(text, replay.filler_message("abc", length))
+
+    def test_events_are_grouped_per_user_in_order(self):
+        events = [
+            {"ts": 1, "event": "connect", "user": "a"},
+            {"ts": 2, "event": "user_message", "user": "a", "message": "one"},
+            {"ts": 3, "event": "user_message", "user": "b", "message_sha": "x", "message_len": 5},
+            {"ts": 4, "event": "request_topic", "user": "a"}
+        ]
+        users = replay.group_by_user(events)
+        self.assertEqual(list(users), ["a", "b"])
+        self.assertEqual([e["ts"] for e in users["a"]], [2, 4])
+        self.assertEqual(replay.event_payload(users["a"][0]), {"message": "one"})
+        self.assertIsNone(replay.event_payload(users["a"][1]))
+        self.assertEqual(len(replay.event_payload(users["b"][0])["message"]), 5)
+
+    def test_speed_scales_the_schedule(self):
+        events = [{"ts": 100.0, "event": "user_message", "user": "a"}, {"ts": 110.0, "event": "user_message", "user": "a"}]
+        run = replay.Replay("http://unused", events, speed=10)
+        run.wall_start = 0.0
+        self.assertEqual([run.due(e) for e in events], [0.0, 1.0])
+        run.speed = replay.parse_speed("max")
+        self.assertEqual(run.due(events[1]), 0.0)
+
+@unittest.skipIf(load_test.socketio is None, "python-socketio client not installed")
+class TestCaptureAndReplay(AppTestCase):
+    fake_ollama = dict(prompt_eval_ms=5, token_ms=1, tokens=10, seed=3)
+    serve = True
+
+    def configure(self, config):
+        self.path = os.path.join(self.tmpdir.name, "capture.jsonl")
+
+        class CaptureConfig(config):
+            TRAFFIC_CAPTURE = True
+            TRAFFIC_CAPTURE_PATH = self.path
+            TRAFFIC_CAPTURE_HASH_PII = True
+        return CaptureConfig
+
+    def test_captured_traffic_replays_turn_for_turn(self):
+        summary = load_test.run_swarm(self.url, sessions=3, messages=2, think_time=0, turn_timeout=10, seed=5)
+        self.assertEqual(summary["turns"], 6)
+        self.services.traffic_recorder.flush()
+
+        events = load_trace(self.path)
+        messages = [e for e in events if e["event"] == "user_message"]
+        self.assertEqual(len(messages), 6)
+        self.assertEqual(len({e["user"] for e in messages}), 3)
+        for entry in messages:
+            self.assertNotIn("message", entry)
+            self.assertEqual(entry["outcome"], "reply")
+            self.assertIn("tone", entry)
+            self.assertGreater(entry["prompt_chars"], 0)
+            self.assertGreater(entry["latency_ms"], 0)
+
+        # The replay itself is not captured
+        self.services.config.TRAFFIC_CAPTURE = False
+        requests_before = self.fake.behaviour.stats()["requests"]
+        result = replay.Replay(self.url, events, speed=replay.parse_speed("max"), turn_timeout=10).run()
+        self.assertEqual(result["sessions_failed"], 0, result["errors"])
+        self.assertEqual(result["turns"], 6)
+        self.assertEqual(result["replay"]["users"], 3)
+        self.assertEqual(result["replay"]["captured_turn_latency"]["count"], 6)
+        self.assertGreaterEqual(self.fake.behaviour.stats()["requests"] - requests_before, 6)
+        json.dumps(result)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import unittest
+from app_test_case import AppTestCase
+from wire_protocol import COMPACT, LEGACY, MeasuredJSON, WireProtocol, wire_stats
+
+REPLY = {
+    'message': "That sounds lovely! What do you enjoy most about it?",
+    'emotional_context': {
+        'tone': 'curious',
+        'emotion_scores': {'happiness': 0.5, 'sadness': 0.2, 'excitement': 0.4, 'calmness': 0.6, 'curiosity': 0.88, 'empathy': 0.8},
+        'response_opener': "I'm curious to know more about",
+        'emotional_markers': '🤔 💖',
+        'should_show_empathy': False,
+        'is_excited': False,
+        'is_curious': True,
+        'is_playful': False
+    },
+    'message_id': 'm1'
+}
+
+class TestWireProtocol(unittest.TestCase):
+    def test_negotiation(self):
+        self.assertEqual(WireProtocol.negotiate(None).version, LEGACY)
+        self.assertEqual(WireProtocol.negotiate({}, default=COMPACT).version, COMPACT)
+        self.assertEqual(WireProtocol.negotiate({"protocol": 2}).version, COMPACT)
+        # A newer client talking to an older server gets the newest we have
+        self.assertEqual(WireProtocol.negotiate({"protocol": 7}).version, COMPACT)
+        self.assertEqual(WireProtocol.negotiate({"protocol": "x"}).version, LEGACY)
+        self.assertTrue(WireProtocol.negotiate({"protocol": 2, "details": True}).details)
+
+    def test_compact_reply_keeps_what_the_page_renders(self):
+        compact = WireProtocol(COMPACT).encode('bot_response', REPLY)
+        self.assertEqual(compact, {'m': REPLY['message'], 't': 5, 'e': '🤔 💖', 'id': 'm1'})
+        legacy_size = len(json.dumps(['bot_response', REPLY]))
+        self.assertLess(len(json.dumps(['bot_response', compact])), legacy_size / 2)
+
+        detailed = WireProtocol(COMPACT, details=True).encode('bot_response', REPLY)
+        self.assertEqual(detailed['ec'], REPLY['emotional_context'])
+        self.assertIs(WireProtocol(LEGACY).encode('bot_response', REPLY), REPLY)
+
+    def test_other_events(self):
+        protocol = WireProtocol(COMPACT)
+        self.assertEqual(protocol.encode('bot_token', {'message_id': None, 'offset': 3, 'token': ' hi'}), {'m': ' hi', 'o': 3})
+        self.assertEqual(protocol.encode('generation_cancelled', {'reason': 'superseded', 'message_id': 'm1'}),
+                         {'r': 'superseded', 'id': 'm1'})
+        self.assertEqual(protocol.encode('bot_reset', {'message_id': 'm1'}), {'id': 'm1'})
+        self.assertEqual(protocol.encode('custom', {'a': 1}), {'a': 1})
+
+    def test_measured_json_records_event_packets(self):
+        wire_stats.reset()
+        encoded = MeasuredJSON.dumps(['bot_response', {'m': 'hi'}], separators=(',', ':'))
+        MeasuredJSON.dumps({'sid': 'engine.io handshake'})
+        self.assertEqual(MeasuredJSON.loads(encoded), ['bot_response', {'m': 'hi'}])
+        events = wire_stats.stats()["events"]
+        self.assertEqual(list(events), ['bot_response'])
+        self.assertEqual(events['bot_response']['bytes'], len(encoded))
+
+class TestNegotiatedConnections(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        wire_stats.reset()
+
+    def chat(self, auth):
+        from app import socketio
+        client = socketio.test_client(self.flask_app, auth=auth)
+        greeting = client.get_received()[0]['args'][0]
+        client.emit('user_message', {'message': 'how was your weekend?', 'message_id': 'm1'})
+        received = client.get_received()
+        return greeting, received
+
+    def test_compact_client(self):
+        greeting, received = self.chat({"protocol": 2})
+        self.assertEqual(set(greeting), {'m', 't', 'e'})
+        tokens = [event['args'][0] for event in received if event['name'] == 'bot_token']
+        reply = received[-1]['args'][0]
+        self.assertEqual(set(tokens[0]), {'m', 'o', 'id'})
+        self.assertEqual(set(reply), {'m', 't', 'e', 'id'})
+        self.assertEqual("".join(token['m'] for token in tokens).strip(), reply['m'])
+
+    def test_legacy_client_is_unchanged(self):
+        greeting, received = self.chat(None)
+        self.assertIn('emotional_context', greeting)
+        self.assertEqual(received[-1]['args'][0]['message_id'], 'm1')
+        self.assertIn('emotional_context', received[-1]['args'][0])
+
+    def test_metrics_report_serialization_cost(self):
+        self.chat({"protocol": 2})
+        wire = self.flask_app.test_client().get('/metrics').get_json()["wire"]
+        self.assertEqual(wire["connections_by_protocol"], {str(COMPACT): 1})
+        for event in ('bot_response', 'bot_token'):
+            self.assertGreater(wire["events"][event]["packets"], 0)
+            self.assertGreater(wire["events"][event]["avg_encode_us"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
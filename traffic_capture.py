@@ -0,0 +1,151 @@
+import hashlib
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+class TrafficRecorder:
+    """Append inbound Socket.IO events to a JSON-lines capture file.
+
+    record() only builds a dict and puts it on a bounded queue, so the
+    request path never waits for disk; a background thread writes batches.
+    If the writer falls behind and the queue fills up, events are dropped
+    and counted rather than slowing down chat.
+
+    With hash_pii, user ids are replaced by a keyed hash (stable across
+    restarts for the same salt, so per-user ordering survives) and message
+    text by its hash and length; replay.py substitutes filler text of the
+    same length. Without a configured salt one is generated and kept in
+    `<path>.salt`, readable only by its owner.
+    """
+
+    def __init__(self, path=None, hash_pii=None, salt=None, queue_size=None, config=Config):
+        self.path = path or config.TRAFFIC_CAPTURE_PATH
+        self.hash_pii = config.TRAFFIC_CAPTURE_HASH_PII if hash_pii is None else hash_pii
+        self._salt = None
+        if self.hash_pii:
+            self._salt = (salt or config.TRAFFIC_CAPTURE_SALT or self._stored_salt()).encode("utf-8")
+        self._queue = queue.Queue(maxsize=queue_size or config.TRAFFIC_CAPTURE_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.counters = {"recorded": 0, "written": 0, "dropped": 0}
+
+    def _stored_salt(self):
+        salt_path = f"{self.path}.salt"
+        try:
+            fd = os.open(salt_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(salt_path, encoding="utf-8") as f:
+                return f.read().strip()
+        salt = secrets.token_hex(32)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(salt + "\n")
+        logger.info(f"Generated traffic capture salt in {salt_path}")
+        return salt
+
+    def _digest(self, value):
+        return hmac.new(self._salt, value.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def record(self, event, user_id, message=None, ts=None, **fields):
+        """Queue one event arriving at `ts` (default now); never blocks"""
+        if self._closed:
+            return False
+        entry = {"v": FORMAT_VERSION, "ts": round(time.time() if ts is None else ts, 6), "event": event}
+        entry["user"] = self._digest(user_id) if self.hash_pii and user_id else user_id
+        if message is not None:
+            if self.hash_pii:
+                entry["message_sha"] = self._digest(message)
+                entry["message_len"] = len(message)
+            else:
+                entry["message"] = message
+        entry.update(fields)
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.counters["dropped"] += 1
+            return False
+        with self._lock:
+            self.counters["recorded"] += 1
+        return True
+
+    def _ensure_writer(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._write_loop, name="traffic-capture", daemon=True)
+                    self._thread.start()
+
+    def _write_loop(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                entry = self._queue.get()
+                batch = [entry]
+                # Drain whatever else is waiting into the same write
+                while len(batch) < 1000:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = None in batch
+                lines = [json.dumps(item, separators=(",", ":")) + "\n" for item in batch if item is not None]
+                try:
+                    f.writelines(lines)
+                    f.flush()
+                    with self._lock:
+                        self.counters["written"] += len(lines)
+                except Exception as e:
+                    logger.error(f"Error writing traffic capture: {e}")
+                for _ in batch:
+                    self._queue.task_done()
+                if stop:
+                    return
+
+    def flush(self):
+        """Block until every queued event is on disk"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, queued=self._queue.qsize(), path=self.path, hash_pii=self.hash_pii)
+
+def load_trace(path):
+    """Events of a capture file in timestamp order; unreadable lines are skipped"""
+    events = []
+    skipped = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                entry["ts"] = float(entry["ts"])
+                entry["event"]
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            events.append(entry)
+    if skipped:
+        logger.warning(f"Skipped {skipped} unreadable lines in {path}")
+    # Stable sort: events with equal timestamps keep file order
+    events.sort(key=lambda entry: entry["ts"])
+    return events
@@ -0,0 +1,72 @@
+import threading
+from contextlib import contextmanager
+
+class _UserSlot:
+    """Ticket queue for a single user"""
+    __slots__ = ("condition", "next_ticket", "now_serving", "owner", "depth", "pending")
+
+    def __init__(self, lock):
+        # Every slot shares the table lock so ticket hand-off and slot removal
+        # can never race each other
+        self.condition = threading.Condition(lock)
+        self.next_ticket = 0
+        self.now_serving = 0
+        self.owner = None
+        self.depth = 0
+        self.pending = 0
+
+class UserSerializer:
+    """Run work for the same user one at a time, in arrival order.
+
+    Each user gets a FIFO ticket queue, so two messages from the same user
+    (fast double-send, two tabs) are processed strictly in the order they
+    arrived while different users never wait on each other. Slots are
+    created on demand and dropped as soon as the user goes idle, so memory
+    stays proportional to the number of users with work in flight.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    @contextmanager
+    def serialize(self, user_id):
+        """Hold the user's turn for the duration of the block (reentrant per thread)"""
+        me = threading.get_ident()
+        with self._lock:
+            slot = self._slots.get(user_id)
+            if slot is None:
+                slot = self._slots[user_id] = _UserSlot(self._lock)
+
+            if slot.owner == me:
+                # Nested call from the thread already holding this user's turn
+                slot.depth += 1
+                reentrant = True
+            else:
+                reentrant = False
+                ticket = slot.next_ticket
+                slot.next_ticket += 1
+                slot.pending += 1
+                while slot.now_serving != ticket:
+                    slot.condition.wait()
+                slot.owner = me
+                slot.depth = 1
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                slot.depth -= 1
+                if not reentrant:
+                    slot.owner = None
+                    slot.now_serving += 1
+                    slot.pending -= 1
+                    if slot.pending:
+                        slot.condition.notify_all()
+                    elif self._slots.get(user_id) is slot:
+                        del self._slots[user_id]
+
+    def active_users(self):
+        """Number of users with work queued or running"""
+        with self._lock:
+            return len(self._slots)
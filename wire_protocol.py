@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+import logging
+from emotion_codec import TONE_CODES
+
+logger = logging.getLogger(__name__)
+
+LEGACY = 1
+COMPACT = 2
+SUPPORTED = (LEGACY, COMPACT)
+
+def _with_id(compact, payload):
+    if payload.get('message_id') is not None:
+        compact['id'] = payload['message_id']
+    return compact
+
+def _compact_reply(payload, details):
+    context = payload.get('emotional_context') or {}
+    compact = {'m': payload['message'], 't': TONE_CODES.get(context.get('tone'), 0), 'e': context.get('emotional_markers', '')}
+    if details:
+        compact['ec'] = context
+    return _with_id(compact, payload)
+
+def _compact_token(payload, details):
+    return _with_id({'m': payload['token'], 'o': payload['offset']}, payload)
+
+def _compact_reset(payload, details):
+    return _with_id({}, payload)
+
+def _compact_cancelled(payload, details):
+    return _with_id({'r': payload['reason']}, payload)
+
+COMPACT_ENCODERS = {
+    'bot_response': _compact_reply,
+    'bot_token': _compact_token,
+    'bot_reset': _compact_reset,
+    'generation_cancelled': _compact_cancelled
+}
+
+class WireProtocol:
+    """Socket.IO payload format, negotiated per connection.
+
+    Clients pick a protocol in the Socket.IO auth data when they connect:
+    {"protocol": 2, "details": false}. Without it they get LEGACY.
+
+    LEGACY (1): payloads as the handlers build them, e.g. bot_response
+    carries the whole emotional_context dict.
+
+    COMPACT (2): short keys, and only what the chat page renders:
+      bot_response          {"m": text, "t": tone code, "e": markers, "id": message id}
+      bot_token             {"m": text, "o": offset, "id": message id}
+      bot_reset             {"id": message id}  (drop the streamed text, tokens restart at offset 0)
+      generation_cancelled  {"r": reason, "id": message id}
+    "id" is left out when the message had no client id. With details the
+    full emotional_context is added to bot_response as "ec". Tone codes are
+    emotion_codec.TONE_CODES (0 = unknown).
+
+    Compression is left to the transport: websocket connections negotiate
+    permessage-deflate, long-polling responses are compressed by Engine.IO
+    above SOCKETIO_COMPRESSION_THRESHOLD bytes.
+    """
+
+    def __init__(self, version=LEGACY, details=False):
+        self.version = version
+        self.details = details
+
+    @classmethod
+    def negotiate(cls, auth, default=LEGACY):
+        """Protocol for a connect's auth data; unknown versions fall back to the newest supported one below"""
+        if not isinstance(auth, dict) or 'protocol' not in auth:
+            return cls(default)
+        try:
+            requested = int(auth['protocol'])
+        except (TypeError, ValueError):
+            return cls(default)
+        usable = [version for version in SUPPORTED if version <= requested]
+        return cls(max(usable) if usable else LEGACY, bool(auth.get('details', False)))
+
+    def encode(self, event, payload):
+        if self.version == LEGACY:
+            return payload
+        encoder = COMPACT_ENCODERS.get(event)
+        return encoder(payload, self.details) if encoder else payload
+
+class WireStats:
+    """Packets, bytes and JSON encode time per Socket.IO event"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+        self._connections = {}
+
+    def record(self, event, size, seconds):
+        with self._lock:
+            stats = self._events.get(event)
+            if stats is None:
+                stats = self._events[event] = {"packets": 0, "bytes": 0, "encode_seconds": 0.0}
+            stats["packets"] += 1
+            stats["bytes"] += size
+            stats["encode_seconds"] += seconds
+
+    def connected(self, protocol):
+        with self._lock:
+            self._connections[protocol.version] = self._connections.get(protocol.version, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._events.clear()
+            self._connections.clear()
+
+    def stats(self):
+        with self._lock:
+            events = {
+                event: {
+                    "packets": stats["packets"],
+                    "bytes": stats["bytes"],
+                    "avg_bytes": round(stats["bytes"] / stats["packets"], 1),
+                    "avg_encode_us": round(stats["encode_seconds"] / stats["packets"] * 1e6, 2)
+                }
+                for event, stats in self._events.items()
+            }
+            return {"events": events, "connections_by_protocol": dict(self._connections)}
+
+wire_stats = WireStats()
+
+class MeasuredJSON:
+    """json module for Socket.IO that records the cost of every event packet.
+
+    Socket.IO encodes an event as the JSON list [event, *args], so timing
+    dumps() here measures exactly the serialization work done per event.
+    """
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        start = time.perf_counter()
+        encoded = json.dumps(obj, *args, **kwargs)
+        if isinstance(obj, list) and obj and isinstance(obj[0], str):
+            wire_stats.record(obj[0], len(encoded), time.perf_counter() - start)
+        return encoded
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return json.loads(s, *args, **kwargs)